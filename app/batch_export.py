@@ -0,0 +1,361 @@
+"""
+Offline export of whole projects, straight from the database.
+
+Used by `python -m app.cli export` (and the project ZIP endpoint) to
+regenerate exports without going through the document API:
+
+- documents are streamed from the database in batches (yield_per), so
+  memory stays flat however large the project;
+- each document's content hash, the project's style hash and the
+  renderer version are compared with the manifest left by the previous
+  run (app/manifest.py); only documents whose inputs changed are
+  rendered again, the other files are reused as they are, and files of
+  deleted documents are removed;
+- rendering runs across a process pool; workers write their file
+  directly, so only a byte count comes back to the parent;
+- each project's tree is exported under an exclusive lock
+  (<out>/<project id>.lock), so concurrent exports of one project - API
+  requests, worker processes, the CLI - run one after another instead
+  of overwriting each other's manifest.
+
+Formats:
+
+- html: <out>/<project id>/<document id>.html, manifest.json
+- zip:  the html tree, packed into <out>/<project id>.zip; the archive
+        itself is reused when no document changed
+- pdf:  <out>/<project id>/<document id>.pdf, manifest.pdf.json; needs
+        the optional weasyprint package
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+try:
+    import weasyprint
+except ImportError:  # PDF export is optional
+    weasyprint = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: exports lock per process only
+    fcntl = None
+
+from .db import get_session
+from .footnotes import Notes, document_notes
+from .layout import Links, render_document_to_html
+from .manifest import REASON_FORCED, ExportManifest, content_hash, write_atomic
+from .models import DocumentModel, ProjectModel
+from .references import document_links
+from .schemas import Document
+from .styles import CompiledStyles, get_project_styles
+
+# Rows fetched per round trip to the database.
+BATCH_SIZE = 200
+
+# Where the API keeps its export trees between requests.
+EXPORT_DIR = os.environ.get("TORAH_LAYOUT_EXPORT_DIR", "./exports")
+
+FORMATS = ("html", "zip", "pdf")
+
+# format -> (file extension, manifest name); zip packs the html files.
+_ARTIFACTS = {
+    "html": (".html", "manifest.json"),
+    "zip": (".html", "manifest.json"),
+    "pdf": (".pdf", "manifest.pdf.json"),
+}
+
+# (document fields, styles, citation links, footnotes, output path, format)
+RenderTask = Tuple[Dict[str, Any], CompiledStyles, Links, Notes, str, str]
+
+
+@dataclass
+class ExportStats:
+    documents: int = 0
+    rendered: int = 0
+    skipped: int = 0
+    bytes_written: int = 0
+    seconds: float = 0.0
+    # (project id, document id, reason) for every rendered document
+    rebuilt: List[Tuple[str, str, str]] = field(default_factory=list)
+    # (project id, document id) of files removed with their document
+    removed: List[Tuple[str, str]] = field(default_factory=list)
+    # paths of the archives written (zip format only)
+    archives: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        rate = self.documents / self.seconds if self.seconds else 0.0
+        mb_rate = self.bytes_written / 1e6 / self.seconds if self.seconds else 0.0
+        return (
+            f"{self.documents} documents in {self.seconds:.2f}s "
+            f"({rate:.0f} docs/s): {self.rendered} rendered, "
+            f"{self.skipped} unchanged, {len(self.removed)} removed; "
+            f"{self.bytes_written / 1e6:.1f} MB written ({mb_rate:.1f} MB/s)"
+        )
+
+    def report(self) -> List[str]:
+        """
+        What was rebuilt and why, one line each, after a count per reason.
+        """
+        reasons = Counter(reason for _, _, reason in self.rebuilt)
+        lines = [f"{count} {reason}" for reason, count in sorted(reasons.items())]
+        lines += [
+            f"rendered {project_id}/{document_id} ({reason})"
+            for project_id, document_id, reason in self.rebuilt
+        ]
+        lines += [f"removed {project_id}/{document_id}" for project_id, document_id in self.removed]
+        lines += [f"archive {path}" for path in self.archives]
+        return lines
+
+
+def render_to_file(task: RenderTask) -> int:
+    """
+    Render one document and write it. Module-level so it can run in a
+    worker process. Returns the bytes written.
+    """
+    fields, styles, links, notes, path, fmt = task
+    html = render_document_to_html(Document.model_validate(fields), styles, links, notes)
+    if fmt == "pdf":
+        data = weasyprint.HTML(string=html).write_pdf()
+    else:
+        data = html.encode("utf-8")
+    write_atomic(path, data)
+    return len(data)
+
+
+class _Progress:
+    """
+    One-line progress bar on a terminal; silent otherwise.
+    """
+
+    WIDTH = 30
+
+    def __init__(self, total: int, stream: Optional[TextIO]) -> None:
+        self.total = total
+        self.stream = stream if stream is not None and stream.isatty() else None
+        self.start = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, done: int) -> None:
+        if self.stream is None:
+            return
+        now = time.perf_counter()
+        if now - self._last < 0.1 and done < self.total:
+            return
+        self._last = now
+        filled = self.WIDTH * done // self.total if self.total else self.WIDTH
+        rate = done / (now - self.start) if now > self.start else 0.0
+        self.stream.write(
+            f"\r[{'#' * filled}{'.' * (self.WIDTH - filled)}] "
+            f"{done}/{self.total} {rate:.0f} docs/s"
+        )
+        self.stream.flush()
+
+    def close(self) -> None:
+        if self.stream is not None:
+            self.stream.write("\n")
+
+
+def _document_fields(doc: DocumentModel) -> Dict[str, Any]:
+    return {
+        "id": doc.id,
+        "project_id": doc.project_id,
+        "title": doc.title,
+        "description": doc.description,
+        "blocks": doc.get_block_dicts(),
+    }
+
+
+def archive_path(out_dir: str, project_id: str) -> str:
+    return os.path.join(out_dir, f"{project_id}.zip")
+
+
+_thread_locks: Dict[str, Lock] = {}
+_thread_locks_guard = Lock()
+
+
+@contextmanager
+def project_lock(out_dir: str, project_id: str) -> Iterator[None]:
+    """
+    Hold the exclusive lock on a project's export tree: its files,
+    manifest and archive. flock excludes other threads as well as other
+    processes, since each holder opens the lock file itself.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{project_id}.lock")
+    if fcntl is None:
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(os.path.abspath(path), Lock())
+        with lock:
+            yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_archive(manifest: ExportManifest, project_id: str, path: str) -> int:
+    """
+    Pack the project's exported files into one ZIP, in document order.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as archive:
+            for _, file in manifest.files():
+                archive.write(os.path.join(manifest.directory, file), f"{project_id}/{file}")
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return os.path.getsize(path)
+
+
+def _export_project(
+    session: Session,
+    project: ProjectModel,
+    out_dir: str,
+    fmt: str,
+    pool: Optional[Executor],
+    max_pending: int,
+    batch_size: int,
+    force: bool,
+    stats: ExportStats,
+    progress: _Progress,
+) -> None:
+    extension, manifest_name = _ARTIFACTS[fmt]
+    directory = os.path.join(out_dir, project.id)
+    os.makedirs(directory, exist_ok=True)
+    manifest = ExportManifest.load(directory, manifest_name)
+    styles = get_project_styles(session, project.id)
+    href = lambda target: f"{target}{extension}"  # noqa: E731 - links stay inside the tree
+
+    rebuilt_before = len(stats.rebuilt)
+    seen: List[str] = []
+    pending: Dict[Future, Tuple[str, str, str]] = {}  # -> (doc id, content, file)
+
+    def finished(document_id: str, content: str, file: str, written: int) -> None:
+        stats.bytes_written += written
+        stats.rendered += 1
+        manifest.record(document_id, content, styles.hash, file)
+        progress.update(stats.documents)
+
+    def collect(done: Iterable[Future]) -> None:
+        for future in done:
+            finished(*pending.pop(future), future.result())
+
+    query = (
+        select(DocumentModel)
+        .where(DocumentModel.project_id == project.id)
+        .order_by(DocumentModel.id)
+        .execution_options(yield_per=batch_size)
+    )
+    try:
+        for batch in session.exec(query).partitions(batch_size):
+            for doc in batch:
+                stats.documents += 1
+                seen.append(doc.id)
+                links = document_links(session, doc, href)
+                notes = document_notes(session, doc.id)
+                content = content_hash(doc, links, notes)
+                reason = REASON_FORCED if force else manifest.stale_reason(
+                    doc.id, content, styles.hash
+                )
+                if reason is None:
+                    stats.skipped += 1
+                    progress.update(stats.documents)
+                    continue
+
+                stats.rebuilt.append((project.id, doc.id, reason))
+                file = f"{doc.id}{extension}"
+                task = (_document_fields(doc), styles, links, notes,
+                        os.path.join(directory, file), fmt)
+                if pool is None:
+                    finished(doc.id, content, file, render_to_file(task))
+                    continue
+
+                pending[pool.submit(render_to_file, task)] = (doc.id, content, file)
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+        collect(wait(pending)[0])
+        stats.removed += [(project.id, doc_id) for doc_id in manifest.prune(seen)]
+    finally:
+        manifest.save()
+
+    if fmt == "zip":
+        path = archive_path(out_dir, project.id)
+        changed = len(stats.rebuilt) > rebuilt_before or any(
+            project_id == project.id for project_id, _ in stats.removed
+        )
+        if changed or not os.path.exists(path):
+            stats.bytes_written += _write_archive(manifest, project.id, path)
+            stats.archives.append(path)
+
+
+def export_projects(
+    out_dir: str,
+    project_ids: Optional[Sequence[str]] = None,
+    fmt: str = "html",
+    workers: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+    force: bool = False,
+    progress_stream: Optional[TextIO] = sys.stderr,
+) -> ExportStats:
+    """
+    Export every document of the given projects (default: all) under
+    out_dir, re-rendering only documents changed since the last export.
+    workers: process pool size; defaults to the CPU count, 1 renders in
+    this process. force: ignore the manifests.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    if fmt == "pdf" and weasyprint is None:
+        raise RuntimeError("PDF export needs the optional 'weasyprint' package")
+
+    start = time.perf_counter()
+    stats = ExportStats()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+
+    with get_session() as session:
+        projects = select(ProjectModel).order_by(ProjectModel.id)
+        counted = select(func.count()).select_from(DocumentModel)
+        if project_ids is not None:
+            projects = projects.where(ProjectModel.id.in_(project_ids))
+            counted = counted.where(DocumentModel.project_id.in_(project_ids))
+        total = session.exec(counted).one()
+        progress = _Progress(total, progress_stream)
+
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and total else None
+        try:
+            for project in session.exec(projects).all():
+                with project_lock(out_dir, project.id):
+                    _export_project(
+                        session, project, out_dir, fmt, pool, workers * 4, batch_size,
+                        force, stats, progress,
+                    )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            progress.close()
+
+    stats.seconds = time.perf_counter() - start
+    return stats
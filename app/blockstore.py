@@ -0,0 +1,143 @@
+"""
+Content addressing for blocks.
+
+Every block is identified by a hash of its content (kind, role and
+payload), so a paragraph that appears verbatim in many documents - the
+Kiddush, Hallel, recurring brachot - is stored once in `block_contents`
+and every cache keyed on the hash (decoded blocks here, rendered
+fragments in app/layout.py) hits across documents and projects.
+
+A document's block list is then just the ordered digests, packed as
+
+    b"TLH1" | digest (16 bytes) per block
+
+and stored in `block_lists` like any other shared list.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Generic, List, Mapping, Optional, Sequence, Tuple, TypeVar
+
+HASH_LIST_MAGIC = b"TLH1"
+DIGEST_SIZE = 16
+
+# Characters that take no glyph of their own: whitespace, combining
+# diacritics, Hebrew points and cantillation, bidi and zero-width marks.
+_NON_GLYPH_RE = re.compile(
+    r"[\s\u0300-\u036f\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7"
+    r"\u200b-\u200f\u202a-\u202e\u2066-\u2069]"
+)
+
+_V = TypeVar("_V")
+
+
+def content_hash(fields: Sequence[Optional[str]]) -> str:
+    """
+    blake2b-128 (hex) of a block's identifying fields, in block_hash order.
+    """
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for value in fields:
+        # \x00 marks None, \x1f separates fields; neither occurs in text
+        h.update(b"\x00" if value is None else value.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def block_hash(block: Mapping[str, Any]) -> str:
+    """
+    Hash of a block dict (as produced by `Block.model_dump()`).
+    """
+    if block["kind"] == "text":
+        return content_hash(("text", block["role"], block.get("text") or ""))
+    return content_hash(
+        (
+            block["kind"],
+            block["role"],
+            block["src"],
+            block.get("alt_text"),
+            block.get("alignment"),
+        )
+    )
+
+
+def payload_size(block: Mapping[str, Any]) -> int:
+    """
+    UTF-8 bytes of a block's text, or src + alt text (as in outlines).
+    """
+    if block["kind"] == "text":
+        return len((block.get("text") or "").encode("utf-8"))
+    size = len(block["src"].encode("utf-8"))
+    return size + len((block.get("alt_text") or "").encode("utf-8"))
+
+
+def text_measure(block: Mapping[str, Any]) -> Tuple[int, int]:
+    """
+    (glyphs, words) of a text block; (0, 0) for images. Glyphs are the
+    base characters a line has to fit, so pointed and unpointed Hebrew
+    measure the same.
+    """
+    if block["kind"] != "text":
+        return 0, 0
+    text = block.get("text") or ""
+    return len(_NON_GLYPH_RE.sub("", text)), len(text.split())
+
+
+def pack_hash_list(hashes: Sequence[str]) -> bytes:
+    return HASH_LIST_MAGIC + b"".join(bytes.fromhex(h) for h in hashes)
+
+
+def unpack_hash_list(data: bytes) -> List[str]:
+    """
+    The digests in a packed hash list.
+    """
+    if data[:4] != HASH_LIST_MAGIC:
+        raise ValueError("Not a packed hash list")
+    return [
+        data[i:i + DIGEST_SIZE].hex()
+        for i in range(len(HASH_LIST_MAGIC), len(data), DIGEST_SIZE)
+    ]
+
+
+class HashLRU(Generic[_V]):
+    """
+    LRU keyed by content hash. Entries never go stale: the same key
+    always means the same content.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _V]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[_V]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: _V) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+# Decoded blocks by hash; callers get copies, since block dicts are
+# sometimes edited in place (e.g. image srcs rewritten for EPUB).
+block_cache: HashLRU[Dict[str, Any]] = HashLRU(max_entries=16384)
@@ -0,0 +1,127 @@
+"""
+Change feed: which projects and documents changed since a client last
+looked.
+
+Every flush that inserts or updates a project or document row stamps it
+with the next number of one database-wide sequence (change_seq, see
+models._stamp_change_seqs). A client keeps the cursor of its last
+response and asks for everything after it, getting back ids and
+versions only, then fetches just the documents that changed. A row keeps
+only its latest number, so a document edited ten times since the cursor
+is listed once.
+
+since=0 lists every row, which is a client's initial sync. Rows written
+before the sequence existed are numbered when the column is added (see
+db._sequence_legacy_rows), so every row carries a number above 0.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select
+
+from .db import get_session
+from .models import ChangeCounterModel, DocumentModel, ProjectModel
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# Long-poll: longest wait a client may ask for, and how often the
+# counter is checked meanwhile (a primary-key lookup).
+MAX_WAIT = 30.0
+POLL_INTERVAL = 0.25
+
+
+def latest_seq(session: Session) -> int:
+    """
+    The last change sequence number handed out; 0 before any write.
+    """
+    counter = session.get(ChangeCounterModel, 1)
+    return counter.value if counter is not None else 0
+
+
+def read_changes(
+    session: Session,
+    since: int = 0,
+    limit: int = DEFAULT_LIMIT,
+    project_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Up to `limit` changes after `since`, oldest first, optionally only
+    one project and its documents. `cursor` is the `since` for the next
+    call; `more` means the limit cut the list short.
+    """
+    # Read the counter first and ignore anything stamped after it: every
+    # row up to it is committed, so the cursor never skips a change.
+    latest = latest_seq(session)
+
+    projects = select(ProjectModel.id, ProjectModel.change_seq).where(
+        ProjectModel.change_seq > since, ProjectModel.change_seq <= latest
+    )
+    documents = select(
+        DocumentModel.id,
+        DocumentModel.project_id,
+        DocumentModel.version,
+        DocumentModel.change_seq,
+    ).where(DocumentModel.change_seq > since, DocumentModel.change_seq <= latest)
+    if project_id is not None:
+        projects = projects.where(ProjectModel.id == project_id)
+        documents = documents.where(DocumentModel.project_id == project_id)
+
+    project_rows = session.exec(
+        projects.order_by(ProjectModel.change_seq).limit(limit + 1)
+    ).all()
+    document_rows = session.exec(
+        documents.order_by(DocumentModel.change_seq).limit(limit + 1)
+    ).all()
+
+    merged = heapq.merge(
+        (
+            {"kind": "project", "id": id_, "project_id": id_, "version": None, "seq": seq}
+            for id_, seq in project_rows
+        ),
+        (
+            {"kind": "document", "id": id_, "project_id": pid, "version": version, "seq": seq}
+            for id_, pid, version, seq in document_rows
+        ),
+        key=lambda change: change["seq"],
+    )
+    changes: List[Dict[str, Any]] = [change for _, change in zip(range(limit + 1), merged)]
+    more = len(changes) > limit
+    del changes[limit:]
+
+    return {
+        "since": since,
+        "cursor": changes[-1]["seq"] if more else max(since, latest),
+        "latest": latest,
+        "more": more,
+        "changes": changes,
+    }
+
+
+def _current_seq() -> int:
+    with get_session() as session:
+        return latest_seq(session)
+
+
+async def wait_for_change(seq: int, timeout: float) -> bool:
+    """
+    Wait until a change after `seq` is committed, up to `timeout`
+    seconds. Polls the counter, so writes from other worker processes
+    are seen too. Returns False on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        # in a worker thread: a writer holding the SQLite lock can block
+        # the query for up to the busy timeout
+        if await run_in_threadpool(_current_seq) > seq:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(POLL_INTERVAL, remaining))
@@ -0,0 +1,128 @@
+"""
+Command-line tools that work on the database directly, without the API.
+
+    python -m app.cli export OUT [--database torah_layout.db]
+                                 [--format html|zip|pdf] [--project ID ...]
+                                 [--workers N] [--batch-size N] [--force]
+                                 [--verbose]
+    python -m app.cli prune [--database torah_layout.db]
+
+`export-html` is kept as an alias of `export`. Re-running an export only
+re-renders documents that changed since the last run into OUT.
+
+`prune` deletes stored blocks no document uses any more (see
+models.prune_blocks). Run it while nothing else writes to the database,
+e.g. with the server stopped.
+
+Only the standard library is imported until a command runs, so the
+--database option can point app.db at another file before the engine is
+created.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+
+def _export(args: argparse.Namespace) -> int:
+    from .batch_export import export_projects
+
+    try:
+        stats = export_projects(
+            args.out,
+            project_ids=args.project or None,
+            fmt=args.format,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            force=args.force,
+        )
+    except RuntimeError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    print(stats.summary())
+    if args.verbose:
+        for line in stats.report():
+            print(line)
+    return 0
+
+
+def _prune(args: argparse.Namespace) -> int:
+    from .db import get_session
+    from .models import prune_blocks
+
+    with get_session() as session:
+        lists, blocks = prune_blocks(session)
+    print(f"removed {lists} block lists, {blocks} blocks")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description=__doc__.strip().splitlines()[0],
+    )
+    parser.add_argument(
+        "--database",
+        help="SQLite file to open (default: TORAH_LAYOUT_DATABASE_URL or ./torah_layout.db).",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser(
+        "export",
+        aliases=["export-html"],
+        help="Render every document to a directory of HTML (or PDF) files.",
+    )
+    export.add_argument("out", help="Output directory.")
+    export.add_argument(
+        "--format",
+        choices=("html", "zip", "pdf"),
+        default="html",
+        help="html files, html packed into one ZIP per project, or pdf files.",
+    )
+    export.add_argument(
+        "--project", action="append", help="Only this project (repeatable)."
+    )
+    export.add_argument(
+        "--workers", type=int, default=None, help="Render processes (default: CPU count)."
+    )
+    export.add_argument("--batch-size", type=int, default=200)
+    export.add_argument(
+        "--force", action="store_true", help="Re-render unchanged documents too."
+    )
+    export.add_argument(
+        "-v", "--verbose", action="store_true", help="List each rebuilt document and why."
+    )
+    export.set_defaults(handler=_export)
+
+    prune = commands.add_parser(
+        "prune",
+        help="Delete stored blocks no document uses. Don't run alongside writes.",
+    )
+    prune.set_defaults(handler=_prune)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.database:
+        path = os.path.abspath(args.database)
+        # SQLite would create an empty file for a mistyped path
+        if not os.path.isfile(path):
+            print(f"error: no database at {path}", file=sys.stderr)
+            return 1
+        if "app.db" in sys.modules:
+            raise SystemExit("--database must be given before app.db is imported")
+        os.environ["TORAH_LAYOUT_DATABASE_URL"] = "sqlite:///" + path
+
+    from .db import init_db
+
+    # bring databases from older versions up to date, as the server does
+    init_db()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Server-side project duplication.
+
+A clone is built in one transaction with a handful of bulk
+INSERT ... SELECT statements (documents, citations, footnotes, style
+template) driven by a temporary old id -> new id table, so no document
+is loaded into Python and the source project's rows are never written.
+Cloned documents point at the same block_lists rows as their originals;
+the blocks are only copied when one side is edited and set_blocks stores
+a new list (copy-on-write). Documents storing blocks inline (packed or
+JSON, see db.BLOCK_STORAGE) have their column copied as it is.
+"""
+
+from __future__ import annotations
+
+import uuid
+from typing import Optional
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert, literal, select
+from sqlmodel import Session
+
+from .models import (
+    CitationModel,
+    DocumentModel,
+    FootnoteModel,
+    ProjectModel,
+    StyleTemplateModel,
+    allocate_change_seqs,
+)
+
+_clone_map = Table(
+    "clone_map",
+    MetaData(),
+    Column("old_id", String, primary_key=True),
+    Column("new_id", String, nullable=False),
+    # change feed position of the new document
+    Column("seq", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+
+def clone_project(
+    session: Session,
+    source: ProjectModel,
+    name: Optional[str] = None,
+    description: Optional[str] = None,
+) -> ProjectModel:
+    """
+    Duplicate a project with its documents, citation and footnote indexes
+    and style template. Commits; returns the new project.
+    """
+    project = ProjectModel(
+        name=name or f"{source.name} (copy)",
+        description=source.description if description is None else description,
+    )
+    session.add(project)
+    session.flush()
+
+    conn = session.connection()
+    _clone_map.create(conn, checkfirst=True)
+    try:
+        doc_ids = session.execute(
+            select(DocumentModel.id).where(DocumentModel.project_id == source.id)
+        ).scalars().all()
+        if doc_ids:
+            first_seq = allocate_change_seqs(conn, len(doc_ids))
+            session.execute(
+                insert(_clone_map),
+                [
+                    {"old_id": old, "new_id": str(uuid.uuid4()), "seq": first_seq + i}
+                    for i, old in enumerate(doc_ids)
+                ],
+            )
+
+        docs = DocumentModel.__table__
+        session.execute(
+            insert(docs).from_select(
+                [
+                    "id", "project_id", "title", "description", "ref_key",
+                    "ref_commentator", "version", "blocks_hash", "blocks_packed",
+                    "blocks", "change_seq",
+                ],
+                select(
+                    _clone_map.c.new_id,
+                    literal(project.id),
+                    docs.c.title,
+                    docs.c.description,
+                    docs.c.ref_key,
+                    docs.c.ref_commentator,
+                    literal(1),
+                    docs.c.blocks_hash,
+                    docs.c.blocks_packed,
+                    docs.c.blocks,
+                    _clone_map.c.seq,
+                ).join(_clone_map, _clone_map.c.old_id == docs.c.id),
+            )
+        )
+
+        citations = CitationModel.__table__
+        session.execute(
+            insert(citations).from_select(
+                [
+                    "project_id", "source_document_id", "block_index", "start",
+                    "end", "text", "target_key", "commentator",
+                ],
+                select(
+                    literal(project.id),
+                    _clone_map.c.new_id,
+                    citations.c.block_index,
+                    citations.c.start,
+                    citations.c.end,
+                    citations.c.text,
+                    citations.c.target_key,
+                    citations.c.commentator,
+                ).join(_clone_map, _clone_map.c.old_id == citations.c.source_document_id),
+            )
+        )
+
+        footnotes = FootnoteModel.__table__
+        session.execute(
+            insert(footnotes).from_select(
+                ["document_id", "label", "anchor_block", "start", "end", "note_block"],
+                select(
+                    _clone_map.c.new_id,
+                    footnotes.c.label,
+                    footnotes.c.anchor_block,
+                    footnotes.c.start,
+                    footnotes.c.end,
+                    footnotes.c.note_block,
+                ).join(_clone_map, _clone_map.c.old_id == footnotes.c.document_id),
+            )
+        )
+
+        templates = StyleTemplateModel.__table__
+        session.execute(
+            insert(templates).from_select(
+                ["project_id", "version", "roles"],
+                select(literal(project.id), templates.c.version, templates.c.roles)
+                .where(templates.c.project_id == source.id),
+            )
+        )
+    finally:
+        _clone_map.drop(conn)
+
+    session.commit()
+    session.refresh(project)
+    return project
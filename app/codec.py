@@ -0,0 +1,331 @@
+"""
+Compact binary encoding for block lists (and whole documents on the wire).
+
+The JSON column repeats "kind", "role", "alignment" and their values for
+every block. The packed format instead:
+
+- interns kind/role/alignment strings into a per-document string table,
+- stores every length/index as a little-endian uint32 in one flat array
+  (so decoding is a single struct.unpack call),
+- appends all text as one UTF-8 heap, sliced back out by those lengths,
+- optionally compresses the whole body with zlib, or zstd when asked for
+  (see AUTO_COMPRESSION).
+
+Blocks layout:
+
+    b"TLB1" | compression (1 byte) | body (possibly compressed)
+
+    body = <n_strings, n_blocks, n_ints> (3 x uint32)
+           ints[n_ints]                  (uint32)
+           string table bytes | text heap bytes
+
+    ints = [len(string) for each interned string]
+           + per text block:  kind_idx, role_idx, len(text)
+           + per image block: kind_idx, role_idx, len(src),
+                              len(alt_text) + 1 (0 = None),
+                              alignment_idx + 1 (0 = None)
+
+Document layout (wire only, wraps an already-encoded blocks blob so the
+stored column can be sent without re-encoding):
+
+    b"TLD1" | len(id), len(project_id), len(title), len(description) + 1
+            | UTF-8 strings | blocks blob
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:  # optional: better ratio and much faster than zlib
+    import zstandard
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None
+
+
+BLOCKS_MAGIC = b"TLB1"
+DOCUMENT_MAGIC = b"TLD1"
+
+# Content type for GET /projects/{id}/documents/{id} with the packed format.
+PACKED_MEDIA_TYPE = "application/x-torah-layout-packed"
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+# Bodies smaller than this are stored raw: the compressor's framing
+# overhead eats most of the gain on a handful of short blocks.
+COMPRESS_THRESHOLD = 512
+
+# What "auto" compresses with. zlib unless configured otherwise: blocks
+# written with zstd can only be read where zstandard is installed, so a
+# database must not depend on whether it happened to be.
+AUTO_COMPRESSION = os.environ.get("TORAH_LAYOUT_PACKED_COMPRESSION", "zlib")
+
+_COUNTS = struct.Struct("<III")
+_DOC_LENGTHS = struct.Struct("<IIII")
+
+
+# ---------------------------
+# Blocks
+# ---------------------------
+
+def encode_blocks(
+    blocks: Sequence[Dict[str, Any]],
+    compression: Optional[str] = "auto",
+) -> bytes:
+    """
+    Encode a list of block dicts (as produced by `Block.model_dump()`).
+
+    compression: "auto" (AUTO_COMPRESSION, only above
+    COMPRESS_THRESHOLD), "zstd", "zlib", or None for no compression.
+    """
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        idx = index.get(value)
+        if idx is None:
+            idx = index[value] = len(strings)
+            strings.append(value)
+        return idx
+
+    ints: List[int] = []
+    heap: List[bytes] = []
+
+    for block in blocks:
+        kind = block["kind"]
+        ints.append(intern(kind))
+        ints.append(intern(block["role"]))
+
+        if kind == "text":
+            data = (block.get("text") or "").encode("utf-8")
+            ints.append(len(data))
+            heap.append(data)
+        elif kind == "image":
+            data = block["src"].encode("utf-8")
+            ints.append(len(data))
+            heap.append(data)
+
+            alt_text = block.get("alt_text")
+            if alt_text is None:
+                ints.append(0)
+            else:
+                data = alt_text.encode("utf-8")
+                ints.append(len(data) + 1)
+                heap.append(data)
+
+            alignment = block.get("alignment")
+            ints.append(0 if alignment is None else intern(alignment) + 1)
+        else:
+            raise ValueError(f"Cannot encode block of kind {kind!r}")
+
+    table = [s.encode("utf-8") for s in strings]
+    all_ints = [len(s) for s in table] + ints
+
+    body = b"".join(
+        [
+            _COUNTS.pack(len(table), len(blocks), len(all_ints)),
+            struct.pack(f"<{len(all_ints)}I", *all_ints),
+            *table,
+            *heap,
+        ]
+    )
+    return _wrap(BLOCKS_MAGIC, body, compression)
+
+
+def _open_blocks(data: bytes) -> Tuple[bytes, List[str], Tuple[int, ...], int, int]:
+    """
+    Decompress and read the header and string table.
+    Returns (body, strings, ints, n_blocks, heap offset).
+    """
+    body = _unwrap(BLOCKS_MAGIC, data)
+    n_strings, n_blocks, n_ints = _COUNTS.unpack_from(body, 0)
+    ints = struct.unpack_from(f"<{n_ints}I", body, _COUNTS.size)
+    pos = _COUNTS.size + 4 * n_ints
+
+    strings: List[str] = []
+    for length in ints[:n_strings]:
+        strings.append(body[pos:pos + length].decode("utf-8"))
+        pos += length
+    return body, strings, ints, n_blocks, pos
+
+
+def decode_blocks(data: bytes) -> List[Dict[str, Any]]:
+    """
+    Decode bytes from `encode_blocks` back into a list of block dicts.
+    """
+    return decode_block_window(data, 0, None)[1]
+
+
+def decode_block_window(
+    data: bytes,
+    start: int,
+    stop: Optional[int],
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Decode blocks[start:stop] only; returns (total block count, blocks).
+    Blocks before the window are skipped using the length table, without
+    decoding their text, and decoding stops at the end of the window.
+    """
+    body, strings, ints, n_blocks, pos = _open_blocks(data)
+    if stop is None or stop > n_blocks:
+        stop = n_blocks
+
+    blocks: List[Dict[str, Any]] = []
+    i = len(strings)
+    for index in range(stop):
+        kind = strings[ints[i]]
+        role = strings[ints[i + 1]]
+        wanted = index >= start
+
+        if kind == "text":
+            length = ints[i + 2]
+            if wanted:
+                text = body[pos:pos + length].decode("utf-8")
+                blocks.append({"kind": kind, "role": role, "text": text})
+            pos += length
+            i += 3
+        elif kind == "image":
+            length = ints[i + 2]
+            alt_length = ints[i + 3]
+            alignment_idx = ints[i + 4]
+            if wanted:
+                src = body[pos:pos + length].decode("utf-8")
+                alt_text: Optional[str] = None
+                if alt_length:
+                    alt_start = pos + length
+                    alt_end = alt_start + alt_length - 1
+                    alt_text = body[alt_start:alt_end].decode("utf-8")
+                alignment = strings[alignment_idx - 1] if alignment_idx else None
+                blocks.append(
+                    {
+                        "kind": kind,
+                        "role": role,
+                        "src": src,
+                        "alt_text": alt_text,
+                        "alignment": alignment,
+                    }
+                )
+            pos += length + max(alt_length - 1, 0)
+            i += 5
+        else:
+            raise ValueError(f"Cannot decode block of kind {kind!r}")
+
+    return n_blocks, blocks
+
+
+def block_outline(data: bytes) -> List[Tuple[str, str, int]]:
+    """
+    (kind, role, payload bytes) for every block, read from the length
+    table alone. Payload bytes are the UTF-8 size of text, or src + alt.
+    """
+    _, strings, ints, n_blocks, _ = _open_blocks(data)
+    outline: List[Tuple[str, str, int]] = []
+    i = len(strings)
+    for _ in range(n_blocks):
+        kind = strings[ints[i]]
+        role = strings[ints[i + 1]]
+        if kind == "text":
+            outline.append((kind, role, ints[i + 2]))
+            i += 3
+        elif kind == "image":
+            outline.append((kind, role, ints[i + 2] + max(ints[i + 3] - 1, 0)))
+            i += 5
+        else:
+            raise ValueError(f"Cannot decode block of kind {kind!r}")
+    return outline
+
+
+# ---------------------------
+# Documents (wire format)
+# ---------------------------
+
+def encode_document(
+    id: str,
+    project_id: str,
+    title: str,
+    description: Optional[str],
+    blocks_blob: bytes,
+) -> bytes:
+    """
+    Wrap an `encode_blocks` blob with the document's scalar fields.
+    """
+    fields = [s.encode("utf-8") for s in (id, project_id, title)]
+    desc = description.encode("utf-8") if description is not None else b""
+    lengths = _DOC_LENGTHS.pack(
+        len(fields[0]),
+        len(fields[1]),
+        len(fields[2]),
+        0 if description is None else len(desc) + 1,
+    )
+    return b"".join([DOCUMENT_MAGIC, lengths, *fields, desc, blocks_blob])
+
+
+def decode_document(data: bytes) -> Dict[str, Any]:
+    """
+    Decode bytes from `encode_document` into a plain document dict.
+    """
+    if data[:4] != DOCUMENT_MAGIC:
+        raise ValueError("Not a packed document")
+    id_len, project_len, title_len, desc_len = _DOC_LENGTHS.unpack_from(data, 4)
+
+    pos = 4 + _DOC_LENGTHS.size
+    values: List[Optional[str]] = []
+    for length in (id_len, project_len, title_len):
+        values.append(data[pos:pos + length].decode("utf-8"))
+        pos += length
+
+    description: Optional[str] = None
+    if desc_len:
+        description = data[pos:pos + desc_len - 1].decode("utf-8")
+        pos += desc_len - 1
+
+    return {
+        "id": values[0],
+        "project_id": values[1],
+        "title": values[2],
+        "description": description,
+        "blocks": decode_blocks(data[pos:]),
+    }
+
+
+# ---------------------------
+# Compression framing
+# ---------------------------
+
+def _wrap(magic: bytes, body: bytes, compression: Optional[str]) -> bytes:
+    if compression == "auto":
+        if len(body) < COMPRESS_THRESHOLD:
+            compression = None
+        else:
+            compression = AUTO_COMPRESSION
+
+    if compression is None:
+        return magic + bytes([COMPRESSION_NONE]) + body
+    if compression == "zlib":
+        return magic + bytes([COMPRESSION_ZLIB]) + zlib.compress(body, 6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        compressed = zstandard.ZstdCompressor(level=3).compress(body)
+        return magic + bytes([COMPRESSION_ZSTD]) + compressed
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+def _unwrap(magic: bytes, data: bytes) -> bytes:
+    if data[:4] != magic:
+        raise ValueError("Not a packed block list")
+    flag = data[4]
+    body = data[5:]
+    if flag == COMPRESSION_NONE:
+        return body
+    if flag == COMPRESSION_ZLIB:
+        return zlib.decompress(body)
+    if flag == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd-compressed blocks require 'zstandard'")
+        return zstandard.ZstdDecompressor().decompress(body)
+    raise ValueError(f"Unknown compression flag {flag}")
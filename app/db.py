@@ -1,11 +1,23 @@
 from __future__ import annotations
 
+import hashlib
+import os
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Iterator, Optional
 
+from sqlalchemy import Column, String, Table, bindparam, inspect, select, text, update
+from sqlalchemy.exc import DBAPIError
 from sqlmodel import SQLModel, create_engine, Session
 
-DATABASE_URL = "sqlite:///./torah_layout.db"
+DATABASE_URL = os.environ.get(
+    "TORAH_LAYOUT_DATABASE_URL", "sqlite:///./torah_layout.db"
+)
+
+# "shared" stores each distinct block list once in the compact binary format
+# (app/codec.py), keyed by content hash, so identical documents and project
+# clones share it; "packed" keeps the same format inline in the document
+# row; "json" keeps the original list-of-dicts JSON column. Reads handle all.
+BLOCK_STORAGE = os.environ.get("TORAH_LAYOUT_BLOCK_STORAGE", "shared")
 
 engine = create_engine(
     DATABASE_URL,
@@ -14,14 +26,156 @@ engine = create_engine(
 )
 
 
-def init_db() -> None:
+# One row: the fingerprint of the schema the database was last set up
+# for. Part of the metadata, so drop_all() clears it with the tables.
+_schema_info = Table(
+    "schema_info",
+    SQLModel.metadata,
+    Column("fingerprint", String, primary_key=True),
+)
+
+
+# Names of the index tables (citations, footnotes) whose backfill over
+# existing documents has completed; see _backfill_indexes.
+_indexes_built = Table(
+    "indexes_built",
+    SQLModel.metadata,
+    Column("name", String, primary_key=True),
+)
+
+
+def schema_fingerprint() -> str:
+    """
+    Hash of every table, column, type, nullability and index in the
+    models. Any model change gives a new fingerprint.
+    """
+    from . import models  # ensure models are imported
+
+    parts = []
+    for table in SQLModel.metadata.sorted_tables:
+        parts.append(table.name)
+        for column in table.columns:
+            parts.append(
+                f"{column.name}:{column.type.compile(dialect=engine.dialect)}"
+                f":{column.nullable}:{column.server_default is not None}"
+            )
+        parts.extend(sorted(index.name or "" for index in table.indexes))
+    digest = hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=16)
+    return digest.hexdigest()
+
+
+def _stored_fingerprint() -> Optional[str]:
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(_schema_info.c.fingerprint)).scalar()
+    except DBAPIError:  # no schema_info table yet
+        return None
+
+
+def init_db() -> bool:
     """
     Create tables if they don't exist.
     Call this once at startup.
+
+    Skipped when the database was already set up for the current models
+    (same schema fingerprint), so a warm start costs one SELECT instead
+    of create_all and an inspection of every table. Returns True if the
+    schema was (re)applied.
     """
-    from . import models  # ensure models are imported
+    fingerprint = schema_fingerprint()
+    if _stored_fingerprint() == fingerprint:
+        return False
 
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _sequence_legacy_rows()
+    _backfill_indexes()
+    with engine.begin() as conn:
+        conn.execute(_schema_info.delete())
+        conn.execute(_schema_info.insert().values(fingerprint=fingerprint))
+    return True
+
+
+def _add_missing_columns() -> None:
+    """
+    create_all() never alters existing tables, so columns added to a model
+    after the database was first created are patched in here, with any
+    missing indexes. Only columns that are nullable or have a server
+    default can be added this way.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                default = column.server_default
+                if not column.nullable and default is None:
+                    continue
+                ddl = (
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                    f"{column.type.compile(dialect=engine.dialect)}"
+                )
+                if default is not None:
+                    ddl += f" NOT NULL DEFAULT {default.arg}"
+                conn.execute(text(ddl))
+            # indexes on the patched-in columns
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _sequence_legacy_rows() -> None:
+    """
+    Rows written before the change feed existed get change_seq 0 from the
+    column default. The feed pages by change_seq, so give them real
+    numbers, in insertion order, projects first.
+    """
+    from .models import DocumentModel, ProjectModel, allocate_change_seqs
+
+    with engine.begin() as conn:
+        for model in (ProjectModel, DocumentModel):
+            table = model.__table__
+            ids = conn.execute(
+                select(table.c.id)
+                .where(table.c.change_seq == 0)
+                .order_by(text("rowid"))
+            ).scalars().all()
+            if not ids:
+                continue
+            first = allocate_change_seqs(conn, len(ids))
+            conn.execute(
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values(change_seq=bindparam("seq")),
+                [{"row_id": id_, "seq": first + n} for n, id_ in enumerate(ids)],
+            )
+
+
+def _backfill_indexes() -> None:
+    """
+    Index tables are filled when a document is saved, so documents saved
+    before one existed are indexed here. Each backfill is marked done in
+    indexes_built only once it completes (they commit per batch), so one
+    interrupted by a crash runs again on the next start.
+    """
+    from .footnotes import backfill_footnotes
+    from .references import backfill_citations
+
+    with engine.connect() as conn:
+        built = set(conn.execute(select(_indexes_built.c.name)).scalars())
+    for name, backfill in (
+        ("citations", backfill_citations),
+        ("footnotes", backfill_footnotes),
+    ):
+        if name in built:
+            continue
+        with get_session() as session:
+            backfill(session)
+        with engine.begin() as conn:
+            conn.execute(_indexes_built.insert().values(name=name))
 
 
 @contextmanager
@@ -0,0 +1,397 @@
+"""
+EPUB 3 export for a whole project.
+
+The book is produced as a stream of ZIP bytes: documents are read from the
+database in batches (in a fixed order, so chapter numbers are known before
+rendering and citations can link ahead), rendered to XHTML chapters (in a
+process pool for larger projects), and each chapter is written to the
+archive and handed to the response as soon as it is ready. Nothing but the current batch
+and the manifest entries is held in memory.
+
+Layout inside the archive:
+
+    mimetype                  (first, stored, as the spec requires)
+    META-INF/container.xml
+    OEBPS/styles.css          (page CSS + the project's compiled styles)
+    OEBPS/images/<hash>.<ext> (local image assets, one per distinct file)
+    OEBPS/chapter-0001.xhtml ...
+    OEBPS/nav.xhtml
+    OEBPS/content.opf         (written last, once every item is known)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import mimetypes
+import os
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from html import escape
+from multiprocessing import get_context
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import literal_column
+from sqlmodel import Session, select
+
+from .db import get_session
+from .footnotes import Notes, document_notes
+from .layout import PAGE_CSS, Links, render_document_to_xhtml
+from .models import DocumentModel, ProjectModel
+from .references import document_links
+from .schemas import Document
+from .styles import CompiledStyles, get_project_styles
+
+EPUB_MEDIA_TYPE = "application/epub+zip"
+
+# Image blocks whose src resolves to a file under this directory are
+# embedded in the book. Anything else (remote URLs, missing files) can't
+# be referenced from inside the container, so the figure is dropped and
+# its alt text, if any, kept in its place (see _local_images).
+ASSET_DIR = os.environ.get("TORAH_LAYOUT_ASSET_DIR", "./assets")
+
+# Below this many chapters, rendering inline beats starting a pool.
+PARALLEL_THRESHOLD = 8
+
+# Documents read from the DB and rendered per round trip to the pool.
+BATCH_SIZE = 32
+
+# Size of the render pool shared by every export in the process.
+POOL_WORKERS = int(
+    os.environ.get("TORAH_LAYOUT_EPUB_WORKERS", min(4, os.cpu_count() or 1))
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn, not fork: the server is multi-threaded, and a child forked
+    # while another thread holds a cache lock would deadlock on it
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+
+def shared_pool() -> ProcessPoolExecutor:
+    """
+    The render pool for exports, started on first use and kept for the
+    life of the process, so requests don't each start (and fork) one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(POOL_WORKERS)
+        return _pool
+
+_CONTAINER_XML = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<container version="1.0" '
+    'xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+    "<rootfiles>"
+    '<rootfile full-path="OEBPS/content.opf" '
+    'media-type="application/oebps-package+xml"/>'
+    "</rootfiles>"
+    "</container>"
+)
+
+
+class _StreamSink(io.RawIOBase):
+    """
+    Write-only file for ZipFile that collects written bytes until
+    drained. It can seek back within what hasn't been drained yet, and
+    entries are drained whole, so ZipFile patches every local header with
+    the real CRC and sizes instead of falling back to data descriptors
+    (which streaming readers reject on stored entries like mimetype).
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._base = 0  # stream offset of _buffer[0]
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        chunk = bytes(data)
+        start = self._position - self._base
+        self._buffer[start:start + len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        end = self._base + len(self._buffer)
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += end
+        if not self._base <= offset <= end:
+            raise OSError("can't seek into output that was already drained")
+        self._position = offset
+        return offset
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._base += len(data)
+        self._buffer.clear()
+        return data
+
+
+# (document fields, compiled styles, language, citation links, footnotes)
+ChapterTask = Tuple[Dict[str, Any], CompiledStyles, str, Links, Notes]
+
+
+def render_chapter(task: ChapterTask) -> str:
+    """
+    Render one chapter. Module-level so it can run in a worker process.
+    """
+    doc_fields, styles, lang, links, notes = task
+    return render_document_to_xhtml(
+        Document.model_validate(doc_fields),
+        styles,
+        lang=lang,
+        links=links,
+        notes=notes,
+    )
+
+
+class _AssetCollector:
+    """
+    Embeds local images once per distinct content and maps srcs to
+    their path inside the book.
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, asset_dir: str) -> None:
+        self._zf = zf
+        self._asset_dir = os.path.abspath(asset_dir)
+        self._by_src: Dict[str, Optional[str]] = {}
+        self._by_digest: Dict[str, str] = {}
+        # (manifest id, href, media type)
+        self.items: List[Tuple[str, str, str]] = []
+
+    def resolve(self, src: str) -> Optional[str]:
+        if src in self._by_src:
+            return self._by_src[src]
+
+        href: Optional[str] = None
+        path = os.path.abspath(os.path.join(self._asset_dir, src.lstrip("/")))
+        if path.startswith(self._asset_dir + os.sep) and os.path.isfile(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            href = self._by_digest.get(digest)
+            if href is None:
+                ext = os.path.splitext(path)[1].lower()
+                href = f"images/{digest}{ext}"
+                media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                # already-compressed formats gain nothing from deflate
+                self._zf.writestr(
+                    f"OEBPS/{href}", data, compress_type=zipfile.ZIP_STORED
+                )
+                self._by_digest[digest] = href
+                self.items.append((f"img-{digest}", href, media_type))
+
+        self._by_src[src] = href
+        return href
+
+
+def _local_images(blocks: List[Dict[str, Any]], assets: _AssetCollector) -> List[Dict[str, Any]]:
+    """
+    Point image blocks at their embedded copies. Images that don't resolve
+    become a text block with their alt text (an empty image block, which
+    renders as nothing, when there is none), so block indexes used by
+    citation links and footnotes stay valid.
+    """
+    for i, block in enumerate(blocks):
+        if block["kind"] != "image" or not block.get("src"):
+            continue
+        href = assets.resolve(block["src"])
+        if href is not None:
+            block["src"] = href
+        elif block.get("alt_text"):
+            blocks[i] = {"kind": "text", "role": block["role"], "text": block["alt_text"]}
+        else:
+            block["src"] = ""
+    return blocks
+
+
+def _chapter_task(
+    session: Session,
+    doc: DocumentModel,
+    assets: _AssetCollector,
+    styles: CompiledStyles,
+    lang: str,
+    chapter_hrefs: Dict[str, str],
+) -> ChapterTask:
+    fields = {
+        "id": doc.id,
+        "project_id": doc.project_id,
+        "title": doc.title,
+        "description": doc.description,
+        "blocks": _local_images(doc.get_block_dicts(), assets),
+    }
+    links = document_links(session, doc, chapter_hrefs.get)
+    return fields, styles, lang, links, document_notes(session, doc.id)
+
+
+def stream_project_epub(
+    project_id: str,
+    workers: Optional[int] = None,
+    lang: str = "he",
+    asset_dir: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    Yield the EPUB for a project as ZIP bytes, chapter by chapter.
+    workers: None renders in the shared pool (see shared_pool), 1 renders
+    in this thread, more starts a pool of that size for this export.
+
+    Documents deleted while the export runs are left out.
+    """
+    sink = _StreamSink()
+    zf = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+
+    zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+    zf.writestr("META-INF/container.xml", _CONTAINER_XML)
+
+    chapters: List[Tuple[str, str, str]] = []  # (manifest id, href, title)
+    pool: Optional[Executor] = None
+    own_pool = False
+
+    with get_session() as session:
+        project = session.get(ProjectModel, project_id)
+        if project is None:
+            raise ValueError(f"Project {project_id} not found")
+
+        styles = get_project_styles(session, project.id)
+        zf.writestr("OEBPS/styles.css", PAGE_CSS + styles.css)
+        yield sink.drain()
+
+        assets = _AssetCollector(zf, asset_dir or ASSET_DIR)
+
+        # Chapter numbers are fixed up front so citations can link to
+        # chapters that haven't been rendered yet. Documents have no
+        # position of their own; chapters follow the order they were
+        # added to the project.
+        doc_ids = session.exec(
+            select(DocumentModel.id)
+            .where(DocumentModel.project_id == project.id)
+            .order_by(literal_column("documents.rowid"))
+        ).all()
+        chapter_hrefs = {
+            doc_id: f"chapter-{number:04d}.xhtml"
+            for number, doc_id in enumerate(doc_ids, start=1)
+        }
+
+        if len(doc_ids) >= PARALLEL_THRESHOLD:
+            if workers is None:
+                pool = shared_pool() if POOL_WORKERS > 1 else None
+            elif workers > 1:
+                pool, own_pool = _new_pool(workers), True
+
+        try:
+            for offset in range(0, len(doc_ids), BATCH_SIZE):
+                batch_ids = doc_ids[offset:offset + BATCH_SIZE]
+                rows = session.exec(
+                    select(DocumentModel).where(DocumentModel.id.in_(batch_ids))
+                ).all()
+                by_id = {doc.id: doc for doc in rows}
+                # deleted since the ids were read: no chapter, and no
+                # links to it from the chapters still to come
+                for doc_id in batch_ids:
+                    if doc_id not in by_id:
+                        chapter_hrefs.pop(doc_id, None)
+                batch = [
+                    _chapter_task(session, by_id[doc_id], assets, styles, lang, chapter_hrefs)
+                    for doc_id in batch_ids
+                    if doc_id in by_id
+                ]
+                _write_chapters(zf, batch, pool, chapters, chapter_hrefs)
+                yield sink.drain()
+        finally:
+            if own_pool:
+                pool.shutdown()
+
+        zf.writestr("OEBPS/nav.xhtml", _nav_xhtml(project.name, chapters, lang))
+        zf.writestr(
+            "OEBPS/content.opf",
+            _content_opf(project, chapters, assets.items, lang),
+        )
+
+    zf.close()
+    yield sink.drain()
+
+
+def _write_chapters(
+    zf: zipfile.ZipFile,
+    batch: List[ChapterTask],
+    pool: Optional[Executor],
+    chapters: List[Tuple[str, str, str]],
+    chapter_hrefs: Dict[str, str],
+) -> None:
+    rendered = pool.map(render_chapter, batch) if pool else map(render_chapter, batch)
+    for task, xhtml in zip(batch, rendered):
+        href = chapter_hrefs[task[0]["id"]]
+        zf.writestr(f"OEBPS/{href}", xhtml)
+        chapters.append((href[:-len(".xhtml")], href, task[0]["title"]))
+
+
+def _nav_xhtml(title: str, chapters: List[Tuple[str, str, str]], lang: str) -> str:
+    items = "".join(
+        f'<li><a href="{href}">{escape(chapter_title)}</a></li>'
+        for _, href, chapter_title in chapters
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<!DOCTYPE html>\n"
+        '<html xmlns="http://www.w3.org/1999/xhtml" '
+        'xmlns:epub="http://www.idpf.org/2007/ops" '
+        f'lang="{lang}" xml:lang="{lang}">'
+        f"<head><meta charset=\"utf-8\"/><title>{escape(title)}</title></head>"
+        '<body><nav epub:type="toc" id="toc">'
+        f"<h1>{escape(title)}</h1><ol>{items}</ol>"
+        "</nav></body></html>"
+    )
+
+
+def _content_opf(
+    project: ProjectModel,
+    chapters: List[Tuple[str, str, str]],
+    images: List[Tuple[str, str, str]],
+    lang: str,
+) -> str:
+    modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    manifest = [
+        '<item id="nav" href="nav.xhtml" '
+        'media-type="application/xhtml+xml" properties="nav"/>',
+        '<item id="css" href="styles.css" media-type="text/css"/>',
+    ]
+    manifest += [
+        f'<item id="{item_id}" href="{href}" media-type="application/xhtml+xml"/>'
+        for item_id, href, _ in chapters
+    ]
+    manifest += [
+        f'<item id="{item_id}" href="{href}" media-type="{media_type}"/>'
+        for item_id, href, media_type in images
+    ]
+    spine = "".join(f'<itemref idref="{item_id}"/>' for item_id, _, _ in chapters)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" '
+        'unique-identifier="book-id">'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:identifier id="book-id">urn:uuid:{project.id}</dc:identifier>'
+        f"<dc:title>{escape(project.name)}</dc:title>"
+        f"<dc:language>{lang}</dc:language>"
+        f'<meta property="dcterms:modified">{modified}</meta>'
+        "</metadata>"
+        f"<manifest>{''.join(manifest)}</manifest>"
+        f"<spine>{spine}</spine>"
+        "</package>"
+    )
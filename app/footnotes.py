@@ -0,0 +1,161 @@
+"""
+Footnote anchoring and the per-document footnote index.
+
+A text block marks a footnote with an anchor like "[^1]" or "[^rashi]";
+the note itself is a block with a footnote role (footnote_en /
+footnote_he) whose text starts with the same label:
+
+    {"role": "commentary_en", "text": "The matzah[^1] is broken."}
+    {"role": "footnote_en",   "text": "[^1] Yachatz."}
+
+Anchors are bound to their notes when a document is saved and stored as
+rows in the `footnotes` table, so the renderer gets a ready placement
+map (anchor block -> anchors -> note block) and can number notes and
+move them to the bottom of the page in one pass over the blocks.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from .models import DocumentModel, FootnoteModel
+from .textprep import normalize_hebrew
+
+FOOTNOTE_ROLES = frozenset({"footnote_en", "footnote_he"})
+
+_ANCHOR_RE = re.compile(r"\[\^([\w-]{1,32})\]")
+_NOTE_LABEL_RE = re.compile(r"\s*\[\^([\w-]{1,32})\]\s*")
+
+# (start, end, note block index) over an anchor block's normalized text
+Placement = Tuple[int, int, int]
+# anchor block index -> its anchors, in text order
+Notes = Dict[int, Sequence[Placement]]
+
+
+class Anchor(NamedTuple):
+    """
+    One footnote anchor. start/end are offsets into the block's
+    normalized text (textprep.normalize_hebrew); note is the index of the
+    footnote block it refers to, or None if no note has that label.
+    """
+    label: str
+    block: int
+    start: int
+    end: int
+    note: Optional[int]
+
+
+def note_label(text: str) -> Optional[Tuple[str, int]]:
+    """
+    (label, length of the label prefix) for a footnote block's text.
+    """
+    match = _NOTE_LABEL_RE.match(text)
+    return (match[1], match.end()) if match else None
+
+
+def index_footnotes(blocks: Sequence[Tuple[str, Optional[str]]]) -> List[Anchor]:
+    """
+    Bind anchors to notes. blocks: (role, text) per block, text None for
+    non-text blocks. If two notes share a label, the first one wins.
+    """
+    notes: Dict[str, int] = {}
+    for index, (role, text) in enumerate(blocks):
+        if role in FOOTNOTE_ROLES and text:
+            label = note_label(text)
+            if label is not None:
+                notes.setdefault(label[0], index)
+
+    anchors: List[Anchor] = []
+    for index, (role, text) in enumerate(blocks):
+        if role in FOOTNOTE_ROLES or not text:
+            continue
+        for match in _ANCHOR_RE.finditer(normalize_hebrew(text)):
+            label = match[1]
+            anchors.append(
+                Anchor(label, index, match.start(), match.end(), notes.get(label))
+            )
+    return anchors
+
+
+def placements(anchors: Sequence[Anchor]) -> Notes:
+    """
+    Group resolved anchors by block for the renderer; dangling anchors
+    are dropped and stay in the text as typed.
+    """
+    notes: Dict[int, List[Placement]] = {}
+    for anchor in anchors:
+        if anchor.note is not None:
+            notes.setdefault(anchor.block, []).append(
+                (anchor.start, anchor.end, anchor.note)
+            )
+    return notes
+
+
+# ---------------------------
+# Index maintenance + queries
+# ---------------------------
+
+def reindex_footnotes(session: Session, doc: DocumentModel) -> None:
+    """
+    Refresh a document's footnote anchors. Call after set_blocks, before
+    commit.
+    """
+    session.execute(
+        delete(FootnoteModel).where(FootnoteModel.document_id == doc.id)
+    )
+    session.add_all(_footnote_rows(doc))
+
+
+def _footnote_rows(doc: DocumentModel) -> List[FootnoteModel]:
+    blocks = [(b["role"], b.get("text")) for b in doc.get_block_dicts()]
+    return [
+        FootnoteModel(
+            document_id=doc.id,
+            label=anchor.label,
+            anchor_block=anchor.block,
+            start=anchor.start,
+            end=anchor.end,
+            note_block=anchor.note,
+        )
+        for anchor in index_footnotes(blocks)
+    ]
+
+
+def backfill_footnotes(session: Session, batch_size: int = 200) -> int:
+    """
+    Index the anchors of every document, for documents saved before the
+    index existed (db.init_db calls this until it has completed once). Commits per batch; returns the number of documents indexed.
+    """
+    ids = session.exec(select(DocumentModel.id).order_by(DocumentModel.id)).all()
+    for offset in range(0, len(ids), batch_size):
+        chunk = ids[offset:offset + batch_size]
+        session.execute(delete(FootnoteModel).where(FootnoteModel.document_id.in_(chunk)))
+        docs = session.exec(select(DocumentModel).where(DocumentModel.id.in_(chunk))).all()
+        for doc in docs:
+            session.add_all(_footnote_rows(doc))
+        session.commit()
+        session.expunge_all()
+    return len(ids)
+
+
+def footnotes_of(session: Session, document_id: str) -> List[Anchor]:
+    """
+    A document's anchors in reading order.
+    """
+    rows = session.exec(
+        select(FootnoteModel)
+        .where(FootnoteModel.document_id == document_id)
+        .order_by(FootnoteModel.anchor_block, FootnoteModel.start)
+    )
+    return [
+        Anchor(row.label, row.anchor_block, row.start, row.end, row.note_block)
+        for row in rows
+    ]
+
+
+def document_notes(session: Session, document_id: str) -> Notes:
+    return placements(footnotes_of(session, document_id))
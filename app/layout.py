@@ -1,9 +1,20 @@
 from __future__ import annotations
 
 from html import escape
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from .blockstore import HashLRU, content_hash
+from .footnotes import Notes, index_footnotes, note_label, placements
 from .schemas import Document, TextBlock, ImageBlock, Block
+from .styles import CompiledStyles, default_styles, minify_css
+from .textprep import PreparedText, prepare_text
+
+# (start, end, href) over a text block's prepared text
+Link = Tuple[int, int, str]
+# block index -> links in that block
+Links = Dict[int, Sequence[Link]]
+# (start, end, html): markup replacing a span of a block's prepared text
+Replacement = Tuple[int, int, str]
 
 
 BASE_CSS = """
@@ -37,55 +48,19 @@ body {
     margin: 0;
 }
 
-/* Role-based styles – mirror frontend */
-
-.block.role-haggadah_main_hebrew p {
-    direction: rtl;
-    text-align: right;
-    font-size: 1.1rem;
-    line-height: 1.7;
-}
-
-.block.role-haggadah_translation_en p {
-    direction: ltr;
-    text-align: left;
-    font-size: 1rem;
-    line-height: 1.6;
-}
-
-.block.role-commentary_en p {
-    font-size: 0.95rem;
-    line-height: 1.6;
-    color: #374151;
-}
-
-.block.role-commentary_he p {
-    direction: rtl;
-    text-align: right;
-    font-size: 0.95rem;
-    line-height: 1.6;
-}
-
-.block.role-footnote_en p,
-.block.role-footnote_he p {
-    font-size: 0.8rem;
-    line-height: 1.3;
-    color: #4b5563;
-}
-
 /* Images */
 
-.figure {
+.block-image {
     margin: 0.5rem 0 0.75rem;
     text-align: center;
 }
 
-.figure img {
+.block-image img {
     max-width: 100%;
     height: auto;
 }
 
-.figure figcaption {
+.block-image figcaption {
     font-size: 0.8rem;
     color: #4b5563;
     margin-top: 0.25rem;
@@ -93,49 +68,295 @@ body {
 
 /* Simple alignment hooks */
 
-.figure.align-left {
+.block-image.align-left {
     text-align: left;
 }
 
-.figure.align-right {
+.block-image.align-right {
     text-align: right;
 }
+
+/* Footnotes */
+
+.footnote-ref {
+    font-size: 0.7em;
+    line-height: 0;
+}
+
+.footnotes {
+    margin-top: 1.5rem;
+    padding-top: 0.5rem;
+    border-top: 1px solid #e5e7eb;
+    font-size: 0.85rem;
+}
+
+.footnote p {
+    margin: 0 0 0.25rem;
+}
+
+.footnote-number {
+    margin-inline-end: 0.35rem;
+    text-decoration: none;
+}
 """
 
+# Bump whenever rendered markup changes for the same input (the render
+# snapshot test in tests/test_render_snapshot.py catches such changes);
+# exports keyed on it (app/manifest.py) are then rebuilt.
+RENDERER_VERSION = 1
+
+# Rendered blocks by block content hash + stylesheet hash. Blocks with
+# links or footnote refs depend on more than their content and skip it.
+rendered_block_cache: HashLRU[str] = HashLRU(max_entries=8192)
+
+# Role typography comes from the project's compiled style template
+# (app/styles.py); only page chrome lives here.
+PAGE_CSS = minify_css(BASE_CSS)
+
+
+def _render_bidi_text(
+    prepared: PreparedText,
+    links: Sequence[Link] = (),
+    replacements: Sequence[Replacement] = (),
+) -> str:
+    """
+    Escape prepared text, isolating everything above the paragraph level
+    (runs against the paragraph direction, plus any numbers nested in
+    them) in a dir= span so browsers don't re-guess the bidi analysis.
+
+    links: (start, end, href) over prepared.text; a link crossing a run
+    boundary is split into one <a> per run.
+    replacements: (start, end, html) over prepared.text; the span is
+    dropped and the html emitted once, where the span starts.
+    """
+    text = prepared.text
+    # (start, end, href, html); html set for replacements
+    marks = sorted(
+        [(start, end, href, None) for start, end, href in links]
+        + [(start, end, "", html) for start, end, html in replacements]
+    )
+
+    def render_slice(start: int, end: int) -> str:
+        pieces: List[str] = []
+        pos = start
+        for mark_start, mark_end, href, html in marks:
+            if mark_end <= pos or mark_start >= end:
+                continue
+            a, b = max(mark_start, pos), min(mark_end, end)
+            if a > pos:
+                pieces.append(escape(text[pos:a]))
+            if html is None:
+                pieces.append(f'<a href="{escape(href)}">{escape(text[a:b])}</a>')
+            elif a == mark_start:
+                pieces.append(html)
+            pos = b
+        if pos < end:
+            pieces.append(escape(text[pos:end]))
+        return "".join(pieces)
+
+    opposite = "ltr" if prepared.is_rtl else "rtl"
+    pieces: List[str] = []
+    span: List[str] = []
+
+    for run in prepared.runs:
+        rendered = render_slice(run.start, run.end)
+        if not rendered:
+            continue
+        if run.level > prepared.base_level:
+            span.append(rendered)
+            continue
+        if span:
+            pieces.append(f'<span dir="{opposite}">{"".join(span)}</span>')
+            span = []
+        pieces.append(rendered)
+
+    if span:
+        pieces.append(f'<span dir="{opposite}">{"".join(span)}</span>')
+    return "".join(pieces)
+
 
-def _render_text_block(block: TextBlock) -> str:
-    role_class = f"role-{escape(block.role)}" if block.role else "role-default"
-    text = escape(block.text or "")
-    if not text:
+def _render_text_block(
+    block: TextBlock,
+    styles: CompiledStyles,
+    links: Sequence[Link] = (),
+    replacements: Sequence[Replacement] = (),
+) -> str:
+    role_class = styles.class_for(block.role)
+    if not block.text:
         return ""
-    return f'<div class="block {role_class}"><p>{text}</p></div>'
+    prepared = prepare_text(block.text)
+    direction = "rtl" if prepared.is_rtl else "ltr"
+    body = _render_bidi_text(prepared, links, replacements)
+    return (
+        f'<div class="block block-text {role_class}">'
+        f'<p dir="{direction}">{body}</p></div>'
+    )
+
 
+def _render_noteref(number: int, first: bool, epub: bool) -> str:
+    # only the first reference to a note gets the id the note links back to
+    ref_id = f' id="fnref-{number}"' if first else ""
+    epub_type = ' epub:type="noteref"' if epub else ""
+    return (
+        f'<sup class="footnote-ref"><a href="#fn-{number}"{ref_id}{epub_type}>'
+        f"{number}</a></sup>"
+    )
+
+
+def _render_footnote(
+    block: TextBlock,
+    number: int,
+    styles: CompiledStyles,
+    epub: bool,
+) -> str:
+    text = block.text or ""
+    label = note_label(text)
+    prepared = prepare_text(text[label[1]:] if label else text)
+    direction = "rtl" if prepared.is_rtl else "ltr"
+    epub_type = ' epub:type="footnote"' if epub else ""
+    return (
+        f'<aside id="fn-{number}" class="footnote {styles.class_for(block.role)}"'
+        f"{epub_type}>"
+        f'<p dir="{direction}"><a class="footnote-number" href="#fnref-{number}">'
+        f"{number}</a>{_render_bidi_text(prepared)}</p></aside>"
+    )
 
-def _render_image_block(block: ImageBlock) -> str:
-    role_class = f"role-{escape(block.role)}" if block.role else "role-default"
+
+def _cached_block(block: Block, styles: CompiledStyles) -> str:
+    """
+    A text block without links/refs, or an image block, via the
+    rendered_block_cache (keyed like blockstore.block_hash).
+    """
+    if block.kind == "text":
+        fields = ("text", block.role, block.text or "")  # type: ignore[union-attr]
+    else:
+        fields = (
+            block.kind,
+            block.role,
+            block.src,  # type: ignore[union-attr]
+            block.alt_text,  # type: ignore[union-attr]
+            block.alignment,  # type: ignore[union-attr]
+        )
+    key = content_hash(fields) + styles.hash
+    html = rendered_block_cache.get(key)
+    if html is None:
+        if block.kind == "text":
+            html = _render_text_block(block, styles)  # type: ignore[arg-type]
+        else:
+            html = _render_image_block(block, styles)  # type: ignore[arg-type]
+        rendered_block_cache.put(key, html)
+    return html
+
+
+def document_footnotes(doc: Document) -> Notes:
+    """
+    Footnote placements computed from the blocks, for callers that don't
+    have the stored index (see footnotes.document_notes).
+    """
+    return placements(
+        index_footnotes([(b.role, getattr(b, "text", None)) for b in doc.blocks])
+    )
+
+
+def _render_image_block(block: ImageBlock, styles: CompiledStyles) -> str:
+    role_class = styles.class_for(block.role)
     src = escape(block.src or "")
     if not src:
         return ""
 
     alt = escape(block.alt_text or "")
-    alignment = block.alignment or "block"
-    align_class = ""
-    if alignment in ("left", "right"):
-        align_class = f"align-{alignment}"
+    align_class = f"align-{block.alignment or 'block'}"
 
     return (
-        f'<figure class="block figure {role_class} {align_class}">'
+        f'<figure class="block block-image {role_class} {align_class}">'
         f'<img src="{src}" alt="{alt}"/>'
         + (f"<figcaption>{alt}</figcaption>" if alt else "")
         + "</figure>"
     )
 
 
-def render_document_to_html(doc: Document) -> str:
+def _render_page_body(
+    doc: Document,
+    styles: CompiledStyles,
+    links: Optional[Links] = None,
+    notes: Optional[Notes] = None,
+    epub: bool = False,
+) -> str:
+    """
+    Header + blocks + footnotes, shared by the HTML and XHTML (EPUB)
+    renderers.
+
+    Footnote blocks bound to an anchor are taken out of the flow and
+    placed at the bottom of the page, numbered in anchor order as the
+    blocks are walked; unanchored footnote blocks render in place.
+    """
+    links = links or {}
+    if notes is None:
+        notes = document_footnotes(doc)
+    placed = {note for anchors in notes.values() for _, _, note in anchors}
+    numbers: Dict[int, int] = {}  # note block -> number, in anchor order
+    pieces: List[str] = []
+
+    # Header
+    title = escape(doc.title or "Document")
+    pieces.append(f'<h1 class="page-header-title">{title}</h1>')
+    if doc.description:
+        pieces.append(
+            f'<p class="page-header-description">{escape(doc.description)}</p>'
+        )
+
+    # Blocks
+    for index, block in enumerate(doc.blocks):
+        if index in placed:
+            continue
+        if isinstance(block, TextBlock) or block.kind == "text":
+            block_links = links.get(index, ())
+            refs: List[Replacement] = []
+            for start, end, note in notes.get(index, ()):
+                first = note not in numbers
+                number = numbers.setdefault(note, len(numbers) + 1)
+                refs.append((start, end, _render_noteref(number, first, epub)))
+            if block_links or refs:
+                pieces.append(
+                    _render_text_block(block, styles, block_links, refs)  # type: ignore[arg-type]
+                )
+            else:
+                pieces.append(_cached_block(block, styles))
+        elif isinstance(block, ImageBlock) or block.kind == "image":
+            pieces.append(_cached_block(block, styles))
+
+    # Footnotes
+    if numbers:
+        epub_type = ' epub:type="footnotes"' if epub else ""
+        pieces.append(f'<section class="footnotes"{epub_type}>')
+        for note, number in numbers.items():
+            pieces.append(
+                _render_footnote(doc.blocks[note], number, styles, epub)  # type: ignore[arg-type]
+            )
+        pieces.append("</section>")
+
+    return "".join(pieces)
+
+
+def render_document_to_html(
+    doc: Document,
+    styles: Optional[CompiledStyles] = None,
+    links: Optional[Links] = None,
+    notes: Optional[Notes] = None,
+) -> str:
     """
     Render a single Document into standalone HTML.
     This is a v0 layout: linear blocks with role-based styling.
+
+    styles: the project's compiled style template; defaults to the
+    built-in role styles.
+    links: hyperlinks per block index (see references.document_links).
+    notes: footnote placements (see footnotes.document_notes); computed
+    from the blocks when not given.
     """
+    if styles is None:
+        styles = default_styles
+
     pieces: List[str] = []
 
     # Basic HTML + CSS
@@ -146,7 +367,8 @@ def render_document_to_html(doc: Document) -> str:
     title = escape(doc.title or "Document")
     pieces.append(f"<title>{title}</title>")
     pieces.append("<style>")
-    pieces.append(BASE_CSS)
+    pieces.append(PAGE_CSS)
+    pieces.append(styles.css)
     pieces.append("</style>")
     pieces.append("</head>")
     pieces.append("<body>")
@@ -154,21 +376,45 @@ def render_document_to_html(doc: Document) -> str:
     # Page wrapper
     pieces.append('<div class="page">')
 
-    # Header
-    pieces.append(f'<h1 class="page-header-title">{title}</h1>')
-    if doc.description:
-        pieces.append(
-            f'<p class="page-header-description">{escape(doc.description)}</p>'
-        )
-
-    # Blocks
-    for block in doc.blocks:
-        if isinstance(block, TextBlock) or block.kind == "text":
-            pieces.append(_render_text_block(block))  # type: ignore[arg-type]
-        elif isinstance(block, ImageBlock) or block.kind == "image":
-            pieces.append(_render_image_block(block))  # type: ignore[arg-type]
+    pieces.append(_render_page_body(doc, styles, links, notes))
 
     pieces.append("</div>")  # .page
     pieces.append("</body></html>")
 
     return "".join(pieces)
+
+
+def render_document_to_xhtml(
+    doc: Document,
+    styles: Optional[CompiledStyles] = None,
+    stylesheet_href: str = "styles.css",
+    lang: str = "en",
+    links: Optional[Links] = None,
+    notes: Optional[Notes] = None,
+) -> str:
+    """
+    Render a Document as an EPUB 3 XHTML content document.
+    CSS is linked (stylesheet_href) rather than inlined so every chapter
+    of a book shares one stylesheet.
+    """
+    if styles is None:
+        styles = default_styles
+
+    title = escape(doc.title or "Document")
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<!DOCTYPE html>\n"
+        '<html xmlns="http://www.w3.org/1999/xhtml" '
+        'xmlns:epub="http://www.idpf.org/2007/ops" '
+        f'lang="{lang}" xml:lang="{lang}">'
+        "<head>"
+        '<meta charset="utf-8"/>'
+        f"<title>{title}</title>"
+        f'<link rel="stylesheet" type="text/css" href="{escape(stylesheet_href)}"/>'
+        "</head>"
+        "<body>"
+        '<section class="page" epub:type="chapter">'
+        + _render_page_body(doc, styles, links, notes, epub=True)
+        + "</section>"
+        "</body></html>"
+    )
@@ -1,9 +1,12 @@
-from typing import List
-from uuid import UUID
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 
 from .schemas import (
     Project,
@@ -11,11 +14,36 @@ from .schemas import (
     Document,
     DocumentCreate,
 )
-from .storage import project_store, document_store
-from .layout import render_document_to_html
+from .codec import PACKED_MEDIA_TYPE
+from .responses import (
+    document_json,
+    document_packed,
+    dumps,
+    json_array,
+    json_response,
+    project_json,
+)
 from .db import init_db, get_session
-from .models import ProjectModel, DocumentModel
-from .schemas import Project, ProjectCreate, Document, DocumentCreate, DocumentUpdate
+from .models import ProjectModel, DocumentModel, StyleTemplateModel, CitationModel
+from .schemas import Project, ProjectClone, ProjectCreate, Document, DocumentCreate, DocumentUpdate
+from .schemas import CompiledStylesheet, ProjectStatistics, ProjectStyles, StyleTemplateUpdate
+from .schemas import BlockRange, ChangeFeed, Citation, DocumentOutline, Footnote
+from .styles import CompiledStyles, DEFAULT_ROLE_STYLES, get_project_styles
+from .changes import DEFAULT_LIMIT, MAX_LIMIT, MAX_WAIT, read_changes, wait_for_change
+from .footnotes import document_notes, footnotes_of, reindex_footnotes
+# Export formats (.layout, .epub), project cloning and statistics are
+# imported in their endpoints: most processes never serve them, and
+# app.server's preload imports them up front where it matters.
+from .references import (
+    backlinks,
+    citations_from,
+    citations_of,
+    commentator_key,
+    document_links,
+    parse_reference,
+    reindex_document,
+    resolve_targets,
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -59,10 +87,7 @@ def read_health():
 def list_projects():
     with get_session() as session:
         projects = session.query(ProjectModel).all()
-        return [
-            Project(id=p.id, name=p.name, description=p.description)
-            for p in projects
-        ]
+        return json_response(json_array(project_json(p) for p in projects))
 
 
 @app.post("/projects", response_model=Project, status_code=201)
@@ -72,26 +97,33 @@ def create_project_endpoint(payload: ProjectCreate):
         session.add(project)
         session.commit()
         session.refresh(project)
-        return Project(
-            id=project.id,
-            name=project.name,
-            description=project.description,
-        )
-
+        return json_response(project_json(project), status_code=201)
 
 
 @app.get("/projects/{project_id}", response_model=Project)
-def get_project(project_id: UUID) -> Project:
+def get_project(project_id: str):
     """
     Retrieve a single project by ID.
     """
-    project = project_store.get_project(project_id)
-    if project is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-    return project
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        return json_response(project_json(project))
+
+@app.post("/projects/{project_id}/clone", response_model=Project, status_code=201)
+def clone_project_endpoint(project_id: str, payload: Optional[ProjectClone] = None):
+    """
+    Duplicate a project server-side: documents, indexes and style
+    template. Blocks are shared with the source until either side edits
+    them.
+    """
+    from .clone import clone_project
+
+    payload = payload or ProjectClone()
+    with get_session() as session:
+        source = _get_project_or_404(session, project_id)
+        project = clone_project(session, source, payload.name, payload.description)
+        return json_response(project_json(project), status_code=201)
+
 
 def _get_project_or_404(session, project_id: str) -> ProjectModel:
     project = session.get(ProjectModel, project_id)
@@ -104,17 +136,6 @@ def _get_project_or_404(session, project_id: str) -> ProjectModel:
 # Document endpoints
 # ---------------------------
 
-def _ensure_project_exists(project_id: UUID) -> None:
-    """
-    Internal helper: raise 404 if project does not exist.
-    """
-    if project_store.get_project(project_id) is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found",
-        )
-
-
 @app.get(
     "/projects/{project_id}/documents",
     response_model=List[Document],
@@ -127,18 +148,7 @@ def list_documents_for_project(project_id: str):
             .filter(DocumentModel.project_id == project.id)
             .all()
         )
-        result: List[Document] = []
-        for d in docs:
-            result.append(
-                Document(
-                    id=d.id,
-                    project_id=d.project_id,
-                    title=d.title,
-                    description=d.description,
-                    blocks=d.get_blocks(),
-                )
-            )
-        return result
+        return json_response(json_array(document_json(d) for d in docs))
 
 
 @app.post(
@@ -154,18 +164,13 @@ def create_document_endpoint(project_id: str, payload: DocumentCreate):
             title=payload.title,
             description=payload.description,
         )
-        # new docs start with empty blocks
-        doc.set_blocks([])
+        doc.set_blocks(payload.blocks or [], session)
         session.add(doc)
+        reindex_document(session, doc)
+        reindex_footnotes(session, doc)
         session.commit()
         session.refresh(doc)
-        return Document(
-            id=doc.id,
-            project_id=doc.project_id,
-            title=doc.title,
-            description=doc.description,
-            blocks=doc.get_blocks(),
-        )
+        return json_response(document_json(doc), status_code=201)
 
 
 
@@ -173,21 +178,91 @@ def create_document_endpoint(project_id: str, payload: DocumentCreate):
     "/projects/{project_id}/documents/{document_id}",
     response_model=Document,
 )
-def get_document(project_id: str, document_id: str):
+def get_document(project_id: str, document_id: str, request: Request):
     with get_session() as session:
         project = _get_project_or_404(session, project_id)
         doc = session.get(DocumentModel, document_id)
         if not doc or doc.project_id != project.id:
             raise HTTPException(status_code=404, detail="Document not found")
-        return Document(
-            id=doc.id,
-            project_id=doc.project_id,
-            title=doc.title,
-            description=doc.description,
-            blocks=doc.get_blocks(),
+        if PACKED_MEDIA_TYPE in request.headers.get("accept", ""):
+            return _packed_document_response(doc)
+        return json_response(document_json(doc))
+
+
+def _get_document_or_404(session, project_id: str, document_id: str) -> DocumentModel:
+    project = _get_project_or_404(session, project_id)
+    doc = session.get(DocumentModel, document_id)
+    if not doc or doc.project_id != project.id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
+
+@app.get(
+    "/projects/{project_id}/documents/{document_id}/blocks",
+    response_model=BlockRange,
+)
+def get_document_blocks(
+    project_id: str,
+    document_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+):
+    """
+    A window of blocks (blocks[offset:offset + limit]) so clients can
+    virtualize long documents. Pair with /outline for the total size.
+    """
+    with get_session() as session:
+        doc = _get_document_or_404(session, project_id, document_id)
+        total, blocks = doc.get_block_range(offset, limit)
+        return json_response(
+            dumps(
+                {
+                    "document_id": doc.id,
+                    "version": doc.version,
+                    "total": total,
+                    "offset": offset,
+                    "blocks": blocks,
+                }
+            )
         )
 
 
+@app.get(
+    "/projects/{project_id}/documents/{document_id}/outline",
+    response_model=DocumentOutline,
+)
+def get_document_outline(project_id: str, document_id: str):
+    """
+    Block count, role histogram and per-block payload sizes, computed
+    without decoding any block text.
+    """
+    with get_session() as session:
+        doc = _get_document_or_404(session, project_id, document_id)
+        outline = doc.get_block_outline()
+        histogram: Dict[str, int] = {}
+        for _, role, _ in outline:
+            histogram[role] = histogram.get(role, 0) + 1
+        return json_response(
+            dumps(
+                {
+                    "document_id": doc.id,
+                    "version": doc.version,
+                    "block_count": len(outline),
+                    "role_histogram": histogram,
+                    "block_sizes": [size for _, _, size in outline],
+                }
+            )
+        )
+
+
+def _packed_document_response(doc: DocumentModel) -> Response:
+    """
+    Serve a document in the compact binary format (see app/codec.py),
+    cached per document version like the JSON form.
+    """
+    return Response(content=document_packed(doc), media_type=PACKED_MEDIA_TYPE)
+
+
 @app.put(
     "/projects/{project_id}/documents/{document_id}",
     response_model=Document,
@@ -206,35 +281,353 @@ def update_document_endpoint(
         doc.title = payload.title
         doc.description = payload.description
         # payload.blocks is List[Block]
-        doc.set_blocks(payload.blocks or [])
+        doc.set_blocks(payload.blocks or [], session)
+        # bumped in SQL, so concurrent updates never commit the same version
+        doc.version = DocumentModel.version + 1
+        reindex_document(session, doc)
+        reindex_footnotes(session, doc)
 
         session.add(doc)
         session.commit()
         session.refresh(doc)
 
-        return Document(
-            id=doc.id,
-            project_id=doc.project_id,
-            title=doc.title,
-            description=doc.description,
-            blocks=doc.get_blocks(),
-        )
+        return json_response(document_json(doc))
 
 
 @app.get(
     "/projects/{project_id}/documents/{document_id}/export/html",
     response_class=HTMLResponse,
 )
-def export_document_html(project_id: UUID, document_id: UUID) -> str:
+def export_document_html(project_id: str, document_id: str) -> str:
     """
     Export a single document as HTML using the v0 layout renderer.
     """
-    _ensure_project_exists(project_id)
-    doc = document_store.get_document(project_id, document_id)
-    if doc is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found",
+    from .layout import render_document_to_html
+
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        doc = session.get(DocumentModel, document_id)
+        if not doc or doc.project_id != project.id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found",
+            )
+        styles = get_project_styles(session, project.id)
+        links = document_links(
+            session,
+            doc,
+            lambda target: f"/projects/{project.id}/documents/{target}/export/html",
+        )
+        html = render_document_to_html(
+            Document(
+                id=doc.id,
+                project_id=doc.project_id,
+                title=doc.title,
+                description=doc.description,
+                blocks=doc.get_blocks(),
+            ),
+            styles,
+            links,
+            document_notes(session, doc.id),
         )
-    html = render_document_to_html(doc)
     return html
+
+
+@app.get(
+    "/projects/{project_id}/documents/{document_id}/footnotes",
+    response_model=List[Footnote],
+)
+def list_document_footnotes(project_id: str, document_id: str):
+    """
+    Footnote anchors in reading order, numbered as the renderer numbers
+    them (the first anchor of each note assigns its number).
+    """
+    with get_session() as session:
+        doc = _get_document_or_404(session, project_id, document_id)
+        anchors = footnotes_of(session, doc.id)
+    numbers: Dict[int, int] = {}
+    items = []
+    for anchor in anchors:
+        number = None
+        if anchor.note is not None:
+            number = numbers.setdefault(anchor.note, len(numbers) + 1)
+        items.append(
+            {
+                "label": anchor.label,
+                "anchor_block": anchor.block,
+                "start": anchor.start,
+                "end": anchor.end,
+                "note_block": anchor.note,
+                "number": number,
+            }
+        )
+    return json_response(dumps(items))
+
+
+# ---------------------------
+# Citation endpoints
+# ---------------------------
+
+def _citation_dict(c: CitationModel, target_document_id: Optional[str] = None) -> dict:
+    return {
+        "project_id": c.project_id,
+        "source_document_id": c.source_document_id,
+        "block_index": c.block_index,
+        "start": c.start,
+        "end": c.end,
+        "text": c.text,
+        "target_key": c.target_key,
+        "commentator": c.commentator,
+        "target_document_id": target_document_id,
+    }
+
+
+@app.get(
+    "/projects/{project_id}/documents/{document_id}/citations",
+    response_model=List[Citation],
+)
+def list_document_citations(project_id: str, document_id: str):
+    """
+    Citations found in this document, with the project document each
+    one resolves to (if any).
+    """
+    with get_session() as session:
+        doc = _get_document_or_404(session, project_id, document_id)
+        citations = citations_from(session, doc.id)
+        targets = resolve_targets(session, doc.project_id, citations)
+        return json_response(
+            dumps([_citation_dict(c, targets.get(c.id)) for c in citations])
+        )
+
+
+@app.get(
+    "/projects/{project_id}/documents/{document_id}/backlinks",
+    response_model=List[Citation],
+)
+def list_document_backlinks(project_id: str, document_id: str):
+    """
+    Citations, in any project, of the passage this document covers
+    (parsed from its title, e.g. "Shemot 12").
+    """
+    with get_session() as session:
+        doc = _get_document_or_404(session, project_id, document_id)
+        return json_response(
+            dumps([_citation_dict(c, doc.id) for c in backlinks(session, doc)])
+        )
+
+
+@app.get("/citations", response_model=List[Citation])
+def find_citations(ref: str, commentator: Optional[str] = None):
+    """
+    Who cites a passage: ?ref=Shemot 12:8 (or "Rashi on Shemot 12").
+    Without a commentator in ref or the query, citations of any
+    commentator on the passage are included. ?commentator= takes any of
+    the names the parser knows, in any case.
+    """
+    parsed = parse_reference(ref)
+    if parsed is None:
+        raise HTTPException(status_code=422, detail="Unrecognized reference")
+    if parsed.commentator is not None:
+        commentator = parsed.commentator
+    elif commentator is not None:
+        name, commentator = commentator, commentator_key(commentator)
+        if commentator is None:
+            raise HTTPException(status_code=422, detail=f"Unknown commentator: {name}")
+    with get_session() as session:
+        citations = citations_of(
+            session,
+            parsed.key,
+            commentator,
+            any_commentator=commentator is None,
+        )
+        return json_response(dumps([_citation_dict(c) for c in citations]))
+
+
+@app.get("/projects/{project_id}/statistics", response_model=ProjectStatistics)
+def get_project_statistics(
+    project_id: str,
+    measure_rem: Optional[float] = Query(default=None, gt=0, le=1000),
+    page_height_rem: Optional[float] = Query(default=None, gt=0, le=1000),
+):
+    """
+    Per-role glyph, word and estimated line counts and page estimates for
+    the whole project, computed in one batch and cached per project
+    version. measure_rem / page_height_rem set the text column width and
+    page height the estimate lays out against.
+    """
+    from .textstats import project_statistics
+
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        stats = project_statistics(session, project.id, measure_rem, page_height_rem)
+        return json_response(dumps(stats))
+
+
+@app.get("/projects/{project_id}/export/epub")
+def export_project_epub(project_id: str):
+    """
+    Export every document of a project as one EPUB 3 book, streamed.
+    """
+    from .epub import EPUB_MEDIA_TYPE, stream_project_epub
+
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        project_id = project.id
+
+    return StreamingResponse(
+        stream_project_epub(project_id),
+        media_type=EPUB_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{project_id}.epub"'
+        },
+    )
+
+
+@app.get("/projects/{project_id}/export/zip")
+def export_project_zip(project_id: str):
+    """
+    Export every document of a project as HTML files in one ZIP.
+
+    The files are kept between requests, so only documents changed since
+    the previous export are rendered again; the X-Export-* headers say
+    how many. Concurrent exports of a project take turns (see
+    batch_export.project_lock).
+    """
+    from .batch_export import EXPORT_DIR, archive_path, export_projects
+
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        project_id = project.id
+
+    stats = export_projects(
+        EXPORT_DIR, [project_id], fmt="zip", workers=1, progress_stream=None
+    )
+    # Opened here and streamed from the open file: a concurrent export
+    # may replace the archive (atomically) before the response is sent.
+    archive = open(archive_path(EXPORT_DIR, project_id), "rb")
+    return StreamingResponse(
+        _file_chunks(archive),
+        media_type="application/zip",
+        headers={
+            "Content-Length": str(os.fstat(archive.fileno()).st_size),
+            "Content-Disposition": f'attachment; filename="{project_id}.zip"',
+            "X-Export-Rendered": str(stats.rendered),
+            "X-Export-Reused": str(stats.skipped),
+            "X-Export-Removed": str(len(stats.removed)),
+        },
+    )
+
+
+def _file_chunks(f: BinaryIO, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+# ---------------------------
+# Change feed
+# ---------------------------
+
+@app.get("/changes", response_model=ChangeFeed)
+async def list_changes(
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    project_id: Optional[str] = None,
+    wait: float = Query(default=0, ge=0, le=MAX_WAIT),
+):
+    """
+    Ids and versions of projects and documents written after `since`, so
+    clients sync in O(changes) rather than re-fetching every document.
+    With wait > 0 this long-polls: an empty feed is held for up to `wait`
+    seconds until something changes.
+    """
+    def read():
+        with get_session() as session:
+            if project_id is not None:
+                _get_project_or_404(session, project_id)
+            return read_changes(session, since, limit, project_id)
+
+    deadline = time.monotonic() + wait
+    while True:
+        feed = await run_in_threadpool(read)
+        remaining = deadline - time.monotonic()
+        if feed["changes"] or remaining <= 0:
+            break
+        # changes outside project_id wake us too, hence the loop
+        if not await wait_for_change(feed["latest"], remaining):
+            break
+    return json_response(dumps(feed))
+
+
+# ---------------------------
+# Style template endpoints
+# ---------------------------
+
+def _project_styles_response(
+    project_id: str,
+    roles: dict,
+    styles: CompiledStyles,
+) -> ProjectStyles:
+    return ProjectStyles(
+        project_id=project_id,
+        version=styles.version,
+        roles=roles,
+        stylesheet=CompiledStylesheet(
+            name=styles.name,
+            href=f"/projects/{project_id}/styles/{styles.name}",
+            role_classes=styles.role_classes,
+        ),
+    )
+
+
+@app.get("/projects/{project_id}/styles", response_model=ProjectStyles)
+def get_project_styles_endpoint(project_id: str):
+    """
+    The project's style template plus where to load its compiled CSS.
+    """
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        template = session.get(StyleTemplateModel, project.id)
+        roles = template.roles if template else DEFAULT_ROLE_STYLES
+        styles = get_project_styles(session, project.id)
+        return _project_styles_response(project.id, roles or {}, styles)
+
+
+@app.put("/projects/{project_id}/styles", response_model=ProjectStyles)
+def update_project_styles_endpoint(project_id: str, payload: StyleTemplateUpdate):
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        roles = {
+            role: style.model_dump(exclude_none=True)
+            for role, style in payload.roles.items()
+        }
+        template = session.get(StyleTemplateModel, project.id)
+        if template is None:
+            template = StyleTemplateModel(project_id=project.id, roles=roles)
+        else:
+            template.roles = roles
+            template.version += 1
+        session.add(template)
+        session.commit()
+        session.refresh(template)
+
+        styles = get_project_styles(session, project.id)
+        return _project_styles_response(project.id, roles, styles)
+
+
+@app.get("/projects/{project_id}/styles/{name}")
+def get_project_stylesheet(project_id: str, name: str):
+    """
+    Compiled CSS for a project. The name embeds the content hash, so a
+    matching response can be cached forever; stale names 404.
+    """
+    with get_session() as session:
+        project = _get_project_or_404(session, project_id)
+        styles = get_project_styles(session, project.id)
+    if name != styles.name:
+        raise HTTPException(status_code=404, detail="Stylesheet not found")
+    return Response(
+        content=styles.css,
+        media_type="text/css",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
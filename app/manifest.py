@@ -0,0 +1,163 @@
+"""
+Export manifests: which input produced each exported file.
+
+Every exported document is recorded with:
+
+- content: a hash of everything in the document that reaches its
+  rendered output - title, description, blocks, citation links and
+  footnote placements;
+- styles: the hash of the project's compiled stylesheet;
+- renderer: layout.RENDERER_VERSION;
+- file: the exported file's name.
+
+The next export of the same project compares each document against its
+entry and re-renders only what changed, reusing the other files as they
+are. The manifest is a JSON file next to the exported files:
+
+    {"documents": {"<document id>": {"content": ..., "styles": ...,
+                                     "renderer": 1, "file": ...}}}
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .layout import RENDERER_VERSION, Links
+from .footnotes import Notes
+from .models import DocumentModel, block_list_hash
+
+MANIFEST_NAME = "manifest.json"
+
+# Why a document was (re-)rendered, most specific first.
+REASON_NEW = "new"
+REASON_CONTENT = "content"
+REASON_STYLES = "styles"
+REASON_RENDERER = "renderer"
+REASON_MISSING = "missing file"
+REASON_FORCED = "forced"
+
+
+def _blocks_digest(doc: DocumentModel) -> str:
+    if doc.blocks_hash is not None:
+        # already a content hash of the (hash) list
+        return doc.blocks_hash
+    packed = doc.get_packed_blocks()
+    if packed is None:
+        packed = json.dumps(doc.blocks or [], sort_keys=True).encode("utf-8")
+    return block_list_hash(packed)
+
+
+def content_hash(doc: DocumentModel, links: Links, notes: Notes) -> str:
+    """
+    Hash of every input to a document's rendered output, other than the
+    styles and the renderer itself.
+    """
+    payload = json.dumps(
+        [
+            doc.title,
+            doc.description,
+            _blocks_digest(doc),
+            sorted((index, list(map(list, spans))) for index, spans in links.items()),
+            sorted((index, list(map(list, spans))) for index, spans in notes.items()),
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Write via a temporary file in the same directory and rename, so
+    readers (and concurrent exports) never see a partial file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ExportManifest:
+    """
+    document id -> manifest entry, for one export directory.
+    """
+
+    def __init__(self, path: str, documents: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        self.path = path
+        self.documents: Dict[str, Dict[str, Any]] = documents or {}
+
+    @classmethod
+    def load(cls, directory: str, name: str = MANIFEST_NAME) -> "ExportManifest":
+        """
+        The manifest in `directory`; empty if missing or unreadable, which
+        just means everything is exported again.
+        """
+        path = os.path.join(directory, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(path, dict(data["documents"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls(path)
+
+    @property
+    def directory(self) -> str:
+        return os.path.dirname(self.path)
+
+    def stale_reason(self, document_id: str, content: str, styles: str) -> Optional[str]:
+        """
+        Why the document's exported file is out of date, or None if it
+        can be reused.
+        """
+        entry = self.documents.get(document_id)
+        if entry is None:
+            return REASON_NEW
+        if entry.get("content") != content:
+            return REASON_CONTENT
+        if entry.get("styles") != styles:
+            return REASON_STYLES
+        if entry.get("renderer") != RENDERER_VERSION:
+            return REASON_RENDERER
+        if not os.path.exists(os.path.join(self.directory, entry["file"])):
+            return REASON_MISSING
+        return None
+
+    def record(self, document_id: str, content: str, styles: str, file: str) -> None:
+        self.documents[document_id] = {
+            "content": content,
+            "styles": styles,
+            "renderer": RENDERER_VERSION,
+            "file": file,
+        }
+
+    def files(self) -> List[Tuple[str, str]]:
+        """
+        (document id, file name) for every entry, ordered by document id.
+        """
+        return [(doc_id, entry["file"]) for doc_id, entry in sorted(self.documents.items())]
+
+    def prune(self, present: Iterable[str]) -> List[str]:
+        """
+        Drop entries (and files) of documents that no longer exist.
+        Returns their ids.
+        """
+        keep = set(present)
+        removed = [doc_id for doc_id in self.documents if doc_id not in keep]
+        for doc_id in removed:
+            entry = self.documents.pop(doc_id)
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def save(self) -> None:
+        data = json.dumps({"documents": self.documents}, indent=1, sort_keys=True)
+        write_atomic(self.path, data.encode("utf-8"))
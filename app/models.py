@@ -1,13 +1,29 @@
-from __future__ import annotations
-
-from typing import Optional, List
-from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, JSON
+from typing import Any, Dict, Optional, List, Sequence, Tuple
+from sqlmodel import SQLModel, Field, Relationship, Session, select
+from sqlalchemy import Column, JSON, LargeBinary, delete, event, func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session as OrmSession, object_session
+from pydantic import TypeAdapter
+import hashlib
 import uuid
 
+from . import db
+from .blockstore import (
+    block_cache,
+    block_hash,
+    pack_hash_list,
+    payload_size,
+    text_measure,
+    unpack_hash_list,
+)
+from .codec import block_outline, decode_block_window, decode_blocks, encode_blocks
 from .schemas import Block  # pydantic union of TextBlock/ImageBlock
 
 
+_block_list = TypeAdapter(List[Block])
+
+
 def _uuid() -> str:
     return str(uuid.uuid4())
 
@@ -19,9 +35,237 @@ class ProjectModel(SQLModel, table=True):
     name: str
     description: Optional[str] = None
 
+    # Position in the change feed (app/changes.py); restamped by every
+    # flush that writes the row, see _stamp_change_seqs.
+    change_seq: int = Field(
+        default=0, index=True, sa_column_kwargs={"server_default": "0"}
+    )
+
     documents: List["DocumentModel"] = Relationship(back_populates="project")
 
 
+class BlockContentModel(SQLModel, table=True):
+    """
+    One block, stored once per distinct content (see app/blockstore.py).
+    """
+    __tablename__ = "block_contents"
+
+    # blockstore.block_hash of the fields below
+    hash: str = Field(primary_key=True)
+    kind: str
+    role: str
+    text: Optional[str] = None
+    src: Optional[str] = None
+    alt_text: Optional[str] = None
+    alignment: Optional[str] = None
+    # UTF-8 payload bytes, so outlines don't load the text
+    size: int
+    # blockstore.text_measure, for project statistics (app/textstats.py)
+    glyphs: int
+    words: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.kind == "text":
+            return {"kind": self.kind, "role": self.role, "text": self.text}
+        return {
+            "kind": self.kind,
+            "role": self.role,
+            "src": self.src,
+            "alt_text": self.alt_text,
+            "alignment": self.alignment,
+        }
+
+
+# Hashes per IN (...) query, under SQLite's bound parameter limit.
+HASH_QUERY_CHUNK = 500
+
+
+def store_blocks(session: Session, blocks: Sequence[Dict[str, Any]]) -> bytes:
+    """
+    Add any blocks not yet in block_contents; returns the packed hash
+    list (blockstore.pack_hash_list) referencing them in order.
+
+    Rows are inserted with ON CONFLICT DO NOTHING, so two saves adding
+    the same new block at once both succeed.
+    """
+    hashes = [block_hash(b) for b in blocks]
+    wanted = dict(zip(hashes, blocks))
+    unique = list(wanted)
+    for i in range(0, len(unique), HASH_QUERY_CHUNK):
+        chunk = unique[i:i + HASH_QUERY_CHUNK]
+        for existing in session.exec(
+            select(BlockContentModel.hash).where(BlockContentModel.hash.in_(chunk))
+        ):
+            del wanted[existing]
+    rows = []
+    for digest, block in wanted.items():
+        glyphs, words = text_measure(block)
+        rows.append(
+            {
+                "hash": digest,
+                "kind": block["kind"],
+                "role": block["role"],
+                "text": block.get("text"),
+                "src": block.get("src"),
+                "alt_text": block.get("alt_text"),
+                "alignment": block.get("alignment"),
+                "size": payload_size(block),
+                "glyphs": glyphs,
+                "words": words,
+            }
+        )
+        block_cache.put(digest, dict(block))
+    if rows:
+        session.execute(
+            sqlite_insert(BlockContentModel).on_conflict_do_nothing(), rows
+        )
+    return pack_hash_list(hashes)
+
+
+def load_blocks(session: Session, hashes: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Block dicts for `hashes`, in order; only blocks missing from the
+    in-process cache are read from the database.
+    """
+    found: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for digest in dict.fromkeys(hashes):
+        block = block_cache.get(digest)
+        if block is None:
+            missing.append(digest)
+        else:
+            found[digest] = block
+    for i in range(0, len(missing), HASH_QUERY_CHUNK):
+        chunk = missing[i:i + HASH_QUERY_CHUNK]
+        for row in session.exec(
+            select(BlockContentModel).where(BlockContentModel.hash.in_(chunk))
+        ):
+            found[row.hash] = block = row.to_dict()
+            block_cache.put(row.hash, block)
+    check_blocks_found(found, hashes)
+    return [dict(found[digest]) for digest in hashes]
+
+
+def check_blocks_found(found: Dict[str, Any], hashes: Sequence[str]) -> None:
+    """
+    Raise LookupError if any of `hashes` wasn't found in block_contents.
+    """
+    lost = [digest for digest in dict.fromkeys(hashes) if digest not in found]
+    if lost:
+        raise LookupError(
+            f"{len(lost)} block(s) of a stored block list are missing from "
+            f"block_contents (first: {lost[0]}); was prune_blocks run while "
+            "documents were being saved?"
+        )
+
+
+class BlockListModel(SQLModel, table=True):
+    """
+    A document's block list, stored once per distinct content and shared
+    by every document with those blocks - in particular by a project's
+    clones until they are edited. data is a packed hash list into
+    block_contents (see app/blockstore.py).
+    """
+    __tablename__ = "block_lists"
+
+    # blake2b-128 of data
+    hash: str = Field(primary_key=True)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+def block_list_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def store_block_list(session: Session, data: bytes) -> BlockListModel:
+    """
+    The shared row for a packed block list, added if new (ON CONFLICT DO
+    NOTHING, like store_blocks, for concurrent saves of the same list).
+    """
+    digest = block_list_hash(data)
+    session.execute(
+        sqlite_insert(BlockListModel)
+        .values(hash=digest, data=data)
+        .on_conflict_do_nothing()
+    )
+    return session.get(BlockListModel, digest)
+
+
+def block_shapes(session: Session, hashes: Sequence[str]) -> List[Tuple[str, str, int]]:
+    """
+    (kind, role, payload bytes) for each hash, without loading text.
+    """
+    unique = list(dict.fromkeys(hashes))
+    shapes: Dict[str, Tuple[str, str, int]] = {}
+    for i in range(0, len(unique), HASH_QUERY_CHUNK):
+        chunk = unique[i:i + HASH_QUERY_CHUNK]
+        rows = session.exec(
+            select(
+                BlockContentModel.hash,
+                BlockContentModel.kind,
+                BlockContentModel.role,
+                BlockContentModel.size,
+            ).where(BlockContentModel.hash.in_(chunk))
+        )
+        for digest, kind, role, size in rows:
+            shapes[digest] = (kind, role, size)
+    check_blocks_found(shapes, hashes)
+    return [shapes[digest] for digest in hashes]
+
+
+def prune_blocks(session: Session) -> Tuple[int, int]:
+    """
+    Mark-and-sweep for shared storage: delete block lists no document
+    references, then blocks no list references. Returns the number of
+    (lists, blocks) deleted. Edits only drop lists eagerly (see
+    release_block_list), so run this from time to time - it is
+    `python -m app.cli prune`. Commits.
+
+    Not safe alongside writes: blocks a save has stored but not yet
+    committed a document for look unreferenced and are deleted, and that
+    document then fails to load. Run it while the app is stopped or
+    read-only.
+    """
+    referenced = select(DocumentModel.blocks_hash).where(
+        DocumentModel.blocks_hash.is_not(None)
+    )
+    lists = session.execute(
+        delete(BlockListModel).where(BlockListModel.hash.not_in(referenced))
+    ).rowcount
+
+    live = set()
+    for data in session.exec(select(BlockListModel.data)):
+        live.update(unpack_hash_list(data))
+    dead = [
+        digest
+        for digest in session.exec(select(BlockContentModel.hash))
+        if digest not in live
+    ]
+    for i in range(0, len(dead), HASH_QUERY_CHUNK):
+        session.execute(
+            delete(BlockContentModel).where(
+                BlockContentModel.hash.in_(dead[i:i + HASH_QUERY_CHUNK])
+            )
+        )
+    session.commit()
+    return lists, len(dead)
+
+
+def release_block_list(session: Session, digest: str, holder: str) -> None:
+    """
+    Delete a shared block list once no document other than `holder`
+    references it.
+    """
+    others = session.exec(
+        select(func.count())
+        .select_from(DocumentModel)
+        .where(DocumentModel.blocks_hash == digest)
+        .where(DocumentModel.id != holder)
+    ).one()
+    if not others:
+        session.execute(delete(BlockListModel).where(BlockListModel.hash == digest))
+
+
 class DocumentModel(SQLModel, table=True):
     __tablename__ = "documents"
 
@@ -31,22 +275,247 @@ class DocumentModel(SQLModel, table=True):
     title: str
     description: Optional[str] = None
 
+    # Passage this document covers, parsed from its title (see
+    # app/references.py); citations into it resolve to this document.
+    ref_key: Optional[str] = Field(default=None, index=True)
+    ref_commentator: Optional[str] = None
+
+    # Bumped on every update; keys cached serializations of this document.
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    # Position in the change feed (app/changes.py); restamped by every
+    # flush that writes the row, see _stamp_change_seqs.
+    change_seq: int = Field(
+        default=0, index=True, sa_column_kwargs={"server_default": "0"}
+    )
+
     # JSON column storing a list of block dicts
     blocks: Optional[List[dict[str, Any]]] = Field(
         default=None,
         sa_column=Column(JSON, nullable=True),
     )
 
+    # Same list in the compact binary format (see app/codec.py).
+    # When set, it takes precedence over the JSON column.
+    blocks_packed: Optional[bytes] = Field(
+        default=None,
+        sa_column=Column(LargeBinary, nullable=True),
+    )
+
+    # Same list, packed and stored once in block_lists by content hash.
+    # Takes precedence over both inline columns.
+    blocks_hash: Optional[str] = Field(
+        default=None, foreign_key="block_lists.hash", index=True
+    )
+    block_list: Optional[BlockListModel] = Relationship(
+        sa_relationship_kwargs={"lazy": "joined"}
+    )
+
     project: Optional[ProjectModel] = Relationship(back_populates="documents")
 
+    def _block_hashes(self) -> Optional[List[str]]:
+        if self.block_list is None:
+            return None
+        return unpack_hash_list(self.block_list.data)
+
+    def _session(self) -> Session:
+        session = object_session(self)
+        if session is None:
+            raise RuntimeError(
+                "Blocks are stored by hash; read them while the document's "
+                "session is open"
+            )
+        return session
+
+    def get_packed_blocks(self) -> Optional[bytes]:
+        """
+        The blocks in the packed format (app/codec.py): as stored, or
+        encoded from block_contents. None for JSON rows.
+        """
+        if self._block_hashes() is not None:
+            return encode_blocks(self.get_block_dicts())
+        return self.blocks_packed
+
+    def get_block_dicts(self) -> List[dict[str, Any]]:
+        """
+        Blocks as plain dicts, without pydantic validation.
+        """
+        hashes = self._block_hashes()
+        if hashes is not None:
+            return load_blocks(self._session(), hashes)
+        packed = self.blocks_packed
+        if packed is not None:
+            return decode_blocks(packed)
+        return list(self.blocks or [])
+
+    def get_block_range(
+        self, offset: int, limit: int
+    ) -> Tuple[int, List[dict[str, Any]]]:
+        """
+        (total block count, plain-dict blocks[offset:offset + limit]).
+        Packed rows only decode the text of the requested window; shared
+        rows only load the blocks in it.
+        """
+        hashes = self._block_hashes()
+        if hashes is not None:
+            window = hashes[offset:offset + limit]
+            return len(hashes), load_blocks(self._session(), window)
+        packed = self.blocks_packed
+        if packed is not None:
+            return decode_block_window(packed, offset, offset + limit)
+        blocks = self.blocks or []
+        return len(blocks), list(blocks[offset:offset + limit])
+
+    def get_block_outline(self) -> List[Tuple[str, str, int]]:
+        """
+        (kind, role, payload bytes) per block, without decoding text when
+        the row is packed or loading it when the row is shared.
+        """
+        hashes = self._block_hashes()
+        if hashes is not None:
+            return block_shapes(self._session(), hashes)
+        packed = self.blocks_packed
+        if packed is not None:
+            return block_outline(packed)
+        outline = []
+        for b in self.blocks or []:
+            if b["kind"] == "text":
+                size = len((b.get("text") or "").encode("utf-8"))
+            else:
+                size = len(b["src"].encode("utf-8"))
+                size += len((b.get("alt_text") or "").encode("utf-8"))
+            outline.append((b["kind"], b["role"], size))
+        return outline
+
     def get_blocks(self) -> List[Block]:
-        if not self.blocks:
-            return []
-        # schemas.Block is a discriminated union; pydantic will validate each dict
-        from .schemas import Block as BlockUnion  # avoid cycle
+        # schemas.Block is a union; pydantic picks TextBlock/ImageBlock by kind
+        return _block_list.validate_python(self.get_block_dicts())
+
+    def set_blocks(self, blocks: List[Block], session: Optional[Session] = None) -> None:
+        """
+        Store blocks per db.BLOCK_STORAGE. "shared" needs the session to
+        look up the block_lists table; without one the list is packed
+        inline instead.
+        """
+        dumped = [b.model_dump() for b in blocks]
+        previous = self.blocks_hash
+        self.blocks = None
+        self.blocks_packed = None
+        self.blocks_hash = None
+        self.block_list = None
+
+        if db.BLOCK_STORAGE == "shared" and session is not None:
+            self.block_list = store_block_list(session, store_blocks(session, dumped))
+            self.blocks_hash = self.block_list.hash
+        elif db.BLOCK_STORAGE in ("shared", "packed"):
+            self.blocks_packed = encode_blocks(dumped)
+        else:
+            # store as plain dicts
+            self.blocks = dumped
+
+        # copy-on-write: the old list may still be shared with a clone
+        if session is not None and previous and previous != self.blocks_hash:
+            release_block_list(session, previous, self.id)
+
+
+class StyleTemplateModel(SQLModel, table=True):
+    __tablename__ = "style_templates"
+
+    project_id: str = Field(foreign_key="projects.id", primary_key=True)
+
+    # Bumped on every update; keys the compiled stylesheet cache.
+    version: int = Field(default=1)
+
+    # JSON column storing {role: RoleStyle dict}
+    roles: Optional[dict[str, Any]] = Field(
+        default=None,
+        sa_column=Column(JSON, nullable=True),
+    )
+
+
+class CitationModel(SQLModel, table=True):
+    """
+    One citation found in a text block (see app/references.py).
+    """
+    __tablename__ = "citations"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project_id: str = Field(foreign_key="projects.id", index=True)
+    source_document_id: str = Field(foreign_key="documents.id", index=True)
+    block_index: int
+    # offsets into the block's normalized text
+    start: int
+    end: int
+    text: str
+
+    # "book:chapter[:verse]", e.g. "shemot:12:8"
+    target_key: str = Field(index=True)
+    commentator: Optional[str] = None
+
+
+class FootnoteModel(SQLModel, table=True):
+    """
+    One footnote anchor and the note block it is bound to
+    (see app/footnotes.py).
+    """
+    __tablename__ = "footnotes"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    document_id: str = Field(foreign_key="documents.id", index=True)
+    label: str
+    anchor_block: int
+    # offsets into the anchor block's normalized text
+    start: int
+    end: int
+    # None: no footnote block carries this label
+    note_block: Optional[int] = None
+
+
+class ChangeCounterModel(SQLModel, table=True):
+    """
+    The last change sequence number handed out (a single row, id 1).
+    """
+    __tablename__ = "change_counter"
+
+    id: int = Field(default=1, primary_key=True)
+    value: int = 0
+
+
+def allocate_change_seqs(conn: Connection, count: int) -> int:
+    """
+    Reserve `count` consecutive change sequence numbers; returns the
+    first. The counter row is written inside the caller's transaction,
+    and SQLite holds the write lock from there until commit, so numbers
+    become visible in the order they were handed out.
+    """
+    counter = ChangeCounterModel.__table__
+    bumped = conn.execute(
+        update(counter)
+        .where(counter.c.id == 1)
+        .values(value=counter.c.value + count)
+    )
+    if bumped.rowcount == 0:
+        conn.execute(insert(counter).values(id=1, value=count))
+        return 1
+    last = conn.execute(select(counter.c.value).where(counter.c.id == 1)).scalar_one()
+    return last - count + 1
 
-        return [BlockUnion.model_validate(b) for b in self.blocks]
 
-    def set_blocks(self, blocks: List[Block]) -> None:
-        # store as plain dicts
-        self.blocks = [b.model_dump() for b in blocks]
+@event.listens_for(OrmSession, "before_flush")
+def _stamp_change_seqs(session: OrmSession, flush_context: Any, instances: Any) -> None:
+    """
+    Give every project and document row this flush inserts or updates the
+    next change sequence number.
+    """
+    tracked = (ProjectModel, DocumentModel)
+    changed = [obj for obj in session.new if isinstance(obj, tracked)]
+    changed += [
+        obj
+        for obj in session.dirty
+        if isinstance(obj, tracked) and session.is_modified(obj, include_collections=False)
+    ]
+    if not changed:
+        return
+    first = allocate_change_seqs(session.connection(), len(changed))
+    for offset, obj in enumerate(changed):
+        obj.change_seq = first + offset
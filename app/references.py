@@ -0,0 +1,385 @@
+"""
+Citation parsing and the cross-document reference index.
+
+Text blocks are scanned for citations like "Rashi on Shemot 12:8",
+"Exodus 12:8" or "רש"י על שמות יב:ח" when a document is saved, and
+each match is stored as a row in the `citations` table. Backlinks, "who
+cites this" queries and export hyperlinks are then index lookups instead
+of scans over every document's blocks.
+
+References are normalized to keys of the form "book:chapter[:verse]"
+(e.g. "shemot:12:8"), so "everything citing Shemot 12" is a key range
+query: key == "shemot:12" or "shemot:12:" <= key < "shemot:12;".
+
+A document whose title parses as a reference (e.g. "Shemot 12" or
+"Rashi on Shemot 12") is the target of citations inside that range.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, or_, update
+from sqlmodel import Session, select
+
+from .models import CitationModel, DocumentModel
+from .textprep import normalize_hebrew
+
+
+# canonical key -> (display name, chapters, aliases)
+BOOKS: Dict[str, Tuple[str, int, Tuple[str, ...]]] = {
+    "bereishit": ("Bereishit", 50, ("Bereishit", "Bereshit", "Genesis", "Gen", "בראשית")),
+    "shemot": ("Shemot", 40, ("Shemot", "Shemos", "Exodus", "שמות")),
+    "vayikra": ("Vayikra", 27, ("Vayikra", "Leviticus", "Lev", "ויקרא")),
+    "bamidbar": ("Bamidbar", 36, ("Bamidbar", "Numbers", "Num", "במדבר")),
+    "devarim": ("Devarim", 34, ("Devarim", "Deuteronomy", "Deut", "דברים")),
+    "yehoshua": ("Yehoshua", 24, ("Yehoshua", "Joshua", "יהושע")),
+    "shoftim": ("Shoftim", 21, ("Shoftim", "Judges", "שופטים")),
+    "yeshayahu": ("Yeshayahu", 66, ("Yeshayahu", "Isaiah", "ישעיהו", "ישעיה")),
+    "yirmiyahu": ("Yirmiyahu", 52, ("Yirmiyahu", "Jeremiah", "ירמיהו", "ירמיה")),
+    "yechezkel": ("Yechezkel", 48, ("Yechezkel", "Ezekiel", "יחזקאל")),
+    "tehillim": ("Tehillim", 150, ("Tehillim", "Psalms", "Psalm", "תהלים", "תהילים")),
+    "mishlei": ("Mishlei", 31, ("Mishlei", "Proverbs", "משלי")),
+    "iyov": ("Iyov", 42, ("Iyov", "Job", "איוב")),
+    "shir_hashirim": ("Shir HaShirim", 8, ("Shir HaShirim", "Song of Songs", "שיר השירים")),
+    "rut": ("Rut", 4, ("Rut", "Ruth", "רות")),
+    "eichah": ("Eichah", 5, ("Eichah", "Lamentations", "איכה")),
+    "kohelet": ("Kohelet", 12, ("Kohelet", "Ecclesiastes", "קהלת")),
+    "esther": ("Esther", 10, ("Esther", "אסתר")),
+    "daniel": ("Daniel", 12, ("Daniel", "דניאל")),
+}
+
+COMMENTATORS: Dict[str, Tuple[str, ...]] = {
+    "rashi": ("Rashi", 'רש"י', "רש״י"),
+    "ramban": ("Ramban", 'רמב"ן', "רמב״ן"),
+    "ibn_ezra": ("Ibn Ezra", "אבן עזרא"),
+    "rashbam": ("Rashbam", 'רשב"ם', "רשב״ם"),
+    "sforno": ("Sforno", "ספורנו"),
+    "or_hachaim": ("Or HaChaim", "Ohr HaChaim", "אור החיים"),
+    "onkelos": ("Onkelos", "אונקלוס"),
+}
+
+_BOOK_BY_ALIAS = {
+    alias: key for key, (_, _, aliases) in BOOKS.items() for alias in aliases
+}
+_COMMENTATOR_BY_ALIAS = {
+    alias: key for key, aliases in COMMENTATORS.items() for alias in aliases
+}
+_COMMENTATOR_BY_FOLDED = {
+    name.casefold(): key
+    for key, aliases in COMMENTATORS.items()
+    for name in (key, *aliases)
+}
+
+# Aliases that are also common words ("job", "numbers", "דברים" - things,
+# "שמות" - names). In running text, a bare Hebrew-letter chapter after one
+# of them is usually the next word ("דברים לא נאמרו"), so it only counts
+# with a verse or a geresh/gershayim.
+AMBIGUOUS_ALIASES = frozenset({"Job", "Numbers", "דברים", "שמות"})
+
+
+def _alternation(aliases: Iterable[str]) -> str:
+    # longest first so "Shir HaShirim" wins over a shorter prefix
+    ordered = sorted(aliases, key=len, reverse=True)
+    return "|".join(re.escape(a).replace(r"\ ", r"\s+") for a in ordered)
+
+
+_HEBREW_NUMBER = r"[א-ת]{1,3}[\"'׳״]?[א-ת]?"
+_NUMBER = rf"(?:\d{{1,3}}|{_HEBREW_NUMBER})"
+
+# Case-sensitive: English book names are capitalized, which keeps "the
+# numbers 12 and 14" or "his job 3 times" out of the index.
+_CITATION_RE = re.compile(
+    rf"(?<![\w])"
+    rf"(?:(?P<commentator>{_alternation(_COMMENTATOR_BY_ALIAS)})"
+    rf"\s+(?:on|to|על)\s+)?"
+    rf"(?P<book>{_alternation(_BOOK_BY_ALIAS)})\.?"
+    rf"\s+(?P<chapter>{_NUMBER})"
+    rf"(?:\s*[:,.]\s*(?P<verse>{_NUMBER}))?"
+    rf"(?![\w])"
+)
+
+_HEBREW_VALUES = dict(
+    zip(
+        "אבגדהוזחטיכלמנסעפצקרשת",
+        [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100,
+         200, 300, 400],
+    )
+)
+_HEBREW_VALUES.update({"ך": 20, "ם": 40, "ן": 50, "ף": 80, "ץ": 90})
+
+# Longest chapter (Tehillim 119). Chapters are bounded per book (BOOKS);
+# anything larger is a word that happens to follow a book name, e.g.
+# "שמות רבה".
+MAX_VERSE = 176
+_GERESH = "\"'׳״"
+
+
+def _parse_number(value: str, limit: int) -> Optional[int]:
+    if value.isdigit():
+        number = int(value)
+    else:
+        number = 0
+        for ch in value:
+            if ch in _GERESH:
+                continue
+            if ch not in _HEBREW_VALUES:
+                return None
+            number += _HEBREW_VALUES[ch]
+    return number if 0 < number <= limit else None
+
+
+class Citation(NamedTuple):
+    """
+    A parsed reference. start/end are offsets into the normalized text
+    (textprep.normalize_hebrew), which is what the renderer works on.
+    """
+    key: str
+    commentator: Optional[str]
+    start: int
+    end: int
+    text: str
+
+
+def _from_match(match: "re.Match[str]", in_text: bool = False) -> Optional[Citation]:
+    alias = re.sub(r"\s+", " ", match["book"])
+    book = _BOOK_BY_ALIAS.get(alias)
+    if book is None:
+        return None
+    chapter = _parse_number(match["chapter"], BOOKS[book][1])
+    if chapter is None:
+        return None
+    if (
+        in_text
+        and alias in AMBIGUOUS_ALIASES
+        and not match["commentator"]
+        and not match["verse"]
+        and not match["chapter"].isdigit()
+        and not any(ch in _GERESH for ch in match["chapter"])
+    ):
+        return None
+    key = f"{book}:{chapter}"
+    if match["verse"]:
+        verse = _parse_number(match["verse"], MAX_VERSE)
+        if verse is None:
+            return None
+        key += f":{verse}"
+
+    commentator = None
+    if match["commentator"]:
+        name = re.sub(r"\s+", " ", match["commentator"])
+        commentator = _COMMENTATOR_BY_ALIAS.get(name)
+    return Citation(key, commentator, match.start(), match.end(), match.group(0))
+
+
+def parse_citations(text: str) -> List[Citation]:
+    """
+    All citations in a block's text, with offsets into its normalized form.
+    """
+    text = normalize_hebrew(text)
+    citations = []
+    for match in _CITATION_RE.finditer(text):
+        citation = _from_match(match, in_text=True)
+        if citation is not None:
+            citations.append(citation)
+    return citations
+
+
+def parse_reference(text: str) -> Optional[Citation]:
+    """
+    Parse a string that is entirely one reference (a title, a query).
+    """
+    text = normalize_hebrew(text.strip())
+    match = _CITATION_RE.fullmatch(text)
+    return _from_match(match) if match else None
+
+
+def commentator_key(name: str) -> Optional[str]:
+    """
+    The COMMENTATORS key for a name as a user types it: any alias or key,
+    in any case ("Rashi", "rashi", 'רש"י', "ibn_ezra").
+    """
+    name = re.sub(r"\s+", " ", normalize_hebrew(name.strip())).casefold()
+    return _COMMENTATOR_BY_FOLDED.get(name)
+
+
+def key_prefixes(key: str) -> List[str]:
+    """
+    "shemot:12:8" -> ["shemot:12:8", "shemot:12"]; most specific first.
+    """
+    parts = key.split(":")
+    return [":".join(parts[:n]) for n in range(len(parts), 1, -1)]
+
+
+def _within(key: str):
+    """
+    SQL condition: citation target is `key` or inside it.
+    ";" sorts right after ":", bounding the range of sub-keys.
+    """
+    column = CitationModel.target_key
+    return or_(column == key, (column >= key + ":") & (column < key + ";"))
+
+
+# ---------------------------
+# Index maintenance + queries
+# ---------------------------
+
+def reindex_document(session: Session, doc: DocumentModel) -> None:
+    """
+    Refresh a document's title reference and its outgoing citations.
+    Call after set_blocks, before commit.
+    """
+    ref = parse_reference(doc.title or "")
+    doc.ref_key = ref.key if ref else None
+    doc.ref_commentator = ref.commentator if ref else None
+
+    session.execute(
+        delete(CitationModel).where(CitationModel.source_document_id == doc.id)
+    )
+    session.add_all(_citation_rows(doc))
+
+
+def _citation_rows(doc: DocumentModel) -> List[CitationModel]:
+    rows = []
+    for index, block in enumerate(doc.get_block_dicts()):
+        if block["kind"] != "text" or not block.get("text"):
+            continue
+        for citation in parse_citations(block["text"]):
+            rows.append(
+                CitationModel(
+                    project_id=doc.project_id,
+                    source_document_id=doc.id,
+                    block_index=index,
+                    start=citation.start,
+                    end=citation.end,
+                    text=citation.text,
+                    target_key=citation.key,
+                    commentator=citation.commentator,
+                )
+            )
+    return rows
+
+
+def backfill_citations(session: Session, batch_size: int = 200) -> int:
+    """
+    Index every document's title reference and citations, for documents
+    saved before the index existed (db.init_db calls this until it has
+    completed once). Title references are written with plain SQL so
+    the documents don't show up as changed in the change feed. Commits
+    per batch; returns the number of documents indexed.
+    """
+    ids = session.exec(select(DocumentModel.id).order_by(DocumentModel.id)).all()
+    for offset in range(0, len(ids), batch_size):
+        chunk = ids[offset:offset + batch_size]
+        session.execute(
+            delete(CitationModel).where(CitationModel.source_document_id.in_(chunk))
+        )
+        docs = session.exec(select(DocumentModel).where(DocumentModel.id.in_(chunk))).all()
+        for doc in docs:
+            ref = parse_reference(doc.title or "")
+            session.execute(
+                update(DocumentModel)
+                .where(DocumentModel.id == doc.id)
+                .values(
+                    ref_key=ref.key if ref else None,
+                    ref_commentator=ref.commentator if ref else None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            session.add_all(_citation_rows(doc))
+        session.commit()
+        session.expunge_all()
+    return len(ids)
+
+
+def citations_from(session: Session, document_id: str) -> List[CitationModel]:
+    return list(
+        session.exec(
+            select(CitationModel)
+            .where(CitationModel.source_document_id == document_id)
+            .order_by(CitationModel.block_index, CitationModel.start)
+        )
+    )
+
+
+def citations_of(
+    session: Session,
+    key: str,
+    commentator: Optional[str] = None,
+    any_commentator: bool = False,
+) -> List[CitationModel]:
+    """
+    Citations whose target is `key` or a passage inside it.
+    """
+    query = select(CitationModel).where(_within(key))
+    if not any_commentator:
+        query = query.where(CitationModel.commentator == commentator)
+    return list(session.exec(query.order_by(CitationModel.target_key)))
+
+
+def backlinks(session: Session, doc: DocumentModel) -> List[CitationModel]:
+    """
+    Citations pointing into the passage a document covers (by its title).
+    """
+    if not doc.ref_key:
+        return []
+    return [
+        c
+        for c in citations_of(session, doc.ref_key, doc.ref_commentator)
+        if c.source_document_id != doc.id
+    ]
+
+
+def resolve_targets(
+    session: Session,
+    project_id: str,
+    citations: Iterable[CitationModel],
+) -> Dict[int, str]:
+    """
+    Map citation ids to the id of the project document covering their
+    target (the one with the most specific matching title reference).
+    """
+    citations = list(citations)
+    wanted = {p for c in citations for p in key_prefixes(c.target_key)}
+    if not wanted:
+        return {}
+
+    rows = session.exec(
+        select(DocumentModel.id, DocumentModel.ref_key, DocumentModel.ref_commentator)
+        .where(DocumentModel.project_id == project_id)
+        .where(DocumentModel.ref_key.in_(wanted))
+    ).all()
+    by_key = {(key, commentator): doc_id for doc_id, key, commentator in rows}
+
+    resolved: Dict[int, str] = {}
+    for c in citations:
+        for prefix in key_prefixes(c.target_key):
+            doc_id = by_key.get((prefix, c.commentator))
+            if doc_id is not None:
+                resolved[c.id] = doc_id
+                break
+    return resolved
+
+
+def document_links(
+    session: Session,
+    doc: DocumentModel,
+    href_for: Callable[[str], Optional[str]],
+) -> Dict[int, List[Tuple[int, int, str]]]:
+    """
+    Hyperlinks for a document's citations, grouped by block index, as
+    (start, end, href) for the renderer. Citations that don't resolve to
+    a document in the same project are left as plain text.
+    """
+    citations = citations_from(session, doc.id)
+    targets = resolve_targets(session, doc.project_id, citations)
+    links: Dict[int, List[Tuple[int, int, str]]] = {}
+    for c in citations:
+        target = targets.get(c.id)
+        if target is None or target == doc.id:
+            continue
+        href = href_for(target)
+        if href is not None:
+            links.setdefault(c.block_index, []).append((c.start, c.end, href))
+    return links
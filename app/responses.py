@@ -0,0 +1,140 @@
+"""
+Pre-serialized JSON responses for projects and documents.
+
+Returning pydantic models from an endpoint makes FastAPI validate them
+against `response_model` and then run its generic JSON encoder, which for
+a document with thousands of blocks does the work twice. Here rows are
+dumped straight to bytes once (orjson if installed, pydantic-core
+otherwise) and documents' bytes are cached per (id, version), so repeat
+GETs of an unchanged document skip block decoding, validation and
+encoding altogether. The compact binary form (app/codec.py) is cached
+the same way.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from fastapi.responses import Response
+from pydantic_core import to_json
+
+from .codec import encode_blocks, encode_document
+from .models import DocumentModel, ProjectModel
+
+try:  # optional: roughly 2x faster than pydantic-core for plain dicts
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Serialize plain Python data (dicts, lists, str, ...) to JSON bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return to_json(value)
+
+
+class DocumentJSONCache:
+    """
+    Small LRU of serialized documents keyed by id.
+    Each entry remembers the document version it was built from, so a
+    bumped version (any update) simply misses and is rebuilt.
+    """
+
+    def __init__(self, max_entries: int = 512) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, document_id: str, version: int) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(document_id)
+            return entry[1]
+
+    def put(self, document_id: str, version: int, data: bytes) -> None:
+        with self._lock:
+            self._entries[document_id] = (version, data)
+            self._entries.move_to_end(document_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def reset(self) -> None:
+        """
+        Drop all cached documents. Used for tests.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+document_json_cache = DocumentJSONCache()
+document_packed_cache = DocumentJSONCache()
+
+
+def project_dict(project: ProjectModel) -> Dict[str, Any]:
+    return {
+        "id": project.id,
+        "name": project.name,
+        "description": project.description,
+    }
+
+
+def project_json(project: ProjectModel) -> bytes:
+    return dumps(project_dict(project))
+
+
+def document_json(doc: DocumentModel) -> bytes:
+    """
+    JSON bytes for a document, from the cache when its version matches.
+    Blocks are dumped as stored; they were validated when written.
+    """
+    version = doc.version
+    data = document_json_cache.get(doc.id, version)
+    if data is None:
+        data = dumps(
+            {
+                "id": doc.id,
+                "project_id": doc.project_id,
+                "title": doc.title,
+                "description": doc.description,
+                "blocks": doc.get_block_dicts(),
+            }
+        )
+        document_json_cache.put(doc.id, version, data)
+    return data
+
+
+def document_packed(doc: DocumentModel) -> bytes:
+    """
+    The document in the compact binary format (codec.encode_document),
+    from the cache when its version matches. Shared rows are loaded and
+    encoded on a miss; inline packed rows are wrapped as stored.
+    """
+    version = doc.version
+    data = document_packed_cache.get(doc.id, version)
+    if data is None:
+        blob = doc.get_packed_blocks()
+        if blob is None:
+            blob = encode_blocks(doc.blocks or [])
+        data = encode_document(doc.id, doc.project_id, doc.title, doc.description, blob)
+        document_packed_cache.put(doc.id, version, data)
+    return data
+
+
+def json_response(data: bytes, status_code: int = 200) -> Response:
+    return Response(
+        content=data, status_code=status_code, media_type="application/json"
+    )
+
+
+def json_array(items: Iterable[bytes]) -> bytes:
+    """
+    Join already-serialized JSON values into a JSON array.
+    """
+    return b"[" + b",".join(items) + b"]"
@@ -1,4 +1,4 @@
-from typing import Optional, List, Literal, Union
+from typing import Dict, Optional, List, Literal, Union
 from pydantic import BaseModel, Field
 from uuid import UUID, uuid4
 
@@ -24,6 +24,15 @@ class ProjectCreate(ProjectBase):
     pass
 
 
+class ProjectClone(BaseModel):
+    """
+    Optional overrides when cloning a project; the name defaults to
+    "<source name> (copy)" and the description to the source's.
+    """
+    name: Optional[str] = Field(default=None, min_length=1, max_length=200)
+    description: Optional[str] = Field(default=None, max_length=1000)
+
+
 class Project(ProjectBase):
     """
     Project as stored/returned by the API.
@@ -101,6 +110,12 @@ class DocumentCreate(DocumentBase):
     """
     blocks: List[Block] = Field(default_factory=list)
 
+class DocumentUpdate(DocumentBase):
+    """
+    Payload for replacing an existing document's title/description/blocks.
+    """
+    blocks: List[Block] = Field(default_factory=list)
+
 class Document(DocumentBase):
     """
     Document as stored/returned by the API.
@@ -115,4 +130,167 @@ class Document(DocumentBase):
         """
         Helper to create a new document with a fresh UUID bound to a project.
         """
-        return cls(id=uuid4(), project_id=project_id, **data)
\ No newline at end of file
+        return cls(id=uuid4(), project_id=project_id, **data)
+
+class BlockRange(BaseModel):
+    """
+    A window of a document's blocks, for clients that virtualize long
+    documents instead of loading every block.
+    """
+    document_id: UUID
+    version: int
+    total: int
+    offset: int
+    blocks: List[Block]
+
+class DocumentOutline(BaseModel):
+    """
+    Lightweight shape of a document: enough to size a virtualized list
+    before fetching any block content.
+    block_sizes[i] is the UTF-8 payload size of block i (text, or src + alt).
+    """
+    document_id: UUID
+    version: int
+    block_count: int
+    role_histogram: Dict[str, int]
+    block_sizes: List[int]
+
+class Citation(BaseModel):
+    """
+    A reference found in a text block, e.g. "Rashi on Shemot 12:8".
+    start/end index the block's normalized text.
+    target_key is "book:chapter[:verse]"; target_document_id is the
+    document covering that passage, when one is known.
+    """
+    project_id: UUID
+    source_document_id: UUID
+    block_index: int
+    start: int
+    end: int
+    text: str
+    target_key: str
+    commentator: Optional[str] = None
+    target_document_id: Optional[UUID] = None
+
+class Footnote(BaseModel):
+    """
+    A footnote anchor, e.g. "[^1]", and the footnote block it is bound to.
+    start/end index the anchor block's normalized text. number is the
+    note's number in the rendered page; note_block and number are None
+    when no footnote block carries the label.
+    """
+    label: str
+    anchor_block: int
+    start: int
+    end: int
+    note_block: Optional[int] = None
+    number: Optional[int] = None
+
+class Change(BaseModel):
+    """
+    A project or document written since the feed's `since`.
+    version is the document version (None for projects); seq is the
+    row's position in the change feed.
+    """
+    kind: Literal["project", "document"]
+    id: UUID
+    project_id: UUID
+    version: Optional[int] = None
+    seq: int
+
+class ChangeFeed(BaseModel):
+    """
+    One page of the change feed. Pass `cursor` as the next `since`;
+    `more` means another page is already waiting. latest is the last
+    sequence number handed out.
+    """
+    since: int
+    cursor: int
+    latest: int
+    more: bool
+    changes: List[Change]
+
+class RoleStatistics(BaseModel):
+    """
+    Totals for one block role. lines and height_rem are estimates for
+    the project's role styles; images count toward blocks.
+    """
+    blocks: int
+    images: int
+    glyphs: int
+    words: int
+    lines: int
+    height_rem: float
+
+class DocumentPages(BaseModel):
+    document_id: UUID
+    lines: int
+    pages: int
+
+class ProjectStatistics(BaseModel):
+    """
+    Glyph, word, line and page counts for a whole project, for print
+    planning (see app/textstats.py). version changes with any document
+    or style edit; measure_rem and page_height_rem are the page geometry
+    the estimate used.
+    """
+    project_id: UUID
+    version: str
+    documents: int
+    blocks: int
+    glyphs: int
+    words: int
+    lines: int
+    pages: int
+    measure_rem: float
+    page_height_rem: float
+    roles: Dict[str, RoleStatistics]
+    per_document: List[DocumentPages]
+
+# ---------------------------
+# Style Template Schemas
+# ---------------------------
+
+# Rejects anything that could close a declaration or rule in the
+# compiled stylesheet.
+_CSS_VALUE = r"^[^;{}<>\\]*$"
+
+
+class RoleStyle(BaseModel):
+    """
+    Typography for one block role. Unset properties are left to the
+    page defaults.
+    """
+    direction: Optional[Literal["rtl", "ltr"]] = None
+    text_align: Optional[Literal["left", "right", "center", "justify"]] = None
+    font_family: Optional[str] = Field(default=None, max_length=200, pattern=_CSS_VALUE)
+    font_size: Optional[str] = Field(default=None, max_length=40, pattern=_CSS_VALUE)
+    font_weight: Optional[str] = Field(default=None, max_length=40, pattern=_CSS_VALUE)
+    line_height: Optional[str] = Field(default=None, max_length=40, pattern=_CSS_VALUE)
+    color: Optional[str] = Field(default=None, max_length=40, pattern=_CSS_VALUE)
+
+
+class StyleTemplateUpdate(BaseModel):
+    """
+    Payload for replacing a project's style template.
+    """
+    roles: Dict[str, RoleStyle] = Field(default_factory=dict)
+
+
+class CompiledStylesheet(BaseModel):
+    """
+    Where to fetch a compiled template and which class each role maps to.
+    """
+    name: str
+    href: str
+    role_classes: Dict[str, str]
+
+
+class ProjectStyles(StyleTemplateUpdate):
+    """
+    A project's style template as returned by the API.
+    version is 0 while the project still uses the built-in defaults.
+    """
+    project_id: UUID
+    version: int
+    stylesheet: CompiledStylesheet
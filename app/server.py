@@ -0,0 +1,159 @@
+"""
+Production server entry point.
+
+    python -m app.server [--host 0.0.0.0] [--port 8000] [--workers N]
+
+With gunicorn installed the app is imported and its caches warmed once in
+the master process (preload), then `gc.freeze()` moves everything alive
+at that point out of the garbage collector's reach so forked workers
+share those pages copy-on-write instead of dirtying them on the first
+collection. Without gunicorn it falls back to uvicorn's own worker
+manager, which spawns fresh interpreters: every worker then imports and
+warms up on its own.
+
+Worker count defaults to WEB_CONCURRENCY, else one per CPU core (the
+expensive work - rendering, block decoding - is CPU-bound).
+"""
+
+from __future__ import annotations
+
+import time
+
+# Taken before anything heavy is imported, for the startup report.
+_process_start = time.perf_counter()
+
+import argparse
+import gc
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("app.server")
+
+
+def default_workers() -> int:
+    env = os.environ.get("WEB_CONCURRENCY")
+    if env:
+        return max(1, int(env))
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS/Windows
+        cores = os.cpu_count() or 1
+    return max(1, cores)
+
+
+def preload(hot_documents: int) -> Dict[str, float]:
+    """
+    Import the app and warm its caches in the current process.
+    Returns startup timings in milliseconds.
+    """
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    from .main import app  # noqa: F401
+
+    # Imported lazily by their endpoints; load them here so workers
+    # inherit them instead of paying for the import on first use.
+    from . import clone, epub, layout, textstats  # noqa: F401
+    timings["import"] = (time.perf_counter() - start) * 1000
+
+    from .warmup import warm_caches
+
+    timings.update(warm_caches(hot_documents=hot_documents))
+
+    # Forked workers must not reuse the master's SQLite connections.
+    from .db import engine
+
+    engine.dispose()
+
+    gc.collect()
+    gc.freeze()
+
+    timings["total"] = (time.perf_counter() - _process_start) * 1000
+    logger.info(
+        "preloaded in %s",
+        ", ".join(f"{k}={v:.1f}ms" for k, v in timings.items()),
+    )
+    return timings
+
+
+def _run_gunicorn(host: str, port: int, workers: int, hot_documents: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    try:
+        import uvicorn_worker  # noqa: F401
+
+        worker_class = "uvicorn_worker.UvicornWorker"
+    except ImportError:
+        worker_class = "uvicorn.workers.UvicornWorker"
+
+    class _Application(BaseApplication):
+        def load_config(self) -> None:
+            settings: Dict[str, Any] = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": worker_class,
+                "preload_app": True,
+                "post_fork": _post_fork,
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self) -> Any:
+            preload(hot_documents)
+            from .main import app
+
+            return app
+
+    _Application().run()
+
+
+def _post_fork(server: Any, worker: Any) -> None:
+    # Drop any connection opened in the master after preload.
+    from .db import engine
+
+    engine.dispose(close=False)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the Torah Layout Studio API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument(
+        "--hot-documents",
+        type=int,
+        default=int(os.environ.get("TORAH_LAYOUT_WARM_DOCUMENTS", "200")),
+        help="How many documents to pre-serialize at startup.",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+
+    if gunicorn is not None:
+        _run_gunicorn(args.host, args.port, args.workers, args.hot_documents)
+        return
+
+    import uvicorn
+
+    if args.workers == 1:
+        preload(args.hot_documents)
+    else:
+        logger.warning(
+            "gunicorn not installed; uvicorn workers start without preloading"
+        )
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
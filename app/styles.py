@@ -0,0 +1,176 @@
+"""
+Per-project style templates compiled into hash-named stylesheets.
+
+A template maps block roles to a handful of typography properties. It is
+compiled once per (project, template version) into:
+
+- a minified CSS string, named by its content hash so it can be served
+  with immutable caching,
+- a role -> CSS class lookup table used by the HTML renderer and the
+  frontend editor.
+
+Projects without a stored template use DEFAULT_ROLE_STYLES.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, Mapping, Optional
+
+from sqlmodel import Session
+
+from .models import StyleTemplateModel
+from .schemas import RoleStyle
+
+
+# Mirrors the role styles the editor and exporter shipped with.
+DEFAULT_ROLE_STYLES: Dict[str, Dict[str, str]] = {
+    "haggadah_main_hebrew": {
+        "direction": "rtl",
+        "text_align": "right",
+        "font_size": "1.1rem",
+        "line_height": "1.7",
+    },
+    "haggadah_translation_en": {
+        "direction": "ltr",
+        "text_align": "left",
+        "font_size": "1rem",
+        "line_height": "1.6",
+    },
+    "commentary_en": {
+        "font_size": "0.95rem",
+        "line_height": "1.6",
+        "color": "#374151",
+    },
+    "commentary_he": {
+        "direction": "rtl",
+        "text_align": "right",
+        "font_size": "0.95rem",
+        "line_height": "1.6",
+    },
+    "footnote_en": {
+        "font_size": "0.8rem",
+        "line_height": "1.3",
+        "color": "#4b5563",
+    },
+    "footnote_he": {
+        "direction": "rtl",
+        "text_align": "right",
+        "font_size": "0.8rem",
+        "line_height": "1.3",
+        "color": "#4b5563",
+    },
+}
+
+# Text elements a role style applies to: <p> in exported HTML and the
+# editor's textarea in the frontend.
+ROLE_TARGETS = ("p", ".block-textarea")
+
+_INVALID_CLASS_CHARS = re.compile(r"[^A-Za-z0-9_-]")
+
+
+@dataclass(frozen=True)
+class CompiledStyles:
+    version: int
+    hash: str
+    css: str
+    role_classes: Dict[str, str]
+
+    @property
+    def name(self) -> str:
+        return f"styles-{self.hash}.css"
+
+    def class_for(self, role: Optional[str]) -> str:
+        """
+        CSS class for a block role; unknown roles still get a stable class.
+        """
+        if not role:
+            return "block-role-default"
+        return self.role_classes.get(role) or role_class(role)
+
+
+def role_class(role: str) -> str:
+    return "block-role-" + _INVALID_CLASS_CHARS.sub("_", role)
+
+
+def minify_css(css: str) -> str:
+    """
+    Strip comments and insignificant whitespace. Good enough for the
+    hand-written stylesheets in this app; not a general CSS minifier.
+    """
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def compile_styles(
+    roles: Mapping[str, Mapping[str, Optional[str]]],
+    version: int = 0,
+) -> CompiledStyles:
+    """
+    Compile a role -> RoleStyle mapping into minified CSS + class table.
+    Roles are emitted in sorted order so equal templates hash equally.
+    """
+    role_classes: Dict[str, str] = {}
+    rules = []
+    for role in sorted(roles):
+        style = RoleStyle.model_validate(roles[role])
+        cls = role_class(role)
+        role_classes[role] = cls
+
+        declarations = ";".join(
+            f"{prop.replace('_', '-')}:{value}"
+            for prop, value in style.model_dump(exclude_none=True).items()
+        )
+        if not declarations:
+            continue
+        selector = ",".join(f".{cls} {target}" for target in ROLE_TARGETS)
+        rules.append(f"{selector}{{{declarations}}}")
+
+    css = "".join(rules)
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:16]
+    return CompiledStyles(
+        version=version, hash=digest, css=css, role_classes=role_classes
+    )
+
+
+# ---------------------------
+# Per-project cache
+# ---------------------------
+
+_compiled: Dict[str, CompiledStyles] = {}
+_compiled_lock = Lock()
+
+default_styles = compile_styles(DEFAULT_ROLE_STYLES)
+
+
+def get_project_styles(session: Session, project_id: str) -> CompiledStyles:
+    """
+    Compiled styles for a project, recompiled only when its template
+    version changes.
+    """
+    template = session.get(StyleTemplateModel, project_id)
+    if template is None:
+        return default_styles
+
+    with _compiled_lock:
+        cached = _compiled.get(project_id)
+        if cached is not None and cached.version == template.version:
+            return cached
+
+    compiled = compile_styles(template.roles or {}, version=template.version)
+    with _compiled_lock:
+        _compiled[project_id] = compiled
+    return compiled
+
+
+def reset_cache() -> None:
+    """
+    Forget compiled project styles. Used for tests.
+    """
+    with _compiled_lock:
+        _compiled.clear()
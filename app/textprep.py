@@ -0,0 +1,301 @@
+"""
+Text preparation stage: Hebrew normalization, bidi resolution and
+segmentation into line-breakable runs.
+
+`prepare_text` is pure (text in, PreparedText out) and memoized by a hash
+of the input, so every render and any later layout/pagination pass over
+the same text reuses one analysis.
+
+Bidi resolution follows the Unicode Bidirectional Algorithm (UAX #9) for
+a single paragraph without explicit embeddings: P2-P3 for the base
+direction, W1-W7 for weak types, N1-N2 for neutrals and I1-I2 for levels.
+Explicit formatting characters are treated as neutrals, which is enough
+for block text typed into the editor.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import List, Optional, Tuple
+
+
+# ---------------------------
+# Hebrew mark ordering
+# ---------------------------
+
+# Canonical (NFC) order sorts marks by combining class, which puts vowels
+# before dagesh and shin/sin dots. Hebrew fonts expect: shin/sin dot,
+# dagesh/rafe, vowel, meteg, then ta'amim (cantillation).
+_SHIN_DOTS = {"\u05c1", "\u05c2"}
+_DAGESH = {"\u05bc", "\u05bf"}  # dagesh/mapiq, rafe
+_VOWELS = {chr(c) for c in range(0x05B0, 0x05BC)} | {"\u05c7"}  # + qamats qatan
+_METEG = {"\u05bd"}
+_TAAMIM = {chr(c) for c in range(0x0591, 0x05B0)} | {"\u05c4", "\u05c5"}
+
+
+def _mark_rank(ch: str) -> int:
+    if ch in _SHIN_DOTS:
+        return 0
+    if ch in _DAGESH:
+        return 1
+    if ch in _VOWELS:
+        return 2
+    if ch in _METEG:
+        return 3
+    if ch in _TAAMIM:
+        return 4
+    return 5
+
+
+def normalize_hebrew(text: str) -> str:
+    """
+    NFC-normalize, then reorder each letter's combining marks into the
+    order Hebrew fonts shape correctly (see _mark_rank). The result is
+    canonically equivalent to the input.
+    """
+    text = unicodedata.normalize("NFC", text)
+    out: List[str] = []
+    marks: List[str] = []
+    for ch in text:
+        if unicodedata.combining(ch):
+            marks.append(ch)
+            continue
+        if marks:
+            out.extend(sorted(marks, key=_mark_rank))
+            marks = []
+        out.append(ch)
+    if marks:
+        out.extend(sorted(marks, key=_mark_rank))
+    return "".join(out)
+
+
+# ---------------------------
+# Bidi resolution
+# ---------------------------
+
+_L, _R, _EN, _AN, _ES, _ET, _CS, _N = "L", "R", "EN", "AN", "ES", "ET", "CS", "N"
+
+
+def _bidi_type(ch: str) -> str:
+    t = unicodedata.bidirectional(ch)
+    if t == "L":
+        return _L
+    if t in ("R", "AL"):
+        return _R
+    if t in (_EN, _AN, _ES, _ET, _CS, "NSM"):
+        return t
+    return _N
+
+
+def base_level(text: str) -> int:
+    """
+    Paragraph level from the first strong character (P2-P3); 0 = LTR.
+    """
+    for ch in text:
+        t = unicodedata.bidirectional(ch)
+        if t == "L":
+            return 0
+        if t in ("R", "AL"):
+            return 1
+    return 0
+
+
+def resolve_levels(text: str, paragraph_level: Optional[int] = None) -> List[int]:
+    """
+    Embedding level of each character: even = LTR, odd = RTL.
+    """
+    if paragraph_level is None:
+        paragraph_level = base_level(text)
+    sos = _R if paragraph_level % 2 else _L
+    types = [_bidi_type(ch) for ch in text]
+    n = len(types)
+
+    # W1: NSM takes the type of the preceding character
+    prev = sos
+    for i, t in enumerate(types):
+        if t == "NSM":
+            types[i] = prev
+        prev = types[i]
+
+    # W2 (AL handling is folded into R) and W4: a single separator
+    # between two numbers of the same kind joins them
+    for i in range(1, n - 1):
+        if types[i] == _ES and types[i - 1] == _EN and types[i + 1] == _EN:
+            types[i] = _EN
+        elif (
+            types[i] == _CS
+            and types[i - 1] == types[i + 1]
+            and types[i - 1] in (_EN, _AN)
+        ):
+            types[i] = types[i - 1]
+
+    # W5: terminators (%, $, ...) adjacent to European numbers become EN
+    i = 0
+    while i < n:
+        if types[i] != _ET:
+            i += 1
+            continue
+        j = i
+        while j < n and types[j] == _ET:
+            j += 1
+        if (i > 0 and types[i - 1] == _EN) or (j < n and types[j] == _EN):
+            for k in range(i, j):
+                types[k] = _EN
+        i = j
+
+    # W6: remaining separators and terminators are neutral
+    for i, t in enumerate(types):
+        if t in (_ES, _ET, _CS):
+            types[i] = _N
+
+    # W7: European numbers in a left-to-right context are L
+    last_strong = sos
+    for i, t in enumerate(types):
+        if t in (_L, _R):
+            last_strong = t
+        elif t == _EN and last_strong == _L:
+            types[i] = _L
+
+    # N1-N2: neutrals between same-direction strongs take that direction,
+    # otherwise the embedding direction. Numbers count as R here.
+    eos = sos
+    i = 0
+    while i < n:
+        if types[i] != _N:
+            i += 1
+            continue
+        j = i
+        while j < n and types[j] == _N:
+            j += 1
+        before = sos if i == 0 else (_L if types[i - 1] == _L else _R)
+        after = eos if j == n else (_L if types[j] == _L else _R)
+        resolved = before if before == after else sos
+        for k in range(i, j):
+            types[k] = resolved
+        i = j
+
+    # I1-I2: implicit levels
+    levels: List[int] = []
+    even = paragraph_level % 2 == 0
+    for t in types:
+        if even:
+            bump = 1 if t == _R else 2 if t in (_EN, _AN) else 0
+        else:
+            bump = 1 if t in (_L, _EN, _AN) else 0
+        levels.append(paragraph_level + bump)
+    return levels
+
+
+# ---------------------------
+# Prepared text
+# ---------------------------
+
+# Break opportunities: after whitespace, and after maqaf (Hebrew hyphen).
+_BREAK_AFTER = {" ", "\t", "\n", "\u05be", "\u200b"}
+
+
+@dataclass(frozen=True)
+class Run:
+    """
+    A slice [start, end) of PreparedText.text at one embedding level.
+    For segments, can_break marks a line-break opportunity after it.
+    """
+    start: int
+    end: int
+    level: int
+    can_break: bool = False
+
+    @property
+    def is_rtl(self) -> bool:
+        return self.level % 2 == 1
+
+
+@dataclass(frozen=True)
+class PreparedText:
+    text: str
+    base_level: int
+    runs: Tuple[Run, ...]
+    segments: Tuple[Run, ...]
+
+    @property
+    def is_rtl(self) -> bool:
+        return self.base_level % 2 == 1
+
+    def slice(self, run: Run) -> str:
+        return self.text[run.start:run.end]
+
+
+def _analyze(text: str) -> PreparedText:
+    text = normalize_hebrew(text)
+    paragraph_level = base_level(text)
+    levels = resolve_levels(text, paragraph_level)
+
+    runs: List[Run] = []
+    segments: List[Run] = []
+    run_start = seg_start = 0
+    for i, ch in enumerate(text):
+        last = i + 1 == len(text)
+        level_change = not last and levels[i + 1] != levels[i]
+        breakable = ch in _BREAK_AFTER
+        if last or level_change or breakable:
+            segments.append(Run(seg_start, i + 1, levels[i], breakable))
+            seg_start = i + 1
+        if last or level_change:
+            runs.append(Run(run_start, i + 1, levels[i]))
+            run_start = i + 1
+
+    return PreparedText(
+        text=text,
+        base_level=paragraph_level,
+        runs=tuple(runs),
+        segments=tuple(segments),
+    )
+
+
+class _PreparedTextCache:
+    """
+    LRU of PreparedText keyed by a digest of the input text.
+    """
+
+    def __init__(self, max_entries: int = 8192) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, PreparedText]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, text: str) -> PreparedText:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prepared
+            self.misses += 1
+
+        prepared = _analyze(text)
+        with self._lock:
+            self._entries[key] = prepared
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return prepared
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+prepared_text_cache = _PreparedTextCache()
+
+
+def prepare_text(text: str) -> PreparedText:
+    """
+    Normalized text with bidi runs and line-breakable segments, memoized.
+    """
+    return prepared_text_cache.get_or_build(text)
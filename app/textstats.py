@@ -0,0 +1,463 @@
+"""
+Project text statistics and layout pre-measurement for print planning.
+
+Glyph, word, line and page counts per role across a whole project are
+computed in one batch instead of loading documents one by one:
+
+- every distinct block is measured once, when it is stored (glyphs and
+  words in block_contents, see blockstore.text_measure). Measurements
+  are also kept in memory by block hash, so after the first call only
+  newly written blocks are read;
+- a project's blocks become parallel integer arrays (role, glyphs,
+  words, image flag, document) gathered straight from its block lists,
+  and lines, heights and pages are computed over the whole arrays, with
+  NumPy when it is installed and the standard library otherwise;
+- results are cached per project version: its style hash, document
+  count and highest change_seq (see app/changes.py), plus the page
+  geometry asked for.
+
+The estimates are typographic rules of thumb, not a layout pass: an
+average glyph advance per text direction, the role's font size and line
+height from the style template, and a fixed height per image. Every
+document starts on a new page.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+try:  # optional: vectorized measurement
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on environment
+    np = None
+
+from .blockstore import HashLRU, text_measure, unpack_hash_list
+from .codec import decode_blocks
+from .models import (
+    HASH_QUERY_CHUNK,
+    BlockContentModel,
+    BlockListModel,
+    DocumentModel,
+    StyleTemplateModel,
+    check_blocks_found,
+)
+from .styles import DEFAULT_ROLE_STYLES, get_project_styles
+
+# Page geometry defaults, in rem: the text column of the exported .page
+# (800px less 1.5rem padding on each side) and a page about 1.4x as
+# tall as it is wide.
+MEASURE_REM = 47.0
+PAGE_HEIGHT_REM = 66.0
+
+# Document title and description at the top of its first page.
+HEADER_REM = 3.0
+# .block margin-bottom, and the height given to each image block.
+BLOCK_GAP_REM = 0.75
+IMAGE_HEIGHT_REM = 12.0
+
+# Average advance of one glyph, in em, by text direction, and of a space.
+GLYPH_ADVANCE_EM = {"ltr": 0.5, "rtl": 0.55}
+SPACE_ADVANCE_EM = 0.25
+
+DEFAULT_FONT_REM = 1.0
+DEFAULT_LINE_HEIGHT = 1.5
+
+_LENGTH_RE = re.compile(r"^\s*(\d*\.?\d+)\s*(rem|em|px|pt|%)?\s*$")
+_UNIT_REM = {"rem": 1.0, "em": 1.0, "px": 1 / 16, "pt": 1 / 12, "%": 1 / 100}
+
+
+# ---------------------------
+# Role typography
+# ---------------------------
+
+@dataclass(frozen=True)
+class RoleMetrics:
+    font_rem: float
+    line_height: float  # multiple of the font size
+    advance_em: float
+
+
+def _length(value: Optional[str]) -> Optional[Tuple[float, Optional[str]]]:
+    match = _LENGTH_RE.match(value or "")
+    if match is None:
+        return None
+    return float(match.group(1)), match.group(2)
+
+
+def role_metrics(style: Mapping[str, Optional[str]]) -> RoleMetrics:
+    """
+    Font size (rem), line height and glyph advance for one role style.
+    Values the estimate cannot read (e.g. "larger", calc()) fall back to
+    the page defaults.
+    """
+    font_rem = DEFAULT_FONT_REM
+    size = _length(style.get("font_size"))
+    if size is not None and size[1] is not None and size[0] > 0:
+        font_rem = size[0] * _UNIT_REM[size[1]]
+
+    line_height = DEFAULT_LINE_HEIGHT
+    height = _length(style.get("line_height"))
+    if height is not None and height[0] > 0:
+        value, unit = height
+        if unit is None:
+            line_height = value
+        elif unit == "%":
+            line_height = value / 100
+        else:
+            line_height = value * _UNIT_REM[unit] / font_rem
+
+    direction = style.get("direction") or "ltr"
+    return RoleMetrics(font_rem, line_height, GLYPH_ADVANCE_EM.get(direction, 0.5))
+
+
+# ---------------------------
+# Gathering
+# ---------------------------
+
+# (role, glyphs, words, is image) by block hash
+Measurement = Tuple[str, int, int, bool]
+measurement_cache: HashLRU[Measurement] = HashLRU(max_entries=131072)
+
+# Role name <-> small int, shared by every cached column so a project's
+# columns are assembled by concatenation alone.
+_role_ids: Dict[str, int] = {}
+_role_names: List[str] = []
+_role_lock = Lock()
+
+
+def _role_id(role: str) -> int:
+    with _role_lock:
+        index = _role_ids.get(role)
+        if index is None:
+            index = _role_ids[role] = len(_role_names)
+            _role_names.append(role)
+        return index
+
+
+class _BlockColumns(NamedTuple):
+    """
+    One entry per block, as parallel packed arrays.
+    """
+    role: array
+    glyphs: array
+    words: array
+    image: array
+
+    @classmethod
+    def build(cls, measurements: Iterable[Measurement]) -> "_BlockColumns":
+        columns = cls(array("i"), array("q"), array("q"), array("b"))
+        for role, glyphs, words, image in measurements:
+            columns.role.append(_role_id(role))
+            columns.glyphs.append(glyphs)
+            columns.words.append(words)
+            columns.image.append(image)
+        return columns
+
+
+# Columns of shared block lists, by list hash.
+list_cache: HashLRU[_BlockColumns] = HashLRU(max_entries=8192)
+
+
+@dataclass
+class _Columns:
+    """
+    Every block of a project: _BlockColumns plus the index of the
+    document each block belongs to. roles maps role ids to names.
+    """
+    roles: List[str]
+    document_ids: List[str]
+    blocks: _BlockColumns
+    document: array
+
+
+def _measure_stored(session: Session, digests: Sequence[str]) -> Dict[str, Measurement]:
+    """
+    digest -> measurement, from the cache or block_contents.
+    """
+    measured: Dict[str, Measurement] = {}
+    missing: List[str] = []
+    for digest in digests:
+        cached = measurement_cache.get(digest)
+        if cached is None:
+            missing.append(digest)
+        else:
+            measured[digest] = cached
+
+    for i in range(0, len(missing), HASH_QUERY_CHUNK):
+        chunk = missing[i:i + HASH_QUERY_CHUNK]
+        rows = session.exec(
+            select(
+                BlockContentModel.hash,
+                BlockContentModel.kind,
+                BlockContentModel.role,
+                BlockContentModel.glyphs,
+                BlockContentModel.words,
+            ).where(BlockContentModel.hash.in_(chunk))
+        )
+        for digest, kind, role, glyphs, words in rows:
+            measured[digest] = (role, glyphs, words, kind != "text")
+            measurement_cache.put(digest, measured[digest])
+    return measured
+
+
+def _inline_columns(packed: Optional[bytes], blocks: Optional[List[Dict[str, Any]]]) -> _BlockColumns:
+    dicts = decode_blocks(packed) if packed is not None else (blocks or [])
+    return _BlockColumns.build(
+        (b["role"], *text_measure(b), b["kind"] != "text") for b in dicts
+    )
+
+
+def _shared_columns(session: Session, list_hashes: Sequence[str]) -> Dict[str, _BlockColumns]:
+    """
+    Columns for shared block lists, from the cache or built from the
+    lists' digests and block_contents measurements (no text is loaded).
+    """
+    found: Dict[str, _BlockColumns] = {}
+    missing: List[str] = []
+    for digest in list_hashes:
+        cached = list_cache.get(digest)
+        if cached is None:
+            missing.append(digest)
+        else:
+            found[digest] = cached
+
+    hash_lists: Dict[str, List[str]] = {}
+    for i in range(0, len(missing), HASH_QUERY_CHUNK):
+        chunk = missing[i:i + HASH_QUERY_CHUNK]
+        rows = session.exec(
+            select(BlockListModel.hash, BlockListModel.data)
+            .where(BlockListModel.hash.in_(chunk))
+        )
+        for digest, data in rows:
+            hash_lists[digest] = unpack_hash_list(data)
+
+    wanted = list({h: None for hashes in hash_lists.values() for h in hashes})
+    measured = _measure_stored(session, wanted) if wanted else {}
+    check_blocks_found(measured, wanted)
+    for digest, hashes in hash_lists.items():
+        found[digest] = _BlockColumns.build(measured[h] for h in hashes)
+        list_cache.put(digest, found[digest])
+    return found
+
+
+def gather(session: Session, project_id: str) -> _Columns:
+    """
+    Every block of every document in the project, in document id order.
+    Shared block lists come from list_cache, so after the first call only
+    lists written since are read; inline (packed or JSON) rows are
+    decoded and measured here.
+    """
+    documents = session.exec(
+        select(DocumentModel.id, DocumentModel.blocks_hash)
+        .where(DocumentModel.project_id == project_id)
+        .order_by(DocumentModel.id)
+    ).all()
+    shared = _shared_columns(
+        session, list({digest: None for _, digest in documents if digest is not None})
+    )
+    inline = {
+        doc_id: _inline_columns(packed, blocks)
+        for doc_id, packed, blocks in session.exec(
+            select(DocumentModel.id, DocumentModel.blocks_packed, DocumentModel.blocks)
+            .where(DocumentModel.project_id == project_id)
+            .where(DocumentModel.blocks_hash.is_(None))
+        )
+    }
+
+    columns = _Columns([], [], _BlockColumns.build(()), array("i"))
+    for doc_index, (doc_id, digest) in enumerate(documents):
+        blocks = shared[digest] if digest is not None else inline[doc_id]
+        columns.document_ids.append(doc_id)
+        for combined, part in zip(columns.blocks, blocks):
+            combined.extend(part)
+        columns.document.extend(array("i", [doc_index]) * len(blocks.role))
+    with _role_lock:
+        columns.roles = list(_role_names)
+    return columns
+
+
+# ---------------------------
+# Estimates
+# ---------------------------
+
+def _estimate_numpy(columns: _Columns, metrics: Sequence[RoleMetrics], measure_rem: float):
+    n_roles, n_docs = len(columns.roles), len(columns.document_ids)
+    role = np.frombuffer(columns.blocks.role, dtype=np.int32)
+    glyphs = np.frombuffer(columns.blocks.glyphs, dtype=np.int64)
+    words = np.frombuffer(columns.blocks.words, dtype=np.int64)
+    image = np.frombuffer(columns.blocks.image, dtype=np.int8).astype(bool)
+    document = np.frombuffer(columns.document, dtype=np.int32)
+
+    font = np.array([m.font_rem for m in metrics])[role]
+    line_height = np.array([m.line_height for m in metrics])[role]
+    advance = np.array([m.advance_em for m in metrics])[role]
+
+    width_rem = font * (glyphs * advance + np.maximum(words - 1, 0) * SPACE_ADVANCE_EM)
+    lines = np.ceil(width_rem / measure_rem)
+    lines = np.where(image, 0, np.where(glyphs > 0, np.maximum(lines, 1), 0))
+    height = np.where(image, IMAGE_HEIGHT_REM, lines * font * line_height) + BLOCK_GAP_REM
+
+    def per_role(values):
+        return np.bincount(role, weights=values, minlength=n_roles).tolist()
+
+    return (
+        np.bincount(role, minlength=n_roles).tolist(),
+        per_role(image),
+        per_role(glyphs),
+        per_role(words),
+        per_role(lines),
+        per_role(height),
+        np.bincount(document, weights=lines, minlength=n_docs).tolist(),
+        np.bincount(document, weights=height, minlength=n_docs).tolist(),
+    )
+
+
+def _estimate_python(columns: _Columns, metrics: Sequence[RoleMetrics], measure_rem: float):
+    n_roles, n_docs = len(columns.roles), len(columns.document_ids)
+    blocks, images = [0] * n_roles, [0] * n_roles
+    glyph_sum, word_sum = [0] * n_roles, [0] * n_roles
+    line_sum, height_sum = [0.0] * n_roles, [0.0] * n_roles
+    doc_lines, doc_height = [0.0] * n_docs, [0.0] * n_docs
+
+    for role, glyphs, words, image, document in zip(*columns.blocks, columns.document):
+        m = metrics[role]
+        if image:
+            lines, height = 0, IMAGE_HEIGHT_REM
+        else:
+            width_rem = m.font_rem * (glyphs * m.advance_em + max(words - 1, 0) * SPACE_ADVANCE_EM)
+            lines = max(math.ceil(width_rem / measure_rem), 1) if glyphs > 0 else 0
+            height = lines * m.font_rem * m.line_height
+        height += BLOCK_GAP_REM
+        blocks[role] += 1
+        images[role] += image
+        glyph_sum[role] += glyphs
+        word_sum[role] += words
+        line_sum[role] += lines
+        height_sum[role] += height
+        doc_lines[document] += lines
+        doc_height[document] += height
+    return blocks, images, glyph_sum, word_sum, line_sum, height_sum, doc_lines, doc_height
+
+
+def estimate(
+    columns: _Columns,
+    roles: Mapping[str, Mapping[str, Optional[str]]],
+    measure_rem: float = MEASURE_REM,
+    page_height_rem: float = PAGE_HEIGHT_REM,
+) -> Dict[str, Any]:
+    """
+    Per-role and per-document totals for gathered blocks, given the
+    project's role styles.
+    """
+    metrics = [role_metrics(roles.get(role) or {}) for role in columns.roles]
+    compute = _estimate_numpy if np is not None else _estimate_python
+    (blocks, images, glyphs, words, lines, heights,
+     doc_lines, doc_heights) = compute(columns, metrics, measure_rem)
+
+    per_document = []
+    for doc_id, doc_line_count, height in zip(columns.document_ids, doc_lines, doc_heights):
+        pages = max(math.ceil((HEADER_REM + height) / page_height_rem), 1)
+        per_document.append(
+            {"document_id": doc_id, "lines": int(doc_line_count), "pages": pages}
+        )
+
+    per_role = {
+        role: {
+            "blocks": int(blocks[i]),
+            "images": int(images[i]),
+            "glyphs": int(glyphs[i]),
+            "words": int(words[i]),
+            "lines": int(lines[i]),
+            "height_rem": round(heights[i], 2),
+        }
+        for i, role in enumerate(columns.roles)
+        if blocks[i]
+    }
+    return {
+        "documents": len(columns.document_ids),
+        "blocks": len(columns.blocks.role),
+        "glyphs": sum(r["glyphs"] for r in per_role.values()),
+        "words": sum(r["words"] for r in per_role.values()),
+        "lines": sum(r["lines"] for r in per_role.values()),
+        "pages": sum(d["pages"] for d in per_document),
+        "measure_rem": measure_rem,
+        "page_height_rem": page_height_rem,
+        "roles": per_role,
+        "per_document": per_document,
+    }
+
+
+# ---------------------------
+# Per-project cache
+# ---------------------------
+
+_cache: "OrderedDict[Tuple[Any, ...], Dict[str, Any]]" = OrderedDict()
+_cache_lock = Lock()
+CACHE_ENTRIES = 64
+
+
+def project_version(session: Session, project_id: str) -> str:
+    """
+    Changes whenever anything the statistics depend on does: a document
+    is added, edited or removed, or the style template is updated.
+    """
+    count, last_seq = session.exec(
+        select(func.count(), func.max(DocumentModel.change_seq))
+        .where(DocumentModel.project_id == project_id)
+    ).one()
+    styles = get_project_styles(session, project_id)
+    return f"{styles.hash}-{count}-{last_seq or 0}"
+
+
+def project_statistics(
+    session: Session,
+    project_id: str,
+    measure_rem: Optional[float] = None,
+    page_height_rem: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Statistics for a project, computed only when its version (or the
+    geometry asked for) changed since the last call. Geometry defaults to
+    MEASURE_REM x PAGE_HEIGHT_REM.
+    """
+    measure_rem = measure_rem or MEASURE_REM
+    page_height_rem = page_height_rem or PAGE_HEIGHT_REM
+    version = project_version(session, project_id)
+    key = (project_id, version, measure_rem, page_height_rem)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    template = session.get(StyleTemplateModel, project_id)
+    roles = (template.roles if template else DEFAULT_ROLE_STYLES) or {}
+    stats = {
+        "project_id": project_id,
+        "version": version,
+        **estimate(gather(session, project_id), roles, measure_rem, page_height_rem),
+    }
+    with _cache_lock:
+        _cache[key] = stats
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return stats
+
+
+def reset_cache() -> None:
+    """
+    Forget cached statistics and measurements. Used for tests.
+    """
+    with _cache_lock:
+        _cache.clear()
+    measurement_cache.reset()
+    list_cache.reset()
@@ -0,0 +1,104 @@
+"""
+Size and encode/decode time of the packed block format vs. JSON.
+
+    python -m benchmarks.block_codec --blocks 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+from app.codec import decode_blocks, encode_blocks, zstandard
+
+
+ROLES = [
+    "haggadah_main_hebrew",
+    "haggadah_translation_en",
+    "commentary_en",
+    "commentary_he",
+    "footnote_en",
+    "footnote_he",
+]
+
+HEBREW_WORDS = "הָא לַחְמָא עַנְיָא דִּי אֲכָלוּ אַבְהָתָנָא בְּאַרְעָא דְמִצְרָיִם".split()
+ENGLISH_WORDS = (
+    "this is the bread of affliction that our fathers ate in the land of egypt"
+).split()
+
+
+def make_blocks(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    blocks: List[Dict[str, Any]] = []
+    for i in range(count):
+        if i % 25 == 24:
+            blocks.append(
+                {
+                    "kind": "image",
+                    "role": "archaeology_fig",
+                    "src": f"/images/fig_{i:05d}.jpg",
+                    "alt_text": "Excavation photo.",
+                    "alignment": "block",
+                }
+            )
+            continue
+        role = rng.choice(ROLES)
+        words = HEBREW_WORDS if role.endswith("he") or "hebrew" in role else ENGLISH_WORDS
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(5, 60)))
+        blocks.append({"kind": "text", "role": role, "text": text})
+    return blocks
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    blocks = make_blocks(args.blocks)
+
+    rows = []
+    as_json = json.dumps(blocks, ensure_ascii=False).encode("utf-8")
+    rows.append(
+        (
+            "json",
+            len(as_json),
+            _time(lambda: json.dumps(blocks, ensure_ascii=False).encode("utf-8"), args.repeat),
+            _time(lambda: json.loads(as_json), args.repeat),
+        )
+    )
+
+    variants = [None, "zlib"] + (["zstd"] if zstandard is not None else [])
+    for compression in variants:
+        packed = encode_blocks(blocks, compression=compression)
+        assert decode_blocks(packed) == blocks
+        rows.append(
+            (
+                f"packed/{compression or 'raw'}",
+                len(packed),
+                _time(lambda: encode_blocks(blocks, compression=compression), args.repeat),
+                _time(lambda: decode_blocks(packed), args.repeat),
+            )
+        )
+
+    print(f"{args.blocks} blocks, best of {args.repeat}")
+    print(f"{'format':<14}{'bytes':>12}{'ratio':>8}{'encode ms':>12}{'decode ms':>12}")
+    for name, size, enc, dec in rows:
+        ratio = size / len(as_json)
+        print(f"{name:<14}{size:>12,}{ratio:>8.2f}{enc:>12.2f}{dec:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Render snapshot and performance regression check.
+
+    python -m benchmarks.render_snapshot            # check against baseline
+    python -m benchmarks.render_snapshot --update   # accept current output
+
+Renders a fixed corpus through every layout mode and compares against
+benchmarks/render_baseline.json:
+
+- output: sha256 of each rendered page must match exactly, so any change
+  to the markup shows up (and has to be accepted with --update);
+- time: each render is timed between two runs of a fixed calibration
+  loop (text and block caches cleared each run), and the median ratio of
+  render to calibration time over --repeat runs is compared, so machine
+  speed and load drift cancel out. A case fails past --threshold only
+  when it is also slower by more than its noise (the spread of its
+  ratios, in the baseline or now) and by more than MIN_SIGNIFICANT_MS;
+- memory: tracemalloc peak per render; fails past --threshold (only
+  checked on the Python version the baseline was recorded with).
+
+tests/test_render_snapshot.py runs the output check with the test suite.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.layout import (
+    Links,
+    render_document_to_html,
+    render_document_to_xhtml,
+    rendered_block_cache,
+)
+from app.references import parse_citations
+from app.schemas import Document
+from app.styles import CompiledStyles, compile_styles, default_styles
+from app.textprep import prepared_text_cache
+
+from .block_codec import make_blocks
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "render_baseline.json")
+
+# Regressions below this many (calibrated) milliseconds are noise.
+MIN_SIGNIFICANT_MS = 1.0
+
+# A regression must exceed this many interquartile ranges of the
+# render/calibration ratio (the larger of baseline and current) to count.
+NOISE_IQRS = 1.5
+
+RENDERERS: Dict[str, Callable[..., str]] = {
+    "html": render_document_to_html,
+    "xhtml": render_document_to_xhtml,
+}
+
+# (document, styles, links)
+Case = Tuple[Document, CompiledStyles, Links]
+
+
+# ---------------------------
+# Corpus
+# ---------------------------
+
+def _document(n: int, title: str, blocks: List[Dict[str, Any]], **fields: Any) -> Document:
+    return Document(
+        id=f"00000000-0000-0000-0000-{n:012d}",
+        project_id="00000000-0000-0000-0000-000000000000",
+        title=title,
+        blocks=blocks,
+        **fields,
+    )
+
+
+def _text(role: str, text: str) -> Dict[str, Any]:
+    return {"kind": "text", "role": role, "text": text}
+
+
+def _citation_links(doc: Document) -> Links:
+    links: Links = {}
+    for index, block in enumerate(doc.blocks):
+        text = getattr(block, "text", None)
+        if text:
+            found = parse_citations(text)
+            if found:
+                links[index] = [(c.start, c.end, f"#{c.key}") for c in found]
+    return links
+
+
+def corpus() -> Dict[str, Case]:
+    """
+    Fixed documents covering each renderer feature. Changing this
+    changes the baseline.
+    """
+    seder = _document(
+        1,
+        "Ha Lachma Anya",
+        [
+            _text("haggadah_main_hebrew", "הָא לַחְמָא עַנְיָא דִּי אֲכָלוּ אַבְהָתָנָא"),
+            _text("haggadah_translation_en", "This is the bread of affliction."),
+            _text("commentary_he", "ראה עמוד 12 ו-3.5 (COVID-19) בספר Rashi."),
+            _text("commentary_en", "Mixed: אבא said 40 years & <more>."),
+            _text("commentary_he", ""),
+        ],
+        description="Bidi, nikud & escaping",
+    )
+    notes = _document(
+        2,
+        "Yachatz",
+        [
+            _text("commentary_en", "Break the middle matzah[^1] and hide it[^afikoman]."),
+            _text("footnote_en", "[^1] The larger piece."),
+            _text("commentary_he", "בוצעים[^1] את המצה[^missing]"),
+            _text("footnote_he", "[^afikoman] אפיקומן"),
+            _text("footnote_en", "Unanchored note."),
+        ],
+    )
+    citations = _document(
+        3,
+        "Citations",
+        [
+            _text("commentary_en", "See Exodus 12:8, and Rashi on Shemot 12:8."),
+            _text("commentary_he", 'עיין רש"י על שמות יב:ח ובמדבר ט:יא'),
+        ],
+    )
+    images = _document(
+        4,
+        "Figures",
+        [
+            {"kind": "image", "role": "archaeology_fig", "src": "/images/oven.jpg",
+             "alt_text": "Oven \"A\" & kiln", "alignment": "left"},
+            {"kind": "image", "role": "archaeology_fig", "src": "/images/b.jpg",
+             "alt_text": None, "alignment": None},
+            {"kind": "image", "role": "fig", "src": "", "alt_text": None,
+             "alignment": "right"},
+        ],
+    )
+    long_mixed = _document(5, "Long", make_blocks(2000, seed=1))
+    styled = _document(6, "Styled", make_blocks(200, seed=2))
+    custom = compile_styles(
+        {
+            "commentary_en": {"font_family": "Georgia, serif", "line_height": "1.4"},
+            "footnote_he": {"direction": "rtl", "font_size": "0.8rem"},
+        },
+        version=1,
+    )
+    return {
+        "seder": (seder, default_styles, {}),
+        "footnotes": (notes, default_styles, {}),
+        "citations": (citations, default_styles, _citation_links(citations)),
+        "images": (images, default_styles, {}),
+        "long_mixed": (long_mixed, default_styles, {}),
+        "styled": (styled, custom, {}),
+    }
+
+
+# ---------------------------
+# Measurements
+# ---------------------------
+
+def render(case: Case, mode: str) -> str:
+    doc, styles, links = case
+    return RENDERERS[mode](doc, styles, links=links)
+
+
+def digest(output: str) -> str:
+    return hashlib.sha256(output.encode("utf-8")).hexdigest()
+
+
+def snapshot(cases: Optional[Dict[str, Case]] = None) -> Dict[str, str]:
+    """
+    "case/mode" -> output hash, for every case and layout mode.
+    """
+    cases = corpus() if cases is None else cases
+    return {
+        f"{name}/{mode}": digest(render(case, mode))
+        for name, case in cases.items()
+        for mode in RENDERERS
+    }
+
+
+def _reset_caches() -> None:
+    prepared_text_cache.reset()
+    rendered_block_cache.reset()
+
+
+def _calibration_work() -> None:
+    parts = []
+    for i in range(200_000):
+        parts.append(str(i))
+    "".join(parts).encode("utf-8")
+
+
+def _run_ms(fn: Callable[[], Any]) -> float:
+    _reset_caches()
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Tuple[List[float], List[float]]:
+    """
+    (render ms, render / calibration ratio) per run. Calibration runs
+    before and after every render, and each ratio uses the mean of the
+    two, so load that comes and goes during the measurement affects both
+    sides alike.
+    """
+    times: List[float] = []
+    ratios: List[float] = []
+    before = _run_ms(_calibration_work)
+    for _ in range(repeat):
+        elapsed = _run_ms(fn)
+        after = _run_ms(_calibration_work)
+        times.append(elapsed)
+        ratios.append(elapsed / ((before + after) / 2))
+        before = after
+    return times, ratios
+
+
+def _iqr(values: List[float]) -> float:
+    if len(values) < 2:
+        return 0.0
+    q1, _, q3 = statistics.quantiles(values, n=4)
+    return q3 - q1
+
+
+def calibrate(repeat: int = 11) -> float:
+    """
+    Median time of a fixed pure-Python workload, the unit render times
+    are expressed in.
+    """
+    return statistics.median(_run_ms(_calibration_work) for _ in range(repeat))
+
+
+def measure(repeat: int = 11) -> Dict[str, Any]:
+    """
+    Hashes, timings and memory peaks for the whole corpus.
+    """
+    cases = corpus()
+    timings: Dict[str, float] = {}
+    ratios: Dict[str, float] = {}
+    noise: Dict[str, float] = {}
+    peaks: Dict[str, int] = {}
+    for name, case in cases.items():
+        for mode in RENDERERS:
+            key = f"{name}/{mode}"
+            times, runs = _timed(lambda: render(case, mode), repeat)
+            timings[key] = round(statistics.median(times), 3)
+            ratios[key] = round(statistics.median(runs), 6)
+            noise[key] = round(_iqr(runs), 6)
+
+            _reset_caches()
+            tracemalloc.start()
+            render(case, mode)
+            peaks[key] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+
+    return {
+        "python": "{}.{}".format(*sys.version_info[:2]),
+        "calibration_ms": round(calibrate(repeat), 3),
+        "hashes": snapshot(cases),
+        "timings_ms": timings,
+        "ratios": ratios,
+        "noise": noise,
+        "peak_kib": peaks,
+    }
+
+
+def calibrated_ms(baseline: Dict[str, Any], current: Dict[str, Any], key: str) -> float:
+    """
+    A current render time in baseline milliseconds: its ratio to the
+    calibration loop times the baseline's calibration time.
+    """
+    return current["ratios"][key] * baseline["calibration_ms"]
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float,
+    check_time: bool = True,
+    check_memory: bool = True,
+) -> List[str]:
+    """
+    Human-readable failures; empty when current is within the baseline.
+    """
+    failures: List[str] = []
+
+    for key, expected in baseline["hashes"].items():
+        actual = current["hashes"].get(key)
+        if actual is None:
+            failures.append(f"{key}: missing from current corpus")
+        elif actual != expected:
+            failures.append(f"{key}: output changed ({expected[:12]} -> {actual[:12]})")
+    for key in current["hashes"].keys() - baseline["hashes"].keys():
+        failures.append(f"{key}: not in baseline")
+
+    if check_time:
+        unit = baseline["calibration_ms"]
+        for key, expected_ratio in baseline["ratios"].items():
+            if key not in current["ratios"]:
+                continue
+            expected = expected_ratio * unit
+            actual = calibrated_ms(baseline, current, key)
+            noise = NOISE_IQRS * max(baseline["noise"][key], current["noise"][key]) * unit
+            if (
+                actual > expected * threshold
+                and actual - expected > max(noise, MIN_SIGNIFICANT_MS)
+            ):
+                failures.append(
+                    f"{key}: {actual:.2f}ms (calibrated) vs baseline {expected:.2f}ms"
+                    f" (noise {noise:.2f}ms)"
+                )
+
+    # allocation sizes differ between interpreter versions
+    if check_memory and baseline.get("python") == current.get("python"):
+        for key, expected in baseline["peak_kib"].items():
+            actual = current["peak_kib"].get(key)
+            if actual is not None and actual > max(expected * threshold, expected + 64):
+                failures.append(f"{key}: peak {actual} KiB vs baseline {expected} KiB")
+
+    return failures
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="Write a new baseline.")
+    parser.add_argument("--repeat", type=int, default=11)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Allowed ratio over the baseline for time and memory.",
+    )
+    parser.add_argument("--no-time", action="store_true", help="Skip the timing check.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    current = measure(args.repeat)
+
+    if args.update:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"wrote {args.baseline} ({len(current['hashes'])} renders)")
+        return
+
+    baseline = load_baseline(args.baseline)
+    print(f"{'render':<22}{'ms':>10}{'base ms':>10}{'KiB':>8}{'base KiB':>10}")
+    unit = baseline["calibration_ms"]
+    for key in current["hashes"]:
+        print(
+            f"{key:<22}{calibrated_ms(baseline, current, key):>10.2f}"
+            f"{baseline['ratios'].get(key, float('nan')) * unit:>10.2f}"
+            f"{current['peak_kib'][key]:>8}{baseline['peak_kib'].get(key, 0):>10}"
+        )
+
+    failures = compare(baseline, current, args.threshold, check_time=not args.no_time)
+    if failures:
+        print("\nFAILED:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nok")
+
+
+if __name__ == "__main__":
+    main()
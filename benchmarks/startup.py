@@ -0,0 +1,112 @@
+"""
+Cold-start report: import time by package and time to a ready app.
+
+    python -m benchmarks.startup [--module app.main] [--top 15]
+
+Each measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules. "ready" is import + init_db(), first against an empty
+database (tables created) and then against the same database again
+(schema fingerprint matches, create_all skipped).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+_READY_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from app.db import init_db
+applied = init_db()
+ready = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "init_db_ms": (ready - imported) * 1000,
+    "schema_applied": applied,
+}}))
+"""
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """
+    (module, self us, cumulative us) from `python -X importtime`.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """
+    Self time summed per top-level package, in microseconds.
+    """
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return dict(totals)
+
+
+def time_to_ready(module: str, database_url: str) -> Dict[str, float]:
+    env = dict(os.environ, TORAH_LAYOUT_DATABASE_URL=database_url)
+    proc = subprocess.run(
+        [sys.executable, "-c", _READY_SCRIPT.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total = next((cum for name, _, cum in rows if name == args.module), 0)
+    print(f"import {args.module}: {total / 1000:.1f}ms\n")
+
+    print(f"{'package':<24}{'self ms':>10}{'share':>8}")
+    packages = sorted(by_package(rows).items(), key=lambda kv: kv[1], reverse=True)
+    for name, self_us in packages[:args.top]:
+        share = self_us / total if total else 0
+        print(f"{name:<24}{self_us / 1000:>10.1f}{share:>8.0%}")
+
+    print(f"\n{'slowest modules (self)':<48}{'ms':>8}")
+    for name, self_us, _ in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{name:<48}{self_us / 1000:>8.1f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = "sqlite:///" + os.path.join(tmp, "startup.db")
+        print(f"\n{'start':<12}{'import ms':>12}{'init_db ms':>12}{'schema':>10}")
+        for label in ("empty db", "warm db"):
+            ready = time_to_ready(args.module, url)
+            print(
+                f"{label:<12}{ready['import_ms']:>12.1f}{ready['init_db_ms']:>12.1f}"
+                f"{'applied' if ready['schema_applied'] else 'skipped':>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,14 @@ import {
   fetchDocuments,
   createDocument,
   fetchDocument,
+  fetchChanges,
   updateDocument,
   getDocumentHtmlUrl,
+  fetchProjectStyles,
+  getStylesheetUrl,
+  roleClass,
 } from "./api";
-import type { Project, Document, Block } from "./api";
+import type { Project, Document, Block, CompiledStylesheet } from "./api";
 
 // Preset styles (will eventually be project-specific)
 const TEXT_STYLES = [
@@ -45,6 +49,11 @@ function App() {
     null
   );
 
+  // Compiled role styles for selected project
+  const [stylesheet, setStylesheet] = useState<CompiledStylesheet | null>(
+    null
+  );
+
   // Documents for selected project
   const [documents, setDocuments] = useState<Document[]>([]);
   const [documentsLoading, setDocumentsLoading] = useState(false);
@@ -84,21 +93,63 @@ function App() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
-  // Whenever selectedProjectId changes, load documents for it
+  // Load the project's compiled stylesheet (shared with the HTML export)
   useEffect(() => {
-    const loadDocs = async () => {
+    if (!selectedProjectId) {
+      setStylesheet(null);
+      return;
+    }
+    let cancelled = false;
+    fetchProjectStyles(selectedProjectId)
+      .then((styles) => {
+        if (!cancelled) setStylesheet(styles.stylesheet);
+      })
+      .catch((err: any) => {
+        if (!cancelled) setError(err.message || "Failed to load styles");
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [selectedProjectId]);
+
+  useEffect(() => {
+    if (!stylesheet) return;
+    const link = window.document.createElement("link");
+    link.rel = "stylesheet";
+    link.href = getStylesheetUrl(stylesheet);
+    window.document.head.appendChild(link);
+    return () => {
+      link.remove();
+    };
+  }, [stylesheet]);
+
+  // Whenever selectedProjectId changes, load documents for it, then follow
+  // the change feed and re-fetch only the documents written since,
+  // instead of reloading the whole list.
+  useEffect(() => {
+    const abort = new AbortController();
+
+    const loadDocs = async (): Promise<number | null> => {
       if (!selectedProjectId) {
         setDocuments([]);
         setSelectedDocumentId(null);
         setDocEditorTitle("");
         setDocEditorDescription("");
         setDocBlocks([]);
-        return;
+        return null;
       }
       try {
         setDocumentsLoading(true);
         setError(null);
+        // Take the feed cursor before loading, so writes that land while
+        // the list loads are still picked up by the follower.
+        const start = await fetchChanges({
+          projectId: selectedProjectId,
+          limit: 1,
+          signal: abort.signal,
+        });
         const data = await fetchDocuments(selectedProjectId);
+        if (abort.signal.aborted) return null;
         setDocuments(data);
         // If selected document no longer belongs to this project, clear it
         if (
@@ -110,14 +161,60 @@ function App() {
           setDocEditorDescription("");
           setDocBlocks([]);
         }
+        return start.latest;
       } catch (err: any) {
-        setError(err.message || "Failed to load documents");
+        if (!abort.signal.aborted) {
+          setError(err.message || "Failed to load documents");
+        }
+        return null;
       } finally {
         setDocumentsLoading(false);
       }
     };
-    loadDocs();
-  }, [selectedProjectId, selectedDocumentId]);
+
+    const follow = async (projectId: string, since: number) => {
+      try {
+        while (!abort.signal.aborted) {
+          const feed = await fetchChanges({
+            since,
+            projectId,
+            wait: 25,
+            signal: abort.signal,
+          });
+          const changedIds = feed.changes
+            .filter((c) => c.kind === "document")
+            .map((c) => c.id);
+          const changed = await Promise.all(
+            changedIds.map((id) => fetchDocument(projectId, id))
+          );
+          if (abort.signal.aborted) return;
+          if (changed.length > 0) {
+            setDocuments((prev) => {
+              const byId = new Map(changed.map((d) => [d.id, d]));
+              const merged = prev.map((d) => byId.get(d.id) ?? d);
+              const known = new Set(prev.map((d) => d.id));
+              return [...merged, ...changed.filter((d) => !known.has(d.id))];
+            });
+          }
+          since = feed.cursor;
+        }
+      } catch (err: any) {
+        if (!abort.signal.aborted) {
+          setError(err.message || "Lost the change feed");
+        }
+      }
+    };
+
+    loadDocs().then((since) => {
+      if (selectedProjectId && since !== null) {
+        follow(selectedProjectId, since);
+      }
+    });
+    return () => {
+      abort.abort();
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [selectedProjectId]);
 
   const onCreateProject = async (e: FormEvent) => {
     e.preventDefault();
@@ -544,7 +641,7 @@ function App() {
                           {docBlocks.map((block, index) => (
                             <div
                               key={index}
-                              className={`block-editor-item role-${block.role || "default"} ${
+                              className={`block-editor-item ${roleClass(stylesheet, block.role)} ${
                                 index === activeBlockIndex ? "block-active" : ""
                               }`}
                               onClick={() => setActiveBlockIndex(index)}
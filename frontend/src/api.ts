@@ -35,6 +35,56 @@ export interface Document {
   blocks: Block[];
 }
 
+export interface BlockRange {
+  document_id: string;
+  version: number;
+  total: number;
+  offset: number;
+  blocks: Block[];
+}
+
+export interface DocumentOutline {
+  document_id: string;
+  version: number;
+  block_count: number;
+  role_histogram: Record<string, number>;
+  // UTF-8 payload size of each block (text, or src + alt text)
+  block_sizes: number[];
+}
+
+export interface CompiledStylesheet {
+  name: string;
+  href: string;
+  role_classes: Record<string, string>;
+}
+
+export interface ProjectStyles {
+  project_id: string;
+  version: number;
+  roles: Record<string, Record<string, string>>;
+  stylesheet: CompiledStylesheet;
+}
+
+// A project or document written since the feed's `since`.
+export interface Change {
+  kind: "project" | "document";
+  id: string;
+  project_id: string;
+  // document version; null for projects
+  version: number | null;
+  seq: number;
+}
+
+export interface ChangeFeed {
+  since: number;
+  // pass as the next `since`
+  cursor: number;
+  latest: number;
+  // another page is already waiting
+  more: boolean;
+  changes: Change[];
+}
+
 // --------- API base + helper ---------
 
 const API_BASE_URL =
@@ -127,9 +177,85 @@ export async function updateDocument(
   return handleResponse<Document>(res);
 }
 
+// Outline + windows let long documents be virtualized instead of
+// downloading every block up front.
+export async function fetchDocumentOutline(
+  projectId: string,
+  documentId: string
+): Promise<DocumentOutline> {
+  const res = await fetch(
+    `${API_BASE_URL}/projects/${projectId}/documents/${documentId}/outline`
+  );
+  return handleResponse<DocumentOutline>(res);
+}
+
+export async function fetchBlockRange(
+  projectId: string,
+  documentId: string,
+  offset: number,
+  limit: number
+): Promise<BlockRange> {
+  const params = new URLSearchParams({
+    offset: String(offset),
+    limit: String(limit),
+  });
+  const res = await fetch(
+    `${API_BASE_URL}/projects/${projectId}/documents/${documentId}/blocks?${params}`
+  );
+  return handleResponse<BlockRange>(res);
+}
+
 export function getDocumentHtmlUrl(
   projectId: string,
   documentId: string
 ): string {
   return `${API_BASE_URL}/projects/${projectId}/documents/${documentId}/export/html`;
 }
+
+// --------- Change feed ---------
+
+// Ids and versions written after `since`, so clients re-fetch only what
+// changed. `wait` (seconds, up to 30) long-polls until something does.
+export async function fetchChanges(
+  options: {
+    since?: number;
+    projectId?: string;
+    limit?: number;
+    wait?: number;
+    signal?: AbortSignal;
+  } = {}
+): Promise<ChangeFeed> {
+  const params = new URLSearchParams({ since: String(options.since ?? 0) });
+  if (options.projectId) params.set("project_id", options.projectId);
+  if (options.limit) params.set("limit", String(options.limit));
+  if (options.wait) params.set("wait", String(options.wait));
+  const res = await fetch(`${API_BASE_URL}/changes?${params}`, {
+    signal: options.signal,
+  });
+  return handleResponse<ChangeFeed>(res);
+}
+
+// --------- Style API ---------
+
+export async function fetchProjectStyles(
+  projectId: string
+): Promise<ProjectStyles> {
+  const res = await fetch(`${API_BASE_URL}/projects/${projectId}/styles`);
+  return handleResponse<ProjectStyles>(res);
+}
+
+export function getStylesheetUrl(stylesheet: CompiledStylesheet): string {
+  return `${API_BASE_URL}${stylesheet.href}`;
+}
+
+// Class for a block role; mirrors CompiledStyles.class_for on the server.
+export function roleClass(
+  stylesheet: CompiledStylesheet | null,
+  role: string
+): string {
+  if (!role) return "block-role-default";
+  return (
+    stylesheet?.role_classes[role] ||
+    `block-role-${role.replace(/[^A-Za-z0-9_-]/g, "_")}`
+  );
+}
@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before app.db is imported.
+os.environ.setdefault(
+    "TORAH_LAYOUT_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test_torah_layout.db"),
+)
+
+import pytest
+from sqlmodel import SQLModel
+
+from app.db import engine, init_db
+from app.responses import document_json_cache, document_packed_cache
+from app import styles, textstats
+from app.blockstore import block_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    """
+    Give every test empty tables so DB-backed endpoints are isolated.
+    """
+    SQLModel.metadata.drop_all(engine)
+    init_db()
+    document_json_cache.reset()
+    document_packed_cache.reset()
+    styles.reset_cache()
+    textstats.reset_cache()
+    block_cache.reset()
+    yield
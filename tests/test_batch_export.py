@@ -0,0 +1,222 @@
+import os
+import threading
+import zipfile
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+import app.batch_export as batch_export
+from app.batch_export import export_projects, project_lock
+from app import db
+from app.cli import main as cli_main
+from app.db import engine, get_session
+from app.main import app
+from app.models import DocumentModel, FootnoteModel
+from app.manifest import ExportManifest
+
+client = TestClient(app)
+
+
+def _project(documents: int = 3):
+    project_id = client.post("/projects", json={"name": "Batch"}).json()["id"]
+    ids = [
+        client.post(
+            f"/projects/{project_id}/documents", json={"title": "Shemot 12"}
+        ).json()["id"]
+    ]
+    for i in range(documents - 1):
+        ids.append(
+            client.post(
+                f"/projects/{project_id}/documents",
+                json={
+                    "title": f"Maggid {i}",
+                    "blocks": [
+                        {"kind": "text", "role": "commentary_en", "text": f"Part {i}, see Shemot 12:8."}
+                    ],
+                },
+            ).json()["id"]
+        )
+    return project_id, ids
+
+
+def test_export_writes_tree_and_skips_unchanged(tmp_path):
+    project_id, ids = _project()
+
+    stats = export_projects(str(tmp_path), workers=1, progress_stream=None)
+    assert (stats.documents, stats.rendered, stats.skipped) == (3, 3, 0)
+    directory = tmp_path / project_id
+    assert sorted(os.listdir(directory)) == sorted([f"{i}.html" for i in ids] + ["manifest.json"])
+
+    html = (directory / f"{ids[1]}.html").read_text(encoding="utf-8")
+    assert "Part 0" in html
+    assert f'href="{ids[0]}.html"' in html  # citation links stay inside the tree
+
+    again = export_projects(str(tmp_path), workers=1, progress_stream=None)
+    assert (again.rendered, again.skipped) == (0, 3)
+
+    client.put(
+        f"/projects/{project_id}/documents/{ids[2]}",
+        json={"title": "Maggid 1", "blocks": []},
+    )
+    edited = export_projects(str(tmp_path), workers=1, progress_stream=None)
+    assert (edited.rendered, edited.skipped) == (1, 2)
+    assert edited.rebuilt == [(project_id, ids[2], "content")]
+    assert ExportManifest.load(str(directory)).documents[ids[2]]["file"] == f"{ids[2]}.html"
+
+
+def test_style_change_rerenders_everything(tmp_path):
+    project_id, _ = _project()
+    export_projects(str(tmp_path), workers=1, progress_stream=None)
+
+    client.put(
+        f"/projects/{project_id}/styles",
+        json={"roles": {"commentary_en": {"font_size": "2rem"}}},
+    )
+    stats = export_projects(str(tmp_path), workers=1, progress_stream=None)
+    assert stats.rendered == 3
+    assert {reason for _, _, reason in stats.rebuilt} == {"styles"}
+
+
+def test_renderer_version_bump_rerenders(tmp_path, monkeypatch):
+    _project()
+    export_projects(str(tmp_path), workers=1, progress_stream=None)
+
+    monkeypatch.setattr("app.manifest.RENDERER_VERSION", 10**6)
+    stats = export_projects(str(tmp_path), workers=1, progress_stream=None)
+    assert {reason for _, _, reason in stats.rebuilt} == {"renderer"}
+
+
+def test_deleted_document_is_removed(tmp_path):
+    project_id, ids = _project()
+    export_projects(str(tmp_path), workers=1, progress_stream=None)
+
+    with get_session() as session:
+        session.delete(session.get(DocumentModel, ids[1]))
+        session.commit()
+    stats = export_projects(str(tmp_path), workers=1, progress_stream=None)
+    assert stats.removed == [(project_id, ids[1])]
+    assert not (tmp_path / project_id / f"{ids[1]}.html").exists()
+    assert ids[1] not in ExportManifest.load(str(tmp_path / project_id)).documents
+
+
+def test_zip_reuses_files_and_archive(tmp_path):
+    project_id, ids = _project()
+    first = export_projects(str(tmp_path), fmt="zip", workers=1, progress_stream=None)
+    archive = tmp_path / f"{project_id}.zip"
+    assert first.archives == [str(archive)]
+    with zipfile.ZipFile(archive) as z:
+        assert sorted(z.namelist()) == sorted(f"{project_id}/{i}.html" for i in ids)
+
+    unchanged = export_projects(str(tmp_path), fmt="zip", workers=1, progress_stream=None)
+    assert (unchanged.rendered, unchanged.archives) == (0, [])
+
+    client.put(
+        f"/projects/{project_id}/documents/{ids[2]}",
+        json={"title": "Maggid 1 (revised)"},
+    )
+    edited = export_projects(str(tmp_path), fmt="zip", workers=1, progress_stream=None)
+    assert (edited.rendered, edited.skipped, len(edited.archives)) == (1, 2, 1)
+    with zipfile.ZipFile(archive) as z:
+        assert "Maggid 1 (revised)" in z.read(f"{project_id}/{ids[2]}.html").decode("utf-8")
+
+
+def test_unknown_format_and_missing_pdf_backend(tmp_path, monkeypatch):
+    with pytest.raises(ValueError):
+        export_projects(str(tmp_path), fmt="docx", progress_stream=None)
+    monkeypatch.setattr(batch_export, "weasyprint", None)
+    with pytest.raises(RuntimeError):
+        export_projects(str(tmp_path), fmt="pdf", progress_stream=None)
+
+
+def test_zip_endpoint_reports_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_export, "EXPORT_DIR", str(tmp_path))
+    project_id, _ = _project()
+
+    response = client.get(f"/projects/{project_id}/export/zip")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert response.headers["x-export-rendered"] == "3"
+
+    again = client.get(f"/projects/{project_id}/export/zip")
+    assert (again.headers["x-export-rendered"], again.headers["x-export-reused"]) == ("0", "3")
+    assert again.content == response.content
+    assert client.get("/projects/missing/export/zip").status_code == 404
+
+
+def test_missing_output_is_rerendered_and_force(tmp_path):
+    project_id, ids = _project()
+    export_projects(str(tmp_path), workers=1, progress_stream=None)
+
+    os.remove(tmp_path / project_id / f"{ids[0]}.html")
+    assert export_projects(str(tmp_path), workers=1, progress_stream=None).rendered == 1
+    forced = export_projects(str(tmp_path), workers=1, force=True, progress_stream=None)
+    assert forced.rendered == 3
+
+
+def test_process_pool_and_project_filter(tmp_path):
+    project_id, ids = _project(documents=6)
+    other_id, _ = _project(documents=2)
+
+    stats = export_projects(
+        str(tmp_path), project_ids=[project_id], workers=2, progress_stream=None
+    )
+    assert stats.rendered == 6
+    assert not (tmp_path / other_id).exists()
+    assert all((tmp_path / project_id / f"{i}.html").exists() for i in ids)
+
+
+def test_cli_export(tmp_path, capsys):
+    project_id, _ = _project()
+    assert cli_main(["export-html", str(tmp_path), "--workers", "1"]) == 0
+    assert "3 documents" in capsys.readouterr().out
+    assert (tmp_path / project_id / "manifest.json").exists()
+
+    args = ["export", str(tmp_path), "--format", "zip", "--workers", "1", "-v"]
+    assert cli_main(args + ["--project", project_id]) == 0
+    out = capsys.readouterr().out
+    assert "0 rendered, 3 unchanged" in out
+    assert f"archive {tmp_path / project_id}.zip" in out
+
+
+def test_cli_rejects_missing_database(tmp_path, capsys):
+    missing = tmp_path / "typo.db"
+    assert cli_main(["--database", str(missing), "export", str(tmp_path / "out")]) == 1
+    assert "no database at" in capsys.readouterr().err
+    assert not missing.exists()
+
+
+def test_cli_upgrades_the_database(tmp_path):
+    project_id, ids = _project()
+    # a database from before the footnote index
+    FootnoteModel.__table__.drop(engine)
+    db._indexes_built.drop(engine)
+    with get_session() as session:
+        session.execute(db._schema_info.delete())
+        session.commit()
+
+    assert cli_main(["export", str(tmp_path), "--workers", "1"]) == 0
+    assert sorted(os.listdir(tmp_path / project_id)) == sorted(
+        [f"{i}.html" for i in ids] + ["manifest.json"]
+    )
+
+
+def test_exports_of_a_project_take_turns(tmp_path):
+    project_id, ids = _project()
+    results = []
+    worker = threading.Thread(
+        target=lambda: results.append(
+            export_projects(str(tmp_path), fmt="zip", workers=1, progress_stream=None)
+        )
+    )
+
+    with project_lock(str(tmp_path), project_id):
+        worker.start()
+        worker.join(0.3)
+        assert worker.is_alive()  # waiting for the lock
+        assert not os.path.exists(tmp_path / project_id)
+    worker.join()
+
+    assert results[0].rendered == 3
+    manifest = ExportManifest.load(str(tmp_path / project_id))
+    assert sorted(manifest.documents) == sorted(ids)
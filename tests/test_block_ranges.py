@@ -0,0 +1,109 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db
+from app.codec import block_outline, decode_block_window, encode_blocks
+from app.main import app
+
+client = TestClient(app)
+
+
+def _blocks(count: int):
+    blocks = []
+    for i in range(count):
+        if i % 10 == 9:
+            blocks.append(
+                {
+                    "kind": "image",
+                    "role": "archaeology_fig",
+                    "src": f"/images/{i}.jpg",
+                    "alt_text": "תמונה" if i % 20 == 19 else None,
+                    "alignment": "block",
+                }
+            )
+        else:
+            role = "commentary_he" if i % 2 else "commentary_en"
+            blocks.append({"kind": "text", "role": role, "text": f"Block {i} " + "א" * i})
+    return blocks
+
+
+def _create_document(blocks) -> tuple[str, str]:
+    project_id = client.post("/projects", json={"name": "Shas"}).json()["id"]
+    resp = client.post(
+        f"/projects/{project_id}/documents",
+        json={"title": "Bava Kamma", "blocks": blocks},
+    )
+    assert resp.status_code == 201
+    return project_id, resp.json()["id"]
+
+
+def test_decode_block_window_matches_slicing():
+    blocks = _blocks(45)
+    data = encode_blocks(blocks)
+    for start, stop in [(0, 5), (8, 21), (40, 100), (45, 50)]:
+        total, window = decode_block_window(data, start, stop)
+        assert total == 45
+        assert window == blocks[start:stop]
+
+
+def test_block_outline_sizes():
+    blocks = _blocks(20)
+    outline = block_outline(encode_blocks(blocks))
+    assert outline[0] == ("text", "commentary_en", len("Block 0 ".encode("utf-8")))
+    assert outline[19] == (
+        "image",
+        "archaeology_fig",
+        len("/images/19.jpg") + len("תמונה".encode("utf-8")),
+    )
+
+
+@pytest.mark.parametrize("storage", ["shared", "packed", "json"])
+def test_block_range_endpoint(storage, monkeypatch):
+    monkeypatch.setattr(db, "BLOCK_STORAGE", storage)
+    blocks = _blocks(250)
+    project_id, document_id = _create_document(blocks)
+
+    resp = client.get(
+        f"/projects/{project_id}/documents/{document_id}/blocks",
+        params={"offset": 100, "limit": 50},
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["total"] == 250
+    assert body["offset"] == 100
+    assert body["version"] == 1
+    assert body["blocks"] == blocks[100:150]
+
+    past_end = client.get(
+        f"/projects/{project_id}/documents/{document_id}/blocks",
+        params={"offset": 300},
+    ).json()
+    assert past_end["blocks"] == []
+
+
+@pytest.mark.parametrize("storage", ["shared", "packed", "json"])
+def test_outline_endpoint(storage, monkeypatch):
+    monkeypatch.setattr(db, "BLOCK_STORAGE", storage)
+    blocks = _blocks(30)
+    project_id, document_id = _create_document(blocks)
+
+    resp = client.get(f"/projects/{project_id}/documents/{document_id}/outline")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["block_count"] == 30
+    assert body["role_histogram"] == {
+        "commentary_en": 15,
+        "commentary_he": 12,
+        "archaeology_fig": 3,
+    }
+    assert len(body["block_sizes"]) == 30
+    assert body["block_sizes"][3] == len(("Block 3 " + "א" * 3).encode("utf-8"))
+
+
+def test_block_range_rejects_bad_limit():
+    project_id, document_id = _create_document([])
+    resp = client.get(
+        f"/projects/{project_id}/documents/{document_id}/blocks",
+        params={"limit": 0},
+    )
+    assert resp.status_code == 422
@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlmodel import func, select
+
+from app.blockstore import block_cache, block_hash, pack_hash_list, unpack_hash_list
+from app.cli import main as cli_main
+from app.db import get_session
+from app.layout import rendered_block_cache
+from app.main import app
+from app.models import (
+    BlockContentModel,
+    BlockListModel,
+    DocumentModel,
+    prune_blocks,
+    store_block_list,
+    store_blocks,
+)
+
+client = TestClient(app)
+
+KIDDUSH = {"kind": "text", "role": "haggadah_main_hebrew", "text": "סברי מרנן"}
+HALLEL = {"kind": "text", "role": "haggadah_main_hebrew", "text": "הללויה"}
+FIGURE = {
+    "kind": "image",
+    "role": "fig",
+    "src": "/images/cup.jpg",
+    "alt_text": None,
+    "alignment": "block",
+}
+
+
+def _count(model) -> int:
+    with get_session() as session:
+        return session.exec(select(func.count()).select_from(model)).one()
+
+
+def _create(name: str, blocks) -> tuple:
+    project_id = client.post("/projects", json={"name": name}).json()["id"]
+    resp = client.post(
+        f"/projects/{project_id}/documents", json={"title": name, "blocks": blocks}
+    )
+    return project_id, resp.json()["id"]
+
+
+def test_block_hash_identifies_content():
+    assert block_hash(KIDDUSH) == block_hash(dict(KIDDUSH))
+    assert block_hash(KIDDUSH) != block_hash({**KIDDUSH, "role": "commentary_he"})
+    assert block_hash(FIGURE) != block_hash({**FIGURE, "alt_text": ""})
+
+    hashes = [block_hash(KIDDUSH), block_hash(FIGURE)]
+    assert unpack_hash_list(pack_hash_list(hashes)) == hashes
+    with pytest.raises(ValueError):
+        unpack_hash_list(b"TLB1\x00")
+
+
+def test_blocks_are_stored_once_across_documents():
+    _create("Haggadah A", [KIDDUSH, HALLEL, KIDDUSH, FIGURE])
+    project_id, document_id = _create("Haggadah B", [HALLEL, KIDDUSH])
+
+    assert _count(BlockContentModel) == 3
+    assert _count(BlockListModel) == 2
+
+    doc = client.get(f"/projects/{project_id}/documents/{document_id}").json()
+    assert doc["blocks"] == [HALLEL, KIDDUSH]
+
+
+def test_rendered_blocks_are_shared_across_documents():
+    first = _create("A", [KIDDUSH, HALLEL])
+    second = _create("B", [HALLEL, KIDDUSH, FIGURE])
+    rendered_block_cache.reset()
+
+    client.get(f"/projects/{first[0]}/documents/{first[1]}/export/html")
+    assert rendered_block_cache.misses == 2
+    client.get(f"/projects/{second[0]}/documents/{second[1]}/export/html")
+    assert rendered_block_cache.hits == 2
+    assert rendered_block_cache.misses == 3
+
+
+def test_prune_removes_unreferenced_blocks():
+    project_id, document_id = _create("Haggadah", [KIDDUSH, HALLEL])
+    _create("Other", [KIDDUSH])
+    client.put(
+        f"/projects/{project_id}/documents/{document_id}",
+        json={"title": "Haggadah", "blocks": [KIDDUSH, FIGURE]},
+    )
+    assert _count(BlockContentModel) == 3  # HALLEL is orphaned
+
+    with get_session() as session:
+        assert prune_blocks(session) == (0, 1)
+    assert _count(BlockContentModel) == 2
+    doc = client.get(f"/projects/{project_id}/documents/{document_id}").json()
+    assert doc["blocks"] == [KIDDUSH, FIGURE]
+
+
+def test_cli_prune(capsys):
+    project_id, document_id = _create("Haggadah", [KIDDUSH, HALLEL])
+    client.put(
+        f"/projects/{project_id}/documents/{document_id}",
+        json={"title": "Haggadah", "blocks": [KIDDUSH]},
+    )
+    assert cli_main(["prune"]) == 0
+    assert "removed 0 block lists, 1 blocks" in capsys.readouterr().out
+    assert _count(BlockContentModel) == 1
+
+
+def test_missing_blocks_fail_clearly():
+    project_id, document_id = _create("Haggadah", [KIDDUSH, HALLEL])
+    with get_session() as session:
+        session.execute(delete(BlockContentModel))
+        session.commit()
+    block_cache.reset()
+
+    with get_session() as session:
+        doc = session.get(DocumentModel, document_id)
+        with pytest.raises(LookupError, match="missing from block_contents"):
+            doc.get_block_dicts()
+
+
+def _save_concurrently(store):
+    """
+    Run `store(session)` in two sessions at once: the second checks for
+    existing rows while the first holds its uncommitted insert.
+    """
+    errors = []
+
+    def second():
+        with get_session() as session:
+            try:
+                store(session)
+                session.commit()
+            except Exception as exc:  # surfaced below
+                errors.append(exc)
+
+    with get_session() as session:
+        store(session)
+        worker = threading.Thread(target=second)
+        worker.start()
+        time.sleep(0.2)  # let it look up the rows and wait for the lock
+        session.commit()
+    worker.join()
+    assert errors == []
+
+
+def test_concurrent_saves_of_a_new_block():
+    _save_concurrently(lambda session: store_blocks(session, [KIDDUSH, HALLEL]))
+    assert _count(BlockContentModel) == 2
+
+
+def test_concurrent_saves_of_a_new_block_list():
+    data = pack_hash_list([block_hash(KIDDUSH)])
+    _save_concurrently(lambda session: store_block_list(session, data))
+    assert _count(BlockListModel) == 1
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, update
+
+from app import changes, db
+from app.db import engine, init_db
+from app.main import app
+from app.models import ChangeCounterModel, DocumentModel, ProjectModel
+
+client = TestClient(app)
+
+
+def _feed(**params):
+    response = client.get("/changes", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def _ids(feed):
+    return [(c["kind"], c["id"]) for c in feed["changes"]]
+
+
+def test_writes_get_increasing_sequence_numbers():
+    assert _feed() == {"since": 0, "cursor": 0, "latest": 0, "more": False, "changes": []}
+
+    project_id = client.post("/projects", json={"name": "Sync"}).json()["id"]
+    doc_id = client.post(
+        f"/projects/{project_id}/documents", json={"title": "Maggid"}
+    ).json()["id"]
+
+    feed = _feed()
+    assert _ids(feed) == [("project", project_id), ("document", doc_id)]
+    assert feed["changes"][1]["version"] == 1
+    assert feed["changes"][0]["seq"] < feed["changes"][1]["seq"] == feed["cursor"]
+    assert _feed(since=feed["cursor"])["changes"] == []
+
+    client.put(
+        f"/projects/{project_id}/documents/{doc_id}",
+        json={"title": "Maggid", "blocks": [{"kind": "text", "role": "commentary_en", "text": "x"}]},
+    )
+    edited = _feed(since=feed["cursor"])
+    assert [(c["id"], c["version"]) for c in edited["changes"]] == [(doc_id, 2)]
+    assert edited["cursor"] > feed["cursor"]
+
+
+def test_reads_do_not_advance_the_feed():
+    project_id = client.post("/projects", json={"name": "Sync"}).json()["id"]
+    doc_id = client.post(f"/projects/{project_id}/documents", json={"title": "Maggid"}).json()["id"]
+    cursor = _feed()["cursor"]
+
+    client.get(f"/projects/{project_id}/documents/{doc_id}")
+    client.get(f"/projects/{project_id}/documents/{doc_id}/export/html")
+    assert _feed(since=cursor)["changes"] == []
+
+
+def test_pages_and_project_filter():
+    project_id = client.post("/projects", json={"name": "A"}).json()["id"]
+    other_id = client.post("/projects", json={"name": "B"}).json()["id"]
+    docs = [
+        client.post(f"/projects/{project_id}/documents", json={"title": f"Doc {i}"}).json()["id"]
+        for i in range(5)
+    ]
+    client.post(f"/projects/{other_id}/documents", json={"title": "Elsewhere"})
+
+    seen, since = [], 0
+    while True:
+        page = _feed(since=since, limit=2, project_id=project_id)
+        seen += _ids(page)
+        since = page["cursor"]
+        if not page["more"]:
+            break
+    assert seen == [("project", project_id)] + [("document", d) for d in docs]
+    assert since == page["latest"]
+
+    assert client.get("/changes", params={"project_id": "missing"}).status_code == 404
+
+
+def test_clone_documents_appear_in_feed():
+    project_id = client.post("/projects", json={"name": "Source"}).json()["id"]
+    for i in range(3):
+        client.post(f"/projects/{project_id}/documents", json={"title": f"Doc {i}"})
+    cursor = _feed()["cursor"]
+
+    clone_id = client.post(f"/projects/{project_id}/clone", json={}).json()["id"]
+    feed = _feed(since=cursor)
+    assert [c["kind"] for c in feed["changes"]] == ["project"] + ["document"] * 3
+    assert {c["project_id"] for c in feed["changes"]} == {clone_id}
+    seqs = [c["seq"] for c in feed["changes"]]
+    assert seqs == sorted(set(seqs))
+
+
+def test_long_poll_returns_on_change(monkeypatch):
+    monkeypatch.setattr(changes, "POLL_INTERVAL", 0.02)
+    project_id = client.post("/projects", json={"name": "Sync"}).json()["id"]
+    cursor = _feed()["cursor"]
+
+    start = time.monotonic()
+    assert _feed(since=cursor, wait=0.1)["changes"] == []
+    assert time.monotonic() - start >= 0.1
+
+    writer = threading.Timer(
+        0.1,
+        lambda: client.post(f"/projects/{project_id}/documents", json={"title": "Late"}),
+    )
+    writer.start()
+    try:
+        feed = _feed(since=cursor, wait=10)
+    finally:
+        writer.join()
+    assert [c["kind"] for c in feed["changes"]] == ["document"]
+
+
+def test_long_poll_keeps_the_event_loop_free(monkeypatch):
+    def locked_counter():
+        time.sleep(0.2)  # a writer holding the database lock
+        return 0
+
+    monkeypatch.setattr(changes, "_current_seq", locked_counter)
+
+    async def ticks_while_waiting():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        assert await changes.wait_for_change(0, 0.1) is False
+        ticker.cancel()
+        return ticks
+
+    assert asyncio.run(ticks_while_waiting()) >= 5
+
+
+def test_rows_from_before_the_feed_get_sequence_numbers():
+    project_id = client.post("/projects", json={"name": "Legacy"}).json()["id"]
+    docs = [
+        client.post(f"/projects/{project_id}/documents", json={"title": f"Doc {i}"}).json()["id"]
+        for i in range(5)
+    ]
+
+    # a database upgraded from before the feed: the column added at 0
+    with engine.begin() as conn:
+        conn.execute(update(ProjectModel.__table__).values(change_seq=0))
+        conn.execute(update(DocumentModel.__table__).values(change_seq=0))
+        conn.execute(delete(ChangeCounterModel.__table__))
+        conn.execute(db._schema_info.delete())
+    assert init_db()
+
+    seen, since = [], 0
+    for _ in range(10):
+        page = _feed(since=since, limit=2)
+        seen += _ids(page)
+        assert page["cursor"] > since
+        since = page["cursor"]
+        if not page["more"]:
+            break
+    assert seen == [("project", project_id)] + [("document", d) for d in docs]
+    assert _feed(since=since)["changes"] == []
+
+
+def test_limit_and_wait_bounds():
+    assert client.get("/changes", params={"limit": changes.MAX_LIMIT}).status_code == 200
+    assert client.get("/changes", params={"limit": changes.MAX_LIMIT + 1}).status_code == 422
+    assert client.get("/changes", params={"wait": changes.MAX_WAIT + 1}).status_code == 422
@@ -0,0 +1,112 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import func, select
+
+from app import db
+from app.db import get_session
+from app.main import app
+from app.models import BlockListModel
+
+client = TestClient(app)
+
+BLOCKS = [
+    {"kind": "text", "role": "haggadah_main_hebrew", "text": "הא לחמא עניא"},
+    {"kind": "text", "role": "commentary_en", "text": "As in Shemot 12:8[^1]."},
+    {"kind": "text", "role": "footnote_en", "text": "[^1] Roasted."},
+]
+
+
+def _block_lists() -> int:
+    with get_session() as session:
+        return session.exec(select(func.count()).select_from(BlockListModel)).one()
+
+
+def _source_project(documents: int = 3) -> str:
+    project_id = client.post(
+        "/projects", json={"name": "Haggadah 5785", "description": "First edition"}
+    ).json()["id"]
+    client.put(
+        f"/projects/{project_id}/styles",
+        json={"roles": {"commentary_en": {"font_size": "0.9rem"}}},
+    )
+    client.post(f"/projects/{project_id}/documents", json={"title": "Shemot 12"})
+    for i in range(documents):
+        client.post(
+            f"/projects/{project_id}/documents",
+            json={"title": f"Maggid {i}", "blocks": BLOCKS},
+        )
+    return project_id
+
+
+@pytest.mark.parametrize("storage", ["shared", "packed", "json"])
+def test_clone_copies_documents_and_shares_blocks(storage, monkeypatch):
+    monkeypatch.setattr(db, "BLOCK_STORAGE", storage)
+    source_id = _source_project()
+    cursor = client.get("/changes").json()["cursor"]
+
+    resp = client.post(f"/projects/{source_id}/clone", json={"name": "Haggadah 5786"})
+    assert resp.status_code == 201
+    clone = resp.json()
+    assert clone["name"] == "Haggadah 5786"
+    assert clone["description"] == "First edition"
+    assert clone["id"] != source_id
+
+    source_docs = client.get(f"/projects/{source_id}/documents").json()
+    clone_docs = client.get(f"/projects/{clone['id']}/documents").json()
+    assert len(clone_docs) == len(source_docs) == 4
+    assert {d["id"] for d in clone_docs}.isdisjoint(d["id"] for d in source_docs)
+    assert sorted((d["title"], str(d["blocks"])) for d in clone_docs) == sorted(
+        (d["title"], str(d["blocks"])) for d in source_docs
+    )
+
+    # one shared list for the identical documents, one for the empty one;
+    # inline storage is copied as it is
+    assert _block_lists() == (2 if storage == "shared" else 0)
+    # the source project was only read
+    changed = client.get("/changes", params={"since": cursor}).json()["changes"]
+    assert {c["project_id"] for c in changed} == {clone["id"]}
+
+    # indexes and styles came along
+    maggid = next(d for d in clone_docs if d["title"] == "Maggid 0")
+    base = f"/projects/{clone['id']}/documents/{maggid['id']}"
+    citations = client.get(f"{base}/citations").json()
+    target = next(d for d in clone_docs if d["title"] == "Shemot 12")
+    assert citations[0]["target_document_id"] == target["id"]
+    assert client.get(f"{base}/footnotes").json()[0]["number"] == 1
+    styles = client.get(f"/projects/{clone['id']}/styles").json()
+    assert styles["roles"]["commentary_en"]["font_size"] == "0.9rem"
+
+
+def test_edits_copy_on_write():
+    source_id = _source_project(documents=1)
+    clone_id = client.post(f"/projects/{source_id}/clone").json()["id"]
+    assert client.get(f"/projects/{clone_id}").json()["name"] == "Haggadah 5785 (copy)"
+
+    doc = next(
+        d for d in client.get(f"/projects/{clone_id}/documents").json()
+        if d["title"] == "Maggid 0"
+    )
+    edited = [{"kind": "text", "role": "commentary_en", "text": "New edition"}]
+    client.put(
+        f"/projects/{clone_id}/documents/{doc['id']}",
+        json={"title": "Maggid 0", "blocks": edited},
+    )
+    assert _block_lists() == 3
+
+    source_doc = next(
+        d for d in client.get(f"/projects/{source_id}/documents").json()
+        if d["title"] == "Maggid 0"
+    )
+    assert source_doc["blocks"] == BLOCKS
+    assert client.get(f"/projects/{clone_id}/documents/{doc['id']}").json()["blocks"] == edited
+
+    # editing the source too leaves its old list unreferenced, so it's dropped
+    client.put(
+        f"/projects/{source_id}/documents/{source_doc['id']}",
+        json={"title": "Maggid 0", "blocks": edited},
+    )
+    assert _block_lists() == 2
+
+
+def test_clone_missing_project():
+    assert client.post("/projects/nope/clone").status_code == 404
@@ -0,0 +1,144 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app import db
+from app.codec import (
+    COMPRESSION_ZLIB,
+    PACKED_MEDIA_TYPE,
+    decode_blocks,
+    decode_document,
+    encode_blocks,
+)
+from app.main import app
+from app.models import DocumentModel
+from app.responses import document_packed_cache
+from app.schemas import ImageBlock, TextBlock
+
+client = TestClient(app)
+
+
+SAMPLE_BLOCKS = [
+    {
+        "kind": "text",
+        "role": "haggadah_main_hebrew",
+        "text": "הָא לַחְמָא עַנְיָא דִּי אֲכָלוּ אַבְהָתָנָא בְּאַרְעָא דְמִצְרָיִם",
+    },
+    {
+        "kind": "text",
+        "role": "commentary_en",
+        "text": "This section introduces the theme of spiritual poverty.",
+    },
+    {
+        "kind": "image",
+        "role": "archaeology_fig",
+        "src": "/images/matzah_oven_01.jpg",
+        "alt_text": "Ancient matzah oven.",
+        "alignment": "block",
+    },
+    {
+        "kind": "image",
+        "role": "archaeology_fig",
+        "src": "/images/matzah_oven_02.jpg",
+        "alt_text": None,
+        "alignment": None,
+    },
+    {"kind": "text", "role": "commentary_en", "text": ""},
+]
+
+
+def test_round_trip_uncompressed():
+    data = encode_blocks(SAMPLE_BLOCKS, compression=None)
+    assert decode_blocks(data) == SAMPLE_BLOCKS
+
+
+def test_round_trip_zlib():
+    blocks = SAMPLE_BLOCKS * 50
+    data = encode_blocks(blocks, compression="zlib")
+    assert decode_blocks(data) == blocks
+
+
+def test_auto_compression_is_readable_without_zstandard():
+    # zstd only when configured, whatever is installed
+    data = encode_blocks(SAMPLE_BLOCKS * 50)
+    assert data[4] == COMPRESSION_ZLIB
+
+
+def test_empty_list_round_trip():
+    assert decode_blocks(encode_blocks([])) == []
+
+
+def test_packed_is_smaller_than_json():
+    blocks = SAMPLE_BLOCKS * 20
+    as_json = json.dumps(blocks, ensure_ascii=False).encode("utf-8")
+    assert len(encode_blocks(blocks, compression=None)) < len(as_json)
+    assert len(encode_blocks(blocks)) < len(as_json) // 4
+
+
+def test_document_model_stores_packed_blocks():
+    doc = DocumentModel(project_id="p", title="t")
+    doc.set_blocks(
+        [
+            TextBlock(role="commentary_en", text="Hello"),
+            ImageBlock(role="fig", src="/a.jpg"),
+        ]
+    )
+    assert doc.blocks is None
+    assert doc.blocks_packed is not None
+
+    blocks = doc.get_blocks()
+    assert isinstance(blocks[0], TextBlock)
+    assert isinstance(blocks[1], ImageBlock)
+    assert blocks[1].alignment == "block"
+
+
+def test_document_model_reads_legacy_json_blocks(monkeypatch):
+    monkeypatch.setattr(db, "BLOCK_STORAGE", "json")
+    doc = DocumentModel(project_id="p", title="t")
+    doc.set_blocks([TextBlock(role="commentary_en", text="Hello")])
+    assert doc.blocks_packed is None
+    assert doc.get_blocks()[0].text == "Hello"
+
+
+def test_get_document_in_packed_format():
+    project_id = client.post("/projects", json={"name": "Packed"}).json()["id"]
+    document_id = client.post(
+        f"/projects/{project_id}/documents",
+        json={"title": "Maggid", "blocks": []},
+    ).json()["id"]
+    client.put(
+        f"/projects/{project_id}/documents/{document_id}",
+        json={"title": "Maggid", "description": None, "blocks": SAMPLE_BLOCKS},
+    )
+
+    resp = client.get(
+        f"/projects/{project_id}/documents/{document_id}",
+        headers={"Accept": PACKED_MEDIA_TYPE},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == PACKED_MEDIA_TYPE
+
+    doc = decode_document(resp.content)
+    assert doc["id"] == document_id
+    assert doc["project_id"] == project_id
+    assert doc["title"] == "Maggid"
+    assert doc["description"] is None
+    assert doc["blocks"] == SAMPLE_BLOCKS
+
+
+def test_packed_documents_are_cached_per_version():
+    project_id = client.post("/projects", json={"name": "Packed"}).json()["id"]
+    document_id = client.post(
+        f"/projects/{project_id}/documents",
+        json={"title": "Maggid", "blocks": SAMPLE_BLOCKS},
+    ).json()["id"]
+    url = f"/projects/{project_id}/documents/{document_id}"
+
+    first = client.get(url, headers={"Accept": PACKED_MEDIA_TYPE}).content
+    assert document_packed_cache.get(document_id, 1) == first
+
+    client.put(url, json={"title": "Maggid", "blocks": SAMPLE_BLOCKS[:1]})
+    assert document_packed_cache.get(document_id, 2) is None
+    doc = decode_document(client.get(url, headers={"Accept": PACKED_MEDIA_TYPE}).content)
+    assert doc["blocks"] == SAMPLE_BLOCKS[:1]
+    assert document_packed_cache.get(document_id, 2) is not None
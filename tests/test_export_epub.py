@@ -0,0 +1,135 @@
+import io
+import zipfile
+from xml.etree import ElementTree
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from app import epub
+from app.db import get_session
+from app.main import app
+from app.models import DocumentModel
+
+client = TestClient(app)
+
+OPF_NS = {"opf": "http://www.idpf.org/2007/opf"}
+
+
+def _create_book(tmp_path, chapters: int = 3) -> str:
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "oven.jpg").write_bytes(b"\xff\xd8fake-jpeg")
+    (images / "oven_copy.jpg").write_bytes(b"\xff\xd8fake-jpeg")
+
+    project_id = client.post("/projects", json={"name": "Haggadah & Friends"}).json()["id"]
+    for i in range(chapters):
+        resp = client.post(
+            f"/projects/{project_id}/documents",
+            json={
+                "title": f"Chapter {i + 1}",
+                "blocks": [
+                    {"kind": "text", "role": "haggadah_main_hebrew", "text": "הא לחמא עניא"},
+                    {"kind": "text", "role": "commentary_en", "text": "Bread & <affliction>"},
+                    {"kind": "image", "role": "fig", "src": "/images/oven.jpg"},
+                    {"kind": "image", "role": "fig", "src": "/images/oven_copy.jpg"},
+                    {"kind": "image", "role": "fig", "src": "https://example.com/x.png"},
+                    {
+                        "kind": "image",
+                        "role": "fig",
+                        "src": "/images/missing.jpg",
+                        "alt_text": "The seder plate",
+                    },
+                ],
+            },
+        )
+        assert resp.status_code == 201
+    return project_id
+
+
+def _check_book(data: bytes, chapters: int) -> zipfile.ZipFile:
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    first = zf.infolist()[0]
+    assert first.filename == "mimetype"
+    assert first.compress_type == zipfile.ZIP_STORED
+    assert zf.read("mimetype") == b"application/epub+zip"
+    # real sizes in every local header, no data descriptors, so sniffers
+    # and streaming readers see the mimetype at the start of the file
+    assert all(info.flag_bits & 0x08 == 0 for info in zf.infolist())
+    assert data[30:58] == b"mimetypeapplication/epub+zip"
+
+    opf = ElementTree.fromstring(zf.read("OEBPS/content.opf"))
+    hrefs = [item.get("href") for item in opf.iterfind(".//opf:item", OPF_NS)]
+    spine = [ref.get("idref") for ref in opf.iterfind(".//opf:itemref", OPF_NS)]
+    assert len(spine) == chapters
+
+    images = [h for h in hrefs if h.startswith("images/")]
+    assert len(images) == 1  # two srcs, identical bytes -> one asset
+
+    for href in hrefs:
+        # every manifest item exists and chapters are well-formed XML
+        content = zf.read(f"OEBPS/{href}")
+        if href.endswith(".xhtml"):
+            ElementTree.fromstring(content)
+
+    chapter = zf.read("OEBPS/chapter-0001.xhtml").decode("utf-8")
+    assert f'src="{images[0]}"' in chapter
+    # remote and missing images can't be referenced inside the container
+    assert "example.com" not in chapter
+    assert "missing.jpg" not in chapter
+    assert chapter.count("<img ") == 2
+    assert "The seder plate" in chapter
+    assert 'href="styles.css"' in chapter
+    assert ".block-role-haggadah_main_hebrew p" in zf.read("OEBPS/styles.css").decode()
+    return zf
+
+
+def test_export_project_epub(tmp_path, monkeypatch):
+    monkeypatch.setattr(epub, "ASSET_DIR", str(tmp_path))
+    project_id = _create_book(tmp_path)
+
+    resp = client.get(f"/projects/{project_id}/export/epub")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/epub+zip"
+
+    zf = _check_book(resp.content, chapters=3)
+    nav = zf.read("OEBPS/nav.xhtml").decode("utf-8")
+    assert "Chapter 3" in nav
+
+
+def test_export_epub_in_process_pool_keeps_chapter_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(epub, "PARALLEL_THRESHOLD", 1)
+    monkeypatch.setattr(epub, "BATCH_SIZE", 2)
+    project_id = _create_book(tmp_path, chapters=5)
+
+    data = b"".join(
+        epub.stream_project_epub(project_id, workers=2, asset_dir=str(tmp_path))
+    )
+    zf = _check_book(data, chapters=5)
+    assert "Chapter 5" in zf.read("OEBPS/chapter-0005.xhtml").decode("utf-8")
+    nav = zf.read("OEBPS/nav.xhtml").decode("utf-8")
+    positions = [nav.index(f">Chapter {i}<") for i in range(1, 6)]
+    assert positions == sorted(positions)
+
+
+def test_export_epub_unknown_project_404():
+    resp = client.get("/projects/00000000-0000-0000-0000-000000000000/export/epub")
+    assert resp.status_code == 404
+
+
+def test_export_epub_skips_documents_deleted_mid_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(epub, "BATCH_SIZE", 2)
+    project_id = _create_book(tmp_path, chapters=5)
+    docs = client.get(f"/projects/{project_id}/documents").json()
+    fourth = next(d["id"] for d in docs if d["title"] == "Chapter 4")
+
+    stream = epub.stream_project_epub(project_id, workers=1, asset_dir=str(tmp_path))
+    data = next(stream) + next(stream)  # styles, then chapters 1-2
+    with get_session() as session:
+        session.execute(delete(DocumentModel).where(DocumentModel.id == fourth))
+        session.commit()
+    data += b"".join(stream)
+
+    zf = _check_book(data, chapters=4)
+    assert "OEBPS/chapter-0004.xhtml" not in zf.namelist()
+    assert "Chapter 5" in zf.read("OEBPS/chapter-0005.xhtml").decode("utf-8")
+    assert "Chapter 4" not in zf.read("OEBPS/nav.xhtml").decode("utf-8")
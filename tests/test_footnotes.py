@@ -0,0 +1,143 @@
+import io
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db, footnotes
+from app.db import engine, get_session, init_db
+from app.footnotes import index_footnotes
+from app.layout import render_document_to_html
+from app.main import app
+from app.models import FootnoteModel
+from app.schemas import Document
+
+client = TestClient(app)
+
+BLOCKS = [
+    {"kind": "text", "role": "commentary_en", "text": "Yachatz[^b] then Maggid[^a]."},
+    {"kind": "text", "role": "footnote_en", "text": "[^a] The telling."},
+    {"kind": "text", "role": "commentary_he", "text": "מגיד[^a] והלל[^missing]"},
+    {"kind": "text", "role": "footnote_he", "text": "[^b] בציעת המצה"},
+    {"kind": "text", "role": "footnote_en", "text": "A note without an anchor."},
+]
+
+
+def test_index_binds_anchors_to_notes():
+    anchors = index_footnotes([(b["role"], b["text"]) for b in BLOCKS])
+    assert [(a.label, a.block, a.note) for a in anchors] == [
+        ("b", 0, 3),
+        ("a", 0, 1),
+        ("a", 2, 1),
+        ("missing", 2, None),
+    ]
+    assert BLOCKS[0]["text"][anchors[0].start:anchors[0].end] == "[^b]"
+
+
+def test_render_numbers_notes_and_moves_them_to_the_bottom():
+    doc = Document(
+        id="00000000-0000-0000-0000-000000000001",
+        project_id="00000000-0000-0000-0000-000000000002",
+        title="Seder",
+        blocks=BLOCKS,
+    )
+    html = render_document_to_html(doc)
+    body, notes = html.split('<section class="footnotes">')
+
+    # numbered by first anchor, repeated anchors reuse the number
+    assert body.index('href="#fn-1" id="fnref-1"') < body.index('href="#fn-2" id="fnref-2"')
+    assert body.count('href="#fn-2"') == 2
+    assert "[^b]" not in body and "[^a]" not in body
+    assert "missing</span>]" in body  # dangling anchors stay as typed
+    assert "A note without an anchor." in body  # unanchored notes stay in place
+
+    assert notes.index('id="fn-1"') < notes.index('id="fn-2"')
+    assert "בציעת המצה" in notes.split('id="fn-2"')[0]
+    assert "[^" not in notes
+
+
+def _create(blocks):
+    project_id = client.post("/projects", json={"name": "Seder"}).json()["id"]
+    resp = client.post(
+        f"/projects/{project_id}/documents", json={"title": "Seder", "blocks": blocks}
+    )
+    return project_id, resp.json()["id"]
+
+
+def test_footnote_index_endpoint_follows_updates():
+    project_id, document_id = _create(BLOCKS)
+    url = f"/projects/{project_id}/documents/{document_id}/footnotes"
+
+    notes = client.get(url).json()
+    assert [(n["label"], n["note_block"], n["number"]) for n in notes] == [
+        ("b", 3, 1),
+        ("a", 1, 2),
+        ("a", 1, 2),
+        ("missing", None, None),
+    ]
+
+    client.put(
+        f"/projects/{project_id}/documents/{document_id}",
+        json={"title": "Seder", "blocks": BLOCKS[:2]},
+    )
+    notes = client.get(url).json()
+    assert [(n["label"], n["note_block"], n["number"]) for n in notes] == [
+        ("b", None, None),
+        ("a", 1, 1),
+    ]
+
+
+def test_exports_place_footnotes():
+    project_id, document_id = _create(BLOCKS)
+
+    html = client.get(f"/projects/{project_id}/documents/{document_id}/export/html").text
+    assert '<aside id="fn-1"' in html
+
+    data = client.get(f"/projects/{project_id}/export/epub").content
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    xhtml = zf.read("OEBPS/chapter-0001.xhtml").decode()
+    ElementTree.fromstring(xhtml)
+    assert 'epub:type="noteref"' in xhtml
+    assert 'epub:type="footnote"' in xhtml
+
+
+def test_documents_saved_before_the_index_are_backfilled():
+    project_id, document_id = _create(BLOCKS)
+    cursor = client.get("/changes").json()["cursor"]
+
+    # a database from before the footnote index
+    FootnoteModel.__table__.drop(engine)
+    db._indexes_built.drop(engine)
+    with get_session() as session:
+        session.execute(db._schema_info.delete())
+        session.commit()
+    assert init_db()
+
+    url = f"/projects/{project_id}/documents/{document_id}"
+    assert [n["label"] for n in client.get(url + "/footnotes").json()] == ["b", "a", "a", "missing"]
+    html = client.get(url + "/export/html").text
+    assert "[^a]" not in html
+    assert client.get("/changes", params={"since": cursor}).json()["changes"] == []
+
+
+def test_interrupted_backfill_resumes_on_next_start(monkeypatch):
+    project_id, document_id = _create(BLOCKS)
+    FootnoteModel.__table__.drop(engine)
+    db._indexes_built.drop(engine)
+    with get_session() as session:
+        session.execute(db._schema_info.delete())
+        session.commit()
+
+    def crash(session):
+        raise RuntimeError("killed mid-backfill")
+
+    # the footnotes table is created, then startup dies before indexing
+    monkeypatch.setattr(footnotes, "backfill_footnotes", crash)
+    with pytest.raises(RuntimeError):
+        init_db()
+    monkeypatch.undo()
+
+    assert init_db()
+    url = f"/projects/{project_id}/documents/{document_id}/footnotes"
+    assert [n["label"] for n in client.get(url).json()] == ["b", "a", "a", "missing"]
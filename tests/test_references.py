@@ -0,0 +1,169 @@
+import io
+import zipfile
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app import db
+from app.db import engine, get_session, init_db
+from app.main import app
+from app.models import CitationModel, DocumentModel
+from app.references import parse_citations, parse_reference
+
+client = TestClient(app)
+
+
+def test_parse_english_and_hebrew_citations():
+    text = "See Exodus 12:8 and רש\"י על שמות יב:ח, compare Rashi on Shemot 12."
+    citations = parse_citations(text)
+    assert [(c.key, c.commentator) for c in citations] == [
+        ("shemot:12:8", None),
+        ("shemot:12:8", "rashi"),
+        ("shemot:12", "rashi"),
+    ]
+    for c in citations:
+        assert text[c.start:c.end] == c.text
+
+
+def test_parse_rejects_midrash_titles():
+    # "רבה" is 207, not a chapter
+    assert parse_citations("כמו שכתוב בשמות רבה") == []
+    assert parse_reference("שמות רבה") is None
+    assert parse_reference("Ramban on Bereishit 1").key == "bereishit:1"
+
+
+def test_parse_skips_common_words():
+    assert parse_citations("the numbers 12 and 14") == []
+    assert parse_citations("he lost his job 3 times") == []
+    # "לא" (not) is also 31, "אלו" (these) 37
+    assert parse_citations("דברים לא נאמרו") == []
+    assert parse_citations("שמות אלו") == []
+    assert [c.key for c in parse_citations("דברים ל״א, דברים לא:ב")] == [
+        "devarim:31",
+        "devarim:31:2",
+    ]
+    assert [c.key for c in parse_citations('רש"י על דברים לא')] == ["devarim:31"]
+    # chapters are bounded per book
+    assert parse_citations("Ruth 7") == []
+    assert parse_citations("Job 43:1") == []
+    assert [c.key for c in parse_citations("Job 42 and Psalm 150")] == [
+        "iyov:42",
+        "tehillim:150",
+    ]
+    assert parse_reference("דברים לא").key == "devarim:31"
+
+
+def _project() -> str:
+    return client.post("/projects", json={"name": "Pesach"}).json()["id"]
+
+
+def _document(project_id: str, title: str, text: str = "") -> str:
+    blocks = [{"kind": "text", "role": "commentary_en", "text": text}] if text else []
+    resp = client.post(
+        f"/projects/{project_id}/documents", json={"title": title, "blocks": blocks}
+    )
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def test_citations_resolve_to_documents_and_backlinks():
+    project_id = _project()
+    target = _document(project_id, "Shemot 12")
+    rashi = _document(project_id, "Rashi on Shemot 12")
+    source = _document(
+        project_id,
+        "Essay",
+        "The korban (Shemot 12:8), as Rashi on Shemot 12:8 explains.",
+    )
+
+    resp = client.get(f"/projects/{project_id}/documents/{source}/citations")
+    assert resp.status_code == 200
+    cited = resp.json()
+    assert [(c["target_key"], c["target_document_id"]) for c in cited] == [
+        ("shemot:12:8", target),
+        ("shemot:12:8", rashi),
+    ]
+
+    backlinks = client.get(f"/projects/{project_id}/documents/{target}/backlinks").json()
+    assert [c["source_document_id"] for c in backlinks] == [source]
+
+    everyone = client.get("/citations", params={"ref": "Shemot 12"}).json()
+    assert len(everyone) == 2
+    rashi_only = client.get("/citations", params={"ref": "Rashi on Shemot 12"}).json()
+    assert [c["commentator"] for c in rashi_only] == ["rashi"]
+
+
+def test_index_follows_updates():
+    project_id = _project()
+    _document(project_id, "Shemot 12")
+    source = _document(project_id, "Essay", "See Shemot 12:8.")
+
+    resp = client.put(
+        f"/projects/{project_id}/documents/{source}",
+        json={
+            "title": "Essay",
+            "blocks": [{"kind": "text", "role": "commentary_en", "text": "See Devarim 16:3."}],
+        },
+    )
+    assert resp.status_code == 200
+
+    cited = client.get(f"/projects/{project_id}/documents/{source}/citations").json()
+    assert [c["target_key"] for c in cited] == ["devarim:16:3"]
+    assert client.get("/citations", params={"ref": "Shemot 12"}).json() == []
+
+
+def test_commentator_query_accepts_any_alias():
+    project_id = _project()
+    _document(project_id, "Essay", "As Rashi on Shemot 12:8 explains.")
+
+    for name in ("rashi", "Rashi", "RASHI", 'רש"י', "רש״י"):
+        found = client.get("/citations", params={"ref": "Shemot 12", "commentator": name})
+        assert [c["commentator"] for c in found.json()] == ["rashi"], name
+    ramban = client.get("/citations", params={"ref": "Shemot 12", "commentator": "Ramban"})
+    assert ramban.json() == []
+
+    resp = client.get("/citations", params={"ref": "Shemot 12", "commentator": "Nobody"})
+    assert resp.status_code == 422
+
+
+def test_unrecognized_reference():
+    resp = client.get("/citations", params={"ref": "Not a book 3"})
+    assert resp.status_code == 422
+
+
+def test_exports_link_citations():
+    project_id = _project()
+    target = _document(project_id, "Shemot 12")
+    source = _document(project_id, "Essay", "See Shemot 12:8 & more.")
+
+    html = client.get(f"/projects/{project_id}/documents/{source}/export/html").text
+    assert f'href="/projects/{project_id}/documents/{target}/export/html"' in html
+    assert ">Shemot 12:8</a>" in html
+
+    data = client.get(f"/projects/{project_id}/export/epub").content
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    chapters = sorted(n for n in zf.namelist() if n.startswith("OEBPS/chapter-"))
+    linked = [zf.read(n).decode() for n in chapters]
+    assert any('href="chapter-' in xhtml for xhtml in linked)
+
+
+def test_documents_saved_before_the_index_are_backfilled():
+    project_id = _project()
+    target = _document(project_id, "Shemot 12")
+    source = _document(project_id, "Essay", "See Shemot 12:8.")
+    cursor = client.get("/changes").json()["cursor"]
+
+    # a database from before the citation index: no table, no title refs
+    CitationModel.__table__.drop(engine)
+    db._indexes_built.drop(engine)
+    with get_session() as session:
+        session.execute(update(DocumentModel).values(ref_key=None, ref_commentator=None))
+        session.execute(db._schema_info.delete())
+        session.commit()
+    assert init_db()
+
+    backlinks = client.get(f"/projects/{project_id}/documents/{target}/backlinks").json()
+    assert [c["source_document_id"] for c in backlinks] == [source]
+    html = client.get(f"/projects/{project_id}/documents/{source}/export/html").text
+    assert f'href="/projects/{project_id}/documents/{target}/export/html"' in html
+    assert client.get("/changes", params={"since": cursor}).json()["changes"] == []
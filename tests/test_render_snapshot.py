@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from benchmarks.render_snapshot import compare, load_baseline, measure, snapshot
+
+
+def test_render_output_matches_baseline():
+    """
+    Fails when any renderer's output changes. If the change is intended,
+    run `python -m benchmarks.render_snapshot --update` and commit the
+    new baseline.
+    """
+    baseline = load_baseline()
+    current = snapshot()
+    changed = sorted(k for k in baseline["hashes"] if current.get(k) != baseline["hashes"][k])
+    assert changed == []
+    assert current.keys() == baseline["hashes"].keys()
+
+
+def test_compare_reports_changes_and_regressions():
+    baseline = {
+        "python": "3.11",
+        "calibration_ms": 10.0,
+        "hashes": {"a/html": "x" * 64, "b/html": "y" * 64, "c/html": "w" * 64},
+        "ratios": {"a/html": 1.0, "b/html": 1.0, "c/html": 1.0},
+        "noise": {"a/html": 0.05, "b/html": 0.05, "c/html": 0.8},
+        "peak_kib": {"a/html": 100, "b/html": 100, "c/html": 100},
+    }
+    current = {
+        "python": "3.11",
+        "calibration_ms": 20.0,  # machine twice as slow: ratios still compare
+        "hashes": {"a/html": "x" * 64, "b/html": "z" * 64, "c/html": "w" * 64},
+        "ratios": {"a/html": 1.1, "b/html": 2.0, "c/html": 2.0},
+        "noise": {"a/html": 0.05, "b/html": 0.05, "c/html": 0.8},
+        "peak_kib": {"a/html": 100, "b/html": 400, "c/html": 100},
+    }
+    failures = compare(baseline, current, threshold=1.25)
+    # c/html is twice as slow, but within its noise
+    assert len(failures) == 3
+    assert failures[0].startswith("b/html: output changed")
+    assert "b/html" in failures[1] and "ms" in failures[1]
+    assert "b/html: peak" in failures[2]
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TORAH_LAYOUT_PERF"),
+    reason="timing check; set TORAH_LAYOUT_PERF=1 to run",
+)
+def test_render_performance_within_baseline():
+    failures = compare(load_baseline(), measure(), threshold=1.25)
+    assert failures == []
@@ -0,0 +1,87 @@
+from fastapi.testclient import TestClient
+
+from app.db import get_session
+from app.main import app
+from app.models import DocumentModel
+from app.responses import document_json_cache
+from app.schemas import Document
+
+client = TestClient(app)
+
+
+def _create_document() -> tuple[str, str]:
+    project_id = client.post("/projects", json={"name": "Cache Test"}).json()["id"]
+    doc_payload = {
+        "title": "Maggid",
+        "description": "Cached document",
+        "blocks": [
+            {"kind": "text", "role": "haggadah_main_hebrew", "text": "הא לחמא עניא"},
+            {"kind": "image", "role": "archaeology_fig", "src": "/a.jpg"},
+        ],
+    }
+    resp = client.post(f"/projects/{project_id}/documents", json=doc_payload)
+    assert resp.status_code == 201
+    return project_id, resp.json()["id"]
+
+
+def test_document_json_matches_schema():
+    project_id, document_id = _create_document()
+
+    resp = client.get(f"/projects/{project_id}/documents/{document_id}")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/json"
+
+    doc = Document.model_validate_json(resp.content)
+    assert str(doc.id) == document_id
+    assert doc.blocks[1].alignment == "block"
+    assert document_json_cache.get(document_id, 1) == resp.content
+
+
+def test_cached_get_skips_block_decoding(monkeypatch):
+    project_id, document_id = _create_document()
+    first = client.get(f"/projects/{project_id}/documents/{document_id}")
+
+    def fail(self):
+        raise AssertionError("blocks should not be decoded on a cache hit")
+
+    monkeypatch.setattr(DocumentModel, "get_block_dicts", fail)
+    second = client.get(f"/projects/{project_id}/documents/{document_id}")
+    assert second.content == first.content
+
+
+def test_update_bumps_version_and_refreshes_cache():
+    project_id, document_id = _create_document()
+    client.get(f"/projects/{project_id}/documents/{document_id}")
+
+    update_payload = {
+        "title": "Maggid v2",
+        "description": None,
+        "blocks": [{"kind": "text", "role": "commentary_en", "text": "New."}],
+    }
+    resp = client.put(
+        f"/projects/{project_id}/documents/{document_id}", json=update_payload
+    )
+    assert resp.status_code == 200
+    assert resp.json()["title"] == "Maggid v2"
+
+    got = client.get(f"/projects/{project_id}/documents/{document_id}").json()
+    assert got["title"] == "Maggid v2"
+    assert got["blocks"] == [
+        {"kind": "text", "role": "commentary_en", "text": "New."}
+    ]
+    assert document_json_cache.get(document_id, 1) is None
+    assert document_json_cache.get(document_id, 2) is not None
+
+
+def test_concurrent_updates_get_distinct_versions():
+    project_id, document_id = _create_document()
+    with get_session() as first, get_session() as second:
+        a = first.get(DocumentModel, document_id)
+        b = second.get(DocumentModel, document_id)
+        assert a.version == b.version == 1
+        for session, doc in ((first, a), (second, b)):
+            doc.version = DocumentModel.version + 1
+            session.add(doc)
+            session.commit()
+            session.refresh(doc)
+        assert (a.version, b.version) == (2, 3)
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+from sqlalchemy import text
+
+from app.db import engine, init_db, schema_fingerprint
+
+
+def test_init_db_skips_when_schema_is_current():
+    # conftest already initialized this database
+    assert init_db() is False
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE schema_info SET fingerprint = 'old'"))
+    assert init_db() is True
+    assert init_db() is False
+
+
+def test_fingerprint_is_stable():
+    assert schema_fingerprint() == schema_fingerprint()
+    assert len(schema_fingerprint()) == 32
+
+
+def test_export_formats_are_imported_lazily():
+    code = (
+        "import sys, app.main\n"
+        "lazy = [m for m in ('app.epub', 'app.layout', 'app.clone', 'app.textstats')"
+        " if m in sys.modules]\n"
+        "print(','.join(lazy))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert proc.stdout.strip() == ""
@@ -0,0 +1,117 @@
+from fastapi.testclient import TestClient
+
+from app.layout import render_document_to_html
+from app.main import app
+from app.schemas import Document
+from app.styles import compile_styles, minify_css
+
+client = TestClient(app)
+
+
+def _create_project() -> str:
+    resp = client.post("/projects", json={"name": "Styled Haggadah"})
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def test_compile_styles_is_minified_and_hash_named():
+    styles = compile_styles(
+        {"commentary_he": {"direction": "rtl", "font_size": "0.95rem"}}
+    )
+    assert styles.role_classes == {"commentary_he": "block-role-commentary_he"}
+    assert styles.css == (
+        ".block-role-commentary_he p,.block-role-commentary_he .block-textarea"
+        "{direction:rtl;font-size:0.95rem}"
+    )
+    assert styles.name == f"styles-{styles.hash}.css"
+    assert compile_styles(
+        {"commentary_he": {"font_size": "0.95rem", "direction": "rtl"}}
+    ).hash == styles.hash
+
+
+def test_class_for_unknown_role_is_sanitized():
+    styles = compile_styles({})
+    assert styles.class_for("weird role!") == "block-role-weird_role_"
+    assert styles.class_for("") == "block-role-default"
+
+
+def test_minify_css():
+    assert minify_css("/* x */\n.a  p {\n  color: red;\n}\n") == ".a p{color:red}"
+
+
+def test_project_uses_default_styles_until_updated():
+    project_id = _create_project()
+
+    resp = client.get(f"/projects/{project_id}/styles")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["version"] == 0
+    assert "haggadah_main_hebrew" in body["roles"]
+    assert body["stylesheet"]["role_classes"]["commentary_en"] == "block-role-commentary_en"
+
+
+def test_update_styles_recompiles_and_serves_css():
+    project_id = _create_project()
+    before = client.get(f"/projects/{project_id}/styles").json()
+
+    resp = client.put(
+        f"/projects/{project_id}/styles",
+        json={"roles": {"rashi_he": {"direction": "rtl", "font_family": "Rashi"}}},
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["version"] == 1
+    assert body["stylesheet"]["name"] != before["stylesheet"]["name"]
+    assert body["stylesheet"]["role_classes"] == {"rashi_he": "block-role-rashi_he"}
+
+    css_resp = client.get(body["stylesheet"]["href"])
+    assert css_resp.status_code == 200
+    assert css_resp.headers["content-type"].startswith("text/css")
+    assert "immutable" in css_resp.headers["cache-control"]
+    assert "font-family:Rashi" in css_resp.text
+
+    # The old hash is no longer served
+    assert client.get(before["stylesheet"]["href"]).status_code == 404
+
+    again = client.put(f"/projects/{project_id}/styles", json={"roles": {}})
+    assert again.json()["version"] == 2
+
+
+def test_update_styles_rejects_css_injection():
+    project_id = _create_project()
+    resp = client.put(
+        f"/projects/{project_id}/styles",
+        json={"roles": {"x": {"color": "red}body{display:none"}}},
+    )
+    assert resp.status_code == 422
+
+
+def test_export_uses_project_styles():
+    project_id = _create_project()
+    client.put(
+        f"/projects/{project_id}/styles",
+        json={"roles": {"rashi_he": {"font_family": "Rashi"}}},
+    )
+    doc = client.post(
+        f"/projects/{project_id}/documents",
+        json={
+            "title": "Rashi",
+            "blocks": [{"kind": "text", "role": "rashi_he", "text": "דבור המתחיל"}],
+        },
+    ).json()
+
+    html = client.get(
+        f"/projects/{project_id}/documents/{doc['id']}/export/html"
+    ).text
+    assert ".block-role-rashi_he p" in html
+    assert 'class="block block-text block-role-rashi_he"' in html
+
+
+def test_render_without_styles_uses_defaults():
+    doc = Document.new(
+        project_id="00000000-0000-0000-0000-000000000000",
+        title="Defaults",
+        blocks=[{"kind": "text", "role": "commentary_he", "text": "שלום"}],
+    )
+    html = render_document_to_html(doc)
+    assert ".block-role-commentary_he p" in html
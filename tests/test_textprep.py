@@ -0,0 +1,67 @@
+import unicodedata
+
+from app.layout import _render_bidi_text
+from app.textprep import (
+    normalize_hebrew,
+    prepare_text,
+    prepared_text_cache,
+    resolve_levels,
+)
+
+
+def _runs(text: str):
+    prepared = prepare_text(text)
+    return [(prepared.slice(r), r.level) for r in prepared.runs]
+
+
+def test_normalize_orders_shin_dot_dagesh_vowel_then_taam():
+    # shin + qamats + etnahta + dagesh + shin dot, in arbitrary input order
+    shin = "\u05e9\u05b8\u0591\u05bc\u05c1"
+    normalized = normalize_hebrew(shin)
+    assert normalized == "\u05e9\u05c1\u05bc\u05b8\u0591"
+    # still canonically equivalent to the input
+    nfd = unicodedata.normalize
+    assert nfd("NFD", normalized) == nfd("NFD", shin)
+
+
+def test_hebrew_quote_inside_english_commentary():
+    assert _runs('see רש"י on Shemot 12:8.') == [
+        ("see ", 0),
+        ('רש"י', 1),
+        (" on Shemot 12:8.", 0),
+    ]
+
+
+def test_english_and_numbers_inside_hebrew_paragraph():
+    prepared = prepare_text("אמר רבי עקיבא (Akiva) בשנת 70")
+    assert prepared.is_rtl
+    assert _runs("אמר רבי עקיבא (Akiva) בשנת 70") == [
+        ("אמר רבי עקיבא (", 1),
+        ("Akiva", 2),
+        (") בשנת ", 1),
+        ("70", 2),
+    ]
+
+
+def test_neutral_only_text_is_ltr():
+    assert resolve_levels("... 123") == [0, 0, 0, 0, 0, 0, 0]
+
+
+def test_segments_break_after_spaces_and_maqaf():
+    prepared = prepare_text("כל־העם אמרו")
+    pieces = [(prepared.slice(s), s.can_break) for s in prepared.segments]
+    assert pieces == [("כל־", True), ("העם ", True), ("אמרו", False)]
+
+
+def test_prepare_text_is_memoized():
+    prepared_text_cache.reset()
+    first = prepare_text("הא לחמא עניא")
+    second = prepare_text("הא לחמא עניא")
+    assert first is second
+    assert prepared_text_cache.hits == 1
+    assert prepared_text_cache.misses == 1
+
+
+def test_render_isolates_opposite_direction_runs():
+    html = _render_bidi_text(prepare_text('see רש"י <b>'))
+    assert html == 'see <span dir="rtl">רש&quot;י</span> &lt;b&gt;'
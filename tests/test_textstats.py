@@ -0,0 +1,119 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from app import db, textstats
+from app.db import get_session
+from app.main import app
+from app.models import BlockContentModel
+
+client = TestClient(app)
+
+BLOCKS = [
+    {"kind": "text", "role": "haggadah_main_hebrew", "text": "הָא לַחְמָא עַנְיָא"},
+    {"kind": "text", "role": "commentary_en", "text": "The bread of affliction " * 20},
+    {"kind": "image", "role": "archaeology_fig", "src": "/assets/seder.png"},
+    {"kind": "text", "role": "commentary_en", "text": ""},
+]
+
+
+def _project(documents: int = 2) -> str:
+    project_id = client.post("/projects", json={"name": "Stats"}).json()["id"]
+    for i in range(documents):
+        client.post(
+            f"/projects/{project_id}/documents",
+            json={"title": f"Maggid {i}", "blocks": BLOCKS},
+        )
+    return project_id
+
+
+def _stats(project_id: str, **params) -> dict:
+    response = client.get(f"/projects/{project_id}/statistics", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.parametrize("storage", ["shared", "packed", "json"])
+def test_counts_per_role(storage, monkeypatch):
+    monkeypatch.setattr(db, "BLOCK_STORAGE", storage)
+    project_id = _project()
+
+    stats = _stats(project_id)
+    assert (stats["documents"], stats["blocks"]) == (2, 8)
+    hebrew = stats["roles"]["haggadah_main_hebrew"]
+    # points and spaces take no glyph of their own
+    assert (hebrew["blocks"], hebrew["glyphs"], hebrew["words"], hebrew["lines"]) == (2, 20, 6, 2)
+
+    commentary = stats["roles"]["commentary_en"]
+    assert (commentary["blocks"], commentary["glyphs"], commentary["words"]) == (4, 800, 160)
+    assert commentary["lines"] == 2 * 5  # 400 glyphs + 79 spaces at 0.95rem in 47rem
+    assert stats["roles"]["archaeology_fig"]["images"] == 2
+    assert stats["lines"] == 12
+    assert [d["pages"] for d in stats["per_document"]] == [1, 1]
+
+    narrow = _stats(project_id, measure_rem=10, page_height_rem=10)
+    assert narrow["roles"]["commentary_en"]["lines"] > commentary["lines"]
+    assert narrow["pages"] > stats["pages"]
+
+
+def test_cached_per_project_version():
+    project_id = _project()
+    with get_session() as session:
+        first = textstats.project_statistics(session, project_id)
+        assert textstats.project_statistics(session, project_id) is first
+
+    doc_id = client.get(f"/projects/{project_id}/documents").json()[0]["id"]
+    client.put(
+        f"/projects/{project_id}/documents/{doc_id}",
+        json={"title": "Maggid 0", "blocks": BLOCKS[:1]},
+    )
+    edited = _stats(project_id)
+    assert edited["version"] != first["version"]
+    assert edited["blocks"] == 5
+
+    client.put(
+        f"/projects/{project_id}/styles",
+        json={"roles": {"commentary_en": {"font_size": "2rem", "line_height": "1.2"}}},
+    )
+    restyled = _stats(project_id)
+    assert restyled["version"] != edited["version"]
+    assert restyled["roles"]["commentary_en"]["lines"] > edited["roles"]["commentary_en"]["lines"]
+
+
+def test_empty_and_missing_project():
+    project_id = client.post("/projects", json={"name": "Empty"}).json()["id"]
+    stats = _stats(project_id)
+    assert (stats["documents"], stats["pages"], stats["roles"]) == (0, 0, {})
+    assert client.get("/projects/missing/statistics").status_code == 404
+
+
+def test_role_metrics_parses_lengths():
+    metrics = textstats.role_metrics({"font_size": "12px", "line_height": "24px"})
+    assert (metrics.font_rem, metrics.line_height) == (0.75, 2.0)
+    metrics = textstats.role_metrics({"font_size": "larger", "direction": "rtl"})
+    assert metrics.font_rem == textstats.DEFAULT_FONT_REM
+    assert metrics.advance_em == textstats.GLYPH_ADVANCE_EM["rtl"]
+
+
+def test_numpy_and_python_estimates_agree():
+    pytest.importorskip("numpy")
+    project_id = _project(documents=3)
+    with get_session() as session:
+        columns = textstats.gather(session, project_id)
+    metrics = [textstats.role_metrics({"font_size": "0.9rem"}) for _ in columns.roles]
+    vectorized = textstats._estimate_numpy(columns, metrics, 20.0)
+    looped = textstats._estimate_python(columns, metrics, 20.0)
+    for vector, loop in zip(vectorized, looped):
+        assert list(map(float, vector)) == pytest.approx(list(map(float, loop)))
+
+
+def test_missing_blocks_fail_clearly():
+    project_id = _project(documents=1)
+    with get_session() as session:
+        session.execute(delete(BlockContentModel))
+        session.commit()
+    textstats.reset_cache()
+
+    with get_session() as session:
+        with pytest.raises(LookupError, match="missing from block_contents"):
+            textstats.gather(session, project_id)
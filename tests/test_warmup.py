@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+
+from app import styles
+from app.main import app
+from app.responses import document_json_cache
+from app.server import default_workers
+from app.textprep import prepared_text_cache
+from app.warmup import warm_caches
+
+client = TestClient(app)
+
+
+def test_warm_caches_fills_document_style_and_text_caches():
+    project_id = client.post("/projects", json={"name": "Warm"}).json()["id"]
+    client.put(
+        f"/projects/{project_id}/styles",
+        json={"roles": {"rashi_he": {"font_family": "Rashi"}}},
+    )
+    doc = client.post(
+        f"/projects/{project_id}/documents",
+        json={
+            "title": "Hot",
+            "blocks": [{"kind": "text", "role": "rashi_he", "text": "חם מאוד"}],
+        },
+    ).json()
+
+    document_json_cache.reset()
+    styles.reset_cache()
+    prepared_text_cache.reset()
+
+    timings = warm_caches(hot_documents=10)
+
+    assert set(timings) == {"init_db", "styles", "documents"}
+    assert document_json_cache.get(doc["id"], 1) is not None
+    assert project_id in styles._compiled
+    assert prepared_text_cache.misses == 1
+
+
+def test_default_workers_respects_web_concurrency(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert default_workers() == 3
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    assert default_workers() >= 1